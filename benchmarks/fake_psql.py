@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Stands in for psql: reads statements from stdin and answers each one with a
+# psql-style table. Behaviour is tuned through the environment:
+#   FAKE_PSQL_STARTUP       seconds before the first statement (process start and connect)
+#   FAKE_PSQL_LATENCY       seconds per statement
+#   FAKE_PSQL_ROWS          rows per result
+#   FAKE_PSQL_ROW_WIDTH     characters per row
+#   FAKE_PSQL_FAILURE_RATE  fraction of statements answered with an error
+#   FAKE_PSQL_SEED          seed for the failures, which depend on the statement text only
+
+from os import environ
+from random import Random
+from time import sleep
+import sys
+
+def main():
+    startup = float(environ.get('FAKE_PSQL_STARTUP', 0))
+    latency = float(environ.get('FAKE_PSQL_LATENCY', 0))
+    rows = int(environ.get('FAKE_PSQL_ROWS', 1))
+    width = max(1, int(environ.get('FAKE_PSQL_ROW_WIDTH', 40)))
+    failure_rate = float(environ.get('FAKE_PSQL_FAILURE_RATE', 0))
+    seed = environ.get('FAKE_PSQL_SEED', '0')
+
+    value = ('x' * width)[:width]
+    header = ' id | ' + 'value'.ljust(width) + '\n----+-' + '-' * width + '\n'
+    body = ''.join(' ' + str(row).rjust(2) + ' | ' + value + '\n' for row in range(1, rows + 1))
+    result = header + body + ('(1 row)' if rows == 1 else '(' + str(rows) + ' rows)') + '\n\n'
+
+    sleep(startup)
+    out = sys.stdout
+    statement = []
+    for line in sys.stdin:
+        stripped = line.strip()
+        if stripped.startswith('\\echo'):
+            out.write(stripped[6:] + '\n')
+            out.flush()
+            continue
+        if stripped.startswith('\\q'):
+            break
+        if stripped.startswith('\\'):
+            continue
+        statement.append(stripped)
+        if not stripped.endswith(';'):
+            continue
+        text = ' '.join(statement).strip().rstrip(';').strip()
+        statement = []
+        if not text:
+            continue
+        if text.upper() == 'DISCARD ALL':
+            out.write('DISCARD ALL\n')
+            out.flush()
+            continue
+        sleep(latency)
+        if failure_rate and Random(seed + text).random() < failure_rate:
+            out.write('ERROR:  simulated failure\nLINE 1: ' + text[:60] + '\n')
+        else:
+            out.write(result)
+        out.flush()
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
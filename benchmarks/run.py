@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Runs PsqlCommand end to end against benchmarks/fake_psql.py with the Sublime Text
+# API stubbed out, measures how long the plugin takes to load, and prints the results as JSON.
+#
+#   python3 benchmarks/run.py --repeat 5 --output results.json
+#   python3 benchmarks/run.py --scenario small_selections --latency 0.01 --no-pool
+
+from argparse import ArgumentParser
+from os import environ, makedirs
+from os.path import abspath, basename, dirname, join, splitext
+from glob import glob
+from shutil import rmtree
+from subprocess import check_output, CalledProcessError
+from tempfile import mkdtemp
+from time import time
+import importlib
+import json
+import platform
+import sys
+import types
+
+here = dirname(abspath(__file__))
+root = dirname(here)
+sys.path.insert(0, join(here, 'stubs'))
+import sublime
+
+def load_plugin():
+    package = types.ModuleType('psql_tools')
+    package.__path__ = [root]
+    sys.modules['psql_tools'] = package
+    # Like Sublime Text, import every top-level module; they only define command stubs.
+    start = time()
+    for name in sorted(glob(join(root, 'psql*.py'))):
+        importlib.import_module('psql_tools.' + splitext(basename(name))[0])
+    return time() - start
+
+def measure_load():
+    startup = load_plugin()
+    lazy = importlib.import_module('psql_tools.psql_lib.lazy')
+    start = time()
+    lazy.load('commands.psql')
+    print(json.dumps({'startup': startup, 'first_use': time() - start}))
+
+def plugin_load(args):
+    # Imported modules stay loaded, so every measurement runs in a new interpreter.
+    runs = []
+    for repetition in range(args.repeat):
+        runs.append(json.loads(check_output([sys.executable, abspath(__file__), '--measure-load']).decode('ascii')))
+    results = {}
+    for name in ('startup', 'first_use'):
+        values = sorted(run[name] for run in runs)
+        results[name] = {'min': values[0], 'median': values[len(values) // 2], 'max': values[-1]}
+    return results
+
+if __name__ == '__main__' and sys.argv[1:] == ['--measure-load']:
+    measure_load()
+    sys.exit(0)
+
+load_plugin()
+psql = importlib.import_module('psql_tools.psql')
+plugin = importlib.import_module('psql_tools.psql_lib.lazy').load('plugin')
+from psql_tools.psql_lib.metrics import PsqlExecutionLog
+from psql_tools.psql_lib.pool import session_pool
+
+class CountingLog(PsqlExecutionLog):
+    def __init__(self, path):
+        PsqlExecutionLog.__init__(self, path, max_size=0)
+        self.appended = 0
+    def append(self, record):
+        PsqlExecutionLog.append(self, record)
+        self.appended += 1
+
+def statements(count, offset=0):
+    return ['select ' + str(offset + number) + ';\n' for number in range(count)]
+
+def large_selection(args, workdir):
+    text = ''.join(statements(args.statements))
+    return text, [sublime.Region(0, len(text))], {}, 1
+
+def small_selections(args, workdir):
+    parts = statements(args.selections)
+    text = ''.join(parts)
+    regions, position = [], 0
+    for part in parts:
+        regions.append(sublime.Region(position, position + len(part) - 1))
+        position += len(part)
+    return text, regions, {}, len(regions)
+
+def files(args, workdir):
+    paths = []
+    for number in range(args.files):
+        path = join(workdir, 'query' + str(number) + '.sql')
+        with open(path, 'w') as queryfile:
+            queryfile.write('select ' + str(number) + ';\n')
+        paths.append(path)
+    return '', [], {'files': paths}, len(paths)
+
+def large_result(args, workdir):
+    text = 'select * from large;\n'
+    return text, [], {}, 1
+
+scenarios = {
+    'large_selection': large_selection,
+    'small_selections': small_selections,
+    'files': files,
+    'large_result': large_result
+}
+
+def run_scenario(name, args, workdir):
+    text, regions, extra, queries = scenarios[name](args, workdir)
+    environ['FAKE_PSQL_ROWS'] = str(args.result_rows if name == 'large_result' else args.rows)
+    log = plugin.execution_log = CountingLog(join(workdir, name + '.jsonl'))
+    # Settings passed to the command stick to its window, so every scenario gets a new one.
+    window = sublime.Window()
+    settings = dict(psql_path=join(here, 'fake_psql.py'), prompt_for_password='', warn_on_empty_password='',
+        session_pool=str(not args.no_pool), execution_order=args.execution_order, output_display_limit=str(args.display_limit),
+        max_concurrent_queries=str(args.workers), max_connections_per_profile=str(args.workers), execution_log='True')
+    settings.update(extra)
+
+    walls, characters = [], 0
+    for repetition in range(args.warmup + args.repeat):
+        view = sublime.View(window, text)
+        view.selections = list(regions)
+        expected = log.appended + queries
+        start = time()
+        psql.PsqlCommand(view).run(None, **settings)
+        if not sublime.run_until(lambda: log.appended >= expected, args.timeout):
+            raise RuntimeError(name + ' did not finish within ' + str(args.timeout) + ' seconds.')
+        if repetition >= args.warmup:
+            walls.append(time() - start)
+            characters = window.panels['psql'].size()
+        else:
+            # Warm-up records are not part of the phase statistics.
+            log.flush()
+            log.appended = 0
+            expected = 0
+            open(log.path, 'w').close()
+
+    walls.sort()
+    summary = log.statistics()
+    phases = {}
+    for profile in summary.values():
+        for phase, percentiles in profile.items():
+            if phase != 'count':
+                phases[phase] = dict((str(percentile), value) for percentile, value in percentiles.items())
+    return {
+        'queries': queries,
+        'wall': {'min': walls[0], 'median': walls[len(walls) // 2], 'max': walls[-1], 'runs': walls},
+        'queries_per_second': queries / walls[len(walls) // 2] if walls[len(walls) // 2] else None,
+        'panel_characters': characters,
+        'phases': phases
+    }
+
+def revision():
+    try:
+        return check_output(['git', 'rev-parse', 'HEAD'], cwd=root).decode('ascii').strip()
+    except (OSError, CalledProcessError):
+        return None
+
+def main():
+    parser = ArgumentParser(description='Benchmark PsqlCommand end to end against a fake psql.')
+    parser.add_argument('--scenario', action='append', choices=sorted(scenarios), help='scenario to run (repeatable, default all)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--statements', type=int, default=2000, help='statements in the large selection')
+    parser.add_argument('--selections', type=int, default=100)
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=1, help='rows per result')
+    parser.add_argument('--result-rows', type=int, default=100000, help='rows of the large result')
+    parser.add_argument('--row-width', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per statement')
+    parser.add_argument('--startup', type=float, default=0.0, help='seconds before psql reads input')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--execution-order', default='parallel')
+    parser.add_argument('--display-limit', type=int, default=0)
+    parser.add_argument('--no-pool', action='store_true')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    environ['FAKE_PSQL_LATENCY'] = str(args.latency)
+    environ['FAKE_PSQL_STARTUP'] = str(args.startup)
+    environ['FAKE_PSQL_ROW_WIDTH'] = str(args.row_width)
+    environ['FAKE_PSQL_FAILURE_RATE'] = str(args.failure_rate)
+    environ['FAKE_PSQL_SEED'] = '0'
+
+    workdir = mkdtemp(prefix='psql-benchmarks-')
+    sublime.cache_directory = join(workdir, 'cache')
+    makedirs(sublime.cache_directory)
+    try:
+        results = {
+            'time': time(),
+            'revision': revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': dict((name, value) for name, value in vars(args).items() if name not in ('output', 'scenario')),
+            'plugin_load': plugin_load(args),
+            'scenarios': {}
+        }
+        for name in args.scenario or sorted(scenarios):
+            results['scenarios'][name] = run_scenario(name, args, workdir)
+            session_pool.close_all()
+    finally:
+        session_pool.close_all()
+        rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as outputfile:
+            outputfile.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
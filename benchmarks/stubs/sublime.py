@@ -0,0 +1,198 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Just enough of the Sublime Text API to run the plugin headless. Callbacks passed to
+# set_timeout run on the thread calling run_until, like the UI thread in the editor.
+
+from heapq import heappush, heappop
+from itertools import count
+from threading import Lock, Thread
+from time import time, sleep
+from os.path import join
+from tempfile import gettempdir
+
+__timeouts = []
+__sequence = count()
+__lock = Lock()
+statuses = []
+cache_directory = join(gettempdir(), 'psql-benchmarks-cache')
+
+def set_timeout(callback, delay=0):
+    with __lock:
+        heappush(__timeouts, (time() + delay / 1000.0, next(__sequence), callback))
+
+def set_timeout_async(callback, delay=0):
+    worker = Thread(target=callback)
+    worker.daemon = True
+    worker.start()
+
+def run_until(predicate, timeout=600):
+    deadline = time() + timeout
+    while time() < deadline:
+        with __lock:
+            due = __timeouts[0][0] if __timeouts else None
+            callback = heappop(__timeouts)[2] if due is not None and due <= time() else None
+        if callback is not None:
+            callback()
+        elif predicate():
+            return True
+        else:
+            sleep(min(0.001, max(0, due - time())) if due is not None else 0.001)
+    return False
+
+def status_message(message):
+    statuses.append(message)
+
+def ok_cancel_dialog(message, ok_title=''):
+    return True
+
+def error_message(message):
+    statuses.append(message)
+
+def message_dialog(message):
+    statuses.append(message)
+
+def cache_path():
+    return cache_directory
+
+def packages_path():
+    return cache_directory
+
+class Settings(dict):
+    def get(self, name, default=None):
+        return dict.get(self, name, default)
+    def set(self, name, value):
+        self[name] = value
+    def erase(self, name):
+        self.pop(name, None)
+    def has(self, name):
+        return name in self
+    def add_on_change(self, tag, callback):
+        pass
+    def clear_on_change(self, tag):
+        pass
+
+__settings = {}
+
+def load_settings(name):
+    return __settings.setdefault(name, Settings())
+
+def save_settings(name):
+    pass
+
+class Region(object):
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+    def begin(self):
+        return min(self.a, self.b)
+    def end(self):
+        return max(self.a, self.b)
+    def empty(self):
+        return self.a == self.b
+    def size(self):
+        return self.end() - self.begin()
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+class View(object):
+    __ids = count(1)
+
+    def __init__(self, window, text=''):
+        self.__id = next(self.__ids)
+        self.__window = window
+        self.__text = [text]
+        self.__size = len(text)
+        self.selections = []
+        self.name = ''
+    def id(self):
+        return self.__id
+    def buffer_id(self):
+        return self.__id
+    def window(self):
+        return self.__window
+    def sel(self):
+        return self.selections
+    def text(self):
+        if len(self.__text) > 1:
+            self.__text = [''.join(self.__text)]
+        return self.__text[0]
+    def substr(self, region):
+        return self.text()[region.begin():region.end()]
+    def size(self):
+        return self.__size
+    def encoding(self):
+        return 'UTF-8'
+    def set_encoding(self, encoding):
+        pass
+    def set_scratch(self, scratch):
+        pass
+    def set_name(self, name):
+        self.name = name
+    def settings(self):
+        return Settings()
+    def file_name(self):
+        return None
+    def run_command(self, command, args=None):
+        if command == 'append':
+            self.__text.append(args['characters'])
+            self.__size += len(args['characters'])
+        elif command == 'erase_view':
+            self.__text = ['']
+            self.__size = 0
+
+class Window(object):
+    __ids = count(1)
+
+    def __init__(self):
+        self.__id = next(self.__ids)
+        self.panels = {}
+        self.views = []
+    def id(self):
+        return self.__id
+    def create_output_panel(self, name):
+        self.panels[name] = View(self)
+        return self.panels[name]
+    def new_file(self):
+        view = View(self)
+        self.views.append(view)
+        return view
+    def focus_view(self, view):
+        pass
+    def run_command(self, command, args=None):
+        pass
+    def show_input_panel(self, *args):
+        pass
+    def show_quick_panel(self, *args, **kwargs):
+        pass
+    def active_view(self):
+        return self.views[0] if self.views else None
+
+__window = Window()
+
+def active_window():
+    return __window
+
+def windows():
+    return [__window]
@@ -20,11 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .psql import PsqlBaseWindowCommand, set_status
+from .psql_lib.lazy import PsqlLazyWindowCommand
 
-class PsqlConfigCommand(PsqlBaseWindowCommand):
+class PsqlConfigCommand(PsqlLazyWindowCommand):
     def description(self):
         return 'Configures the current window\'s settings based on the inputs.'
-    def run(self, edit, *args, **kwargs):
-        self.settings = dict(*args, **kwargs)
-        set_status('PostgreSQL configuration updated.')
\ No newline at end of file
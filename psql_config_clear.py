@@ -20,13 +20,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .psql import PsqlBaseWindowCommand, set_status
+from .psql_lib.lazy import PsqlLazyWindowCommand
 
-class PsqlConfigClearCommand(PsqlBaseWindowCommand):
+class PsqlConfigClearCommand(PsqlLazyWindowCommand):
+    enabled_before_load = False
     def description(self):
         return 'Clears the current user-specified values.'
-    def is_enabled(self):
-        return self.settings.has_user_specified()
-    def run(self, edit, *args, **kwargs):
-        self.settings.clear()
-        set_status('PostgreSQL configuration cleared to defaults.')
\ No newline at end of file
@@ -20,13 +20,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .psql import PsqlBaseWindowCommand, set_status
+from .psql_lib.lazy import PsqlLazyWindowCommand
 
-class PsqlConfigSaveCommand(PsqlBaseWindowCommand):
+class PsqlConfigSaveCommand(PsqlLazyWindowCommand):
+    enabled_before_load = False
     def description(self):
         return 'Saves the current user-specified values to the defaults.'
-    def is_enabled(self):
-        return self.settings.has_user_specified()
-    def run(self, edit, *args, **kwargs):
-        self.settings.save()
-        set_status('PostgreSQL configuration saved to defaults.')
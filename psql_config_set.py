@@ -20,32 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .psql import PsqlBaseWindowCommand, set_status
+from .psql_lib.lazy import PsqlLazyWindowCommand
 
-class PsqlConfigSetCommand(PsqlBaseWindowCommand):  
+class PsqlConfigSetCommand(PsqlLazyWindowCommand):
     def description(self):
         return 'Uses {"name": name, "value": value} to set the user-specified settings used for PostgreSQL commands. It prompts if either argument is missing.'
-    
-    def run(self, edit, *args, **kwargs): 
-        self.__edit = edit
-        self.kwargs = kwargs
-
-        if 'name' not in self.kwargs:
-            self.window.show_input_panel('Enter PostgreSQL configuration variable name:', '', self.__set_name, None, self.__cancelled)
-        else:
-            self.__set_name(self.kwargs['name'])
-
-    def __cancelled(self):
-        set_status('PostgreSQL configuration variable setting cancelled.')
-
-    def __set_user_specified(self, value):
-        self.settings.set_user_specified(self.config_name, value)
-        set_status('PostgreSQL configuration variable \'' + self.config_name + '\' set.')
-
-    def __set_name(self, name):
-        self.config_name = name
-
-        if 'value' not in self.kwargs:
-            self.window.show_input_panel('Enter ' + self.config_name + ':', '', self.__set_user_specified, None, self.__cancelled)
-        else:
-            self.__set_user_specified(self.kwargs['value'])
\ No newline at end of file
@@ -20,22 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .psql import PsqlBaseWindowCommand, set_status
+from .psql_lib.lazy import PsqlLazyWindowCommand
 
-class PsqlConfigUnsetCommand(PsqlBaseWindowCommand):  
+class PsqlConfigUnsetCommand(PsqlLazyWindowCommand):
     def description(self):
         return 'Uses {"name": name} to unset the user-specified settings used for PostgreSQL commands. It prompts if the argument is missing.'
-    
-    def run(self, edit, *args, **kwargs): 
-        if 'name' not in kwargs:
-            self.window.show_input_panel('Enter PostgreSQL configuration variable name:', '', self.__set_name, None, self.__cancelled)
-        else:
-            self.__set_name(kwargs['name'])
-
-    def __cancelled(self):
-        set_status('PostgreSQL configuration variable unsetting cancelled.')
-
-    def __set_name(self, name):
-        self.config_name = name
-        self.settings.unset_user_specified(self.config_name)
-        set_status('PostgreSQL configuration variable \'' + self.config_name + '\' unset.')
\ No newline at end of file
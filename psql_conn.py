@@ -20,15 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from sublime import active_window
-from .psql import PsqlSettings, PsqlBaseTextCommand, set_status
+from .psql_lib.lazy import PsqlLazyTextCommand
 
-class PsqlConnCommand(PsqlBaseTextCommand):
+class PsqlConnCommand(PsqlLazyTextCommand):
     def description(self):
         return 'Creates a new session from current window\'s settings or with the supplied connection values'
-    def run(self, edit, *args, **kwargs):
-        self.window.run_command('create_window')
-        new_settings = PsqlSettings(window=active_window())
-        new_settings.update(self.settings)
-        new_settings.update(dict(*args, **kwargs))
-        set_status('New PostgreSQL connection session launched from current settings.')
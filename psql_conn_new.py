@@ -20,13 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from sublime import active_window
-from .psql import PsqlBaseTextCommand, set_status
+from .psql_lib.lazy import PsqlLazyTextCommand
 
-class PsqlConnNewCommand(PsqlBaseTextCommand):
+class PsqlConnNewCommand(PsqlLazyTextCommand):
     def description(self):
         return 'Creates a new session with the defaults or the supplied connection values'
-    def run(self, edit, *args, **kwargs):
-        self.window.run_command('create_window')
-        active_window().run_command('psql_config', *args, **kwargs)
-        set_status('New PostgreSQL connection session launched.')
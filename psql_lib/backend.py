@@ -0,0 +1,432 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from abc import ABCMeta, abstractmethod
+from re import compile as re_compile, M
+from .pool import PsqlSession, PsqlSessionPool, session_pool, execute_once, is_pool_supported
+from .pgwire import PgConnection, PgError, PgConnectionError
+from .statements import is_poolable, split_statements, iter_statements
+from .grid import PsqlUnalignedParser, PsqlTableCollector, marked_statements, NULL
+from .batch import PsqlMarkerFilter
+from codecs import getincrementaldecoder
+from time import time
+
+connection_pool = PsqlSessionPool()
+
+def is_input_poolable(query=None, file=None, encoding='UTF-8'):
+    if file is None:
+        return is_poolable([query or ''])
+    with open(file, encoding=encoding, errors='replace') as inputfile:
+        return is_poolable(iter(lambda: inputfile.read(65536), ''))
+
+class PsqlBackend(metaclass=ABCMeta):
+    def __init__(self, use_pool=True):
+        self.use_pool = use_pool
+
+    @abstractmethod
+    def execute(self, profile, stream, query=None, file=None, encoding='UTF-8', cancellation=None, source=None):
+        pass
+
+    @abstractmethod
+    def fetch(self, profile, stream, on_table, query=None, file=None, encoding='UTF-8', cancellation=None):
+        pass
+
+    @abstractmethod
+    def copy_out(self, profile, stream, sql, sink, encoding='UTF-8', cancellation=None):
+        pass
+
+    @abstractmethod
+    def copy_in(self, profile, stream, sql, data, encoding='UTF-8', cancellation=None):
+        pass
+
+    @abstractmethod
+    def execute_files(self, profile, stream, batch, encoding='UTF-8', cancellation=None):
+        pass
+
+class PsqlProcessBackend(PsqlBackend):
+    # Unaligned output with control characters as separators, so values can hold tabs, pipes and newlines.
+    __fetch_options = ['-X', '-q', '-A', '-F', '\x1f', '-R', '\x1e', '-P', 'footer=off', '-P', 'null=' + NULL, '-v', 'ON_ERROR_STOP=1']
+
+    def execute(self, profile, stream, query=None, file=None, encoding='UTF-8', cancellation=None, source=None):
+        # Streamed input goes through a psql of its own, a session would have to scan it all for its end.
+        if source is not None:
+            return execute_once(profile.argv, profile.env, stream.write, query=source.blocks(encoding), cancellation=cancellation, metrics=stream.metrics)
+
+        # A session would wait forever for the end of an unterminated string, comment, \if or COPY
+        # input, and must not be left in another database, a transaction or with psql settings changed.
+        pooled = self.use_pool and is_pool_supported() and is_input_poolable(query, file, encoding)
+        query = bytes(query, encoding) if query is not None else None
+        if not pooled:
+            return execute_once(profile.argv, profile.env, stream.write, query=query, file=file, cancellation=cancellation, metrics=stream.metrics)
+
+        session = session_pool.acquire(profile.key, lambda: self.__spawn(profile, stream.metrics))
+        stream.metrics.input_sent()
+        try:
+            return session.execute(stream.write, query=query, file=file, cancellation=cancellation, metrics=stream.metrics)
+        except BaseException:
+            session.broken = True
+            raise
+        finally:
+            session_pool.release(profile.key, session)
+
+    def fetch(self, profile, stream, on_table, query=None, file=None, encoding='UTF-8', cancellation=None):
+        # Every statement is preceded by a marker so that results can be told apart.
+        if file is not None:
+            with open(file, encoding=encoding) as inputfile:
+                query = inputfile.read()
+        query = bytes(marked_statements(split_statements(query or '')), encoding)
+        parser = PsqlUnalignedParser(on_table)
+        decoder = getincrementaldecoder(encoding)(errors='replace')
+        errors = []
+
+        def receive(data):
+            stream.metrics.received(len(data))
+            start = time()
+            text = decoder.decode(data)
+            stream.metrics.decode += time() - start
+            parser.feed(text)
+
+        retcode = execute_once(list(profile.argv) + self.__fetch_options, profile.env, receive, query=query,
+            cancellation=cancellation, metrics=stream.metrics, errors=errors.append)
+        parser.feed(decoder.decode(b'', True))
+        parser.close()
+        stream.write(b''.join(errors))
+        return retcode
+
+    def copy_out(self, profile, stream, sql, sink, encoding='UTF-8', cancellation=None):
+        # With -q, COPY ... TO STDOUT writes nothing but the data to stdout.
+        return execute_once(list(profile.argv) + ['-X', '-q', '-v', 'ON_ERROR_STOP=1', '-c', sql], profile.env, sink,
+            cancellation=cancellation, metrics=stream.metrics, errors=stream.write)
+
+    def copy_in(self, profile, stream, sql, data, encoding='UTF-8', cancellation=None):
+        # data is an iterable of bytes that psql passes on as the COPY input; the COPY n tag goes to the stream.
+        return execute_once(list(profile.argv) + ['-X', '-v', 'ON_ERROR_STOP=1', '-c', sql], profile.env, stream.write,
+            query=data, cancellation=cancellation, metrics=stream.metrics)
+
+    def execute_files(self, profile, stream, batch, encoding='UTF-8', cancellation=None):
+        # The files are included with \i from a generated script. On a pipe psql would hold back
+        # its output while errors went straight through, ahead of the marker of their file.
+        output = PsqlMarkerFilter(stream, batch)
+        try:
+            retcode = execute_once(profile.argv, profile.env, output.write, query=bytes(batch.script(), encoding),
+                cancellation=cancellation, metrics=stream.metrics, terminal=True)
+        finally:
+            output.close()
+        # A failed file stops the batch and rolls back its transaction, whatever psql exits with.
+        if retcode == 0 and batch.on_error_stop and batch.failed:
+            retcode = 3
+        return retcode
+
+    @staticmethod
+    def __spawn(profile, metrics):
+        start = time()
+        session = PsqlSession(list(profile.argv), profile.env)
+        metrics.spawn = time() - start
+        return session
+
+class PsqlNativeBackend(PsqlBackend):
+    __meta_command = re_compile(r'^\s*\\', M)
+
+    # Statements of streamed input are sent in groups of about this many characters.
+    stream_group_size = 1048576
+
+    def execute(self, profile, stream, query=None, file=None, encoding='UTF-8', cancellation=None, source=None):
+        if source is not None:
+            return self.__stream(profile, stream, source, encoding, cancellation)
+        return self.__query(profile, stream, PsqlTextFormatter(stream.write_text), query, file, encoding, cancellation)
+
+    def fetch(self, profile, stream, on_table, query=None, file=None, encoding='UTF-8', cancellation=None):
+        collector = PsqlTableCollector(on_table, stream.write_text, PsqlTextFormatter.format_value)
+        return self.__query(profile, stream, collector, query, file, encoding, cancellation)
+
+    def copy_out(self, profile, stream, sql, sink, encoding='UTF-8', cancellation=None):
+        return self.__copy(profile, stream, sql, PsqlCopyHandler(stream.write_text, sink=sink), encoding, cancellation)
+
+    def copy_in(self, profile, stream, sql, data, encoding='UTF-8', cancellation=None):
+        return self.__copy(profile, stream, sql, PsqlCopyHandler(stream.write_text, data=data), encoding, cancellation)
+
+    def __copy(self, profile, stream, sql, handler, encoding, cancellation):
+        retcode = self.__query(profile, stream, handler, sql, None, encoding, cancellation)
+        # Like psql with ON_ERROR_STOP, a failed COPY is an error.
+        return retcode if handler.command_tag is not None else retcode or 3
+
+    def execute_files(self, profile, stream, batch, encoding='UTF-8', cancellation=None):
+        def run(connection):
+            formatter = PsqlTextFormatter(stream.write_text)
+            stopped = False
+            if batch.transaction:
+                connection.simple_query('BEGIN')
+            for index, path in enumerate(batch.files):
+                batch.started(index)
+                with open(path, encoding=encoding) as inputfile:
+                    query = inputfile.read()
+                failed = False
+                if self.__meta_command.search(query):
+                    stream.write_text(path + ': psql meta-commands (\\...) are not supported by the native backend.\n')
+                    failed = True
+                else:
+                    if batch.savepoints:
+                        connection.simple_query('SAVEPOINT ' + batch.savepoint(index))
+                    try:
+                        connection.simple_query(query, formatter)
+                    except PgError as e:
+                        stream.write_text(path + ': ' + e.format())
+                        failed = True
+                    if batch.savepoints:
+                        connection.simple_query(('ROLLBACK TO SAVEPOINT ' if failed else 'RELEASE SAVEPOINT ') + batch.savepoint(index))
+                batch.finished(index, failed, failed and batch.savepoints)
+                if failed and batch.on_error_stop:
+                    stopped = True
+                    break
+            if batch.transaction:
+                connection.simple_query('ROLLBACK' if stopped else 'COMMIT', formatter)
+            return 3 if stopped else 0
+
+        return self.__run(profile, stream, cancellation, run)
+
+    def __stream(self, profile, stream, source, encoding, cancellation):
+        # Like psql without ON_ERROR_STOP, a failed group of statements does not end the run.
+        def run(connection):
+            formatter = PsqlTextFormatter(stream.write_text)
+            group = []
+            size = 0
+            for statement in iter_statements(source.texts(encoding)):
+                if self.__meta_command.search(statement):
+                    stream.write_text(source.name + ': psql meta-commands (\\...) are not supported by the native backend.\n')
+                    return 1
+                group.append(statement)
+                size += len(statement)
+                if size >= self.stream_group_size:
+                    self.__send(connection, stream, formatter, group)
+                    group = []
+                    size = 0
+            self.__send(connection, stream, formatter, group)
+            return 0
+
+        return self.__run(profile, stream, cancellation, run)
+
+    @staticmethod
+    def __send(connection, stream, formatter, statements):
+        if not statements:
+            return
+        try:
+            connection.simple_query(''.join(statements), formatter)
+        except PgError as e:
+            stream.write_text(e.format())
+
+    def __query(self, profile, stream, handler, query, file, encoding, cancellation):
+        if file is not None:
+            with open(file, encoding=encoding) as inputfile:
+                query = inputfile.read()
+        if self.__meta_command.search(query or ''):
+            stream.write_text('psql meta-commands (\\...) are not supported by the native backend.\n')
+            return 1
+
+        def run(connection):
+            connection.simple_query(query or '', handler)
+            return 0
+
+        return self.__run(profile, stream, cancellation, run)
+
+    def __run(self, profile, stream, cancellation, work):
+        connect = lambda: self.__connect(profile, stream.metrics)
+        try:
+            connection = connection_pool.acquire(profile.key, connect) if self.use_pool else connect()
+        except (PgError, PgConnectionError, OSError) as e:
+            stream.write_text('psql: error: ' + str(e) + '\n')
+            return 2
+
+        if stream.metrics.connect is None:
+            stream.metrics.connect = 0.0
+        if cancellation is not None:
+            cancellation.attach(connection.cancel, connection.abort)
+        stream.metrics.input_sent()
+        connection.on_receive = stream.metrics.received
+        try:
+            return work(connection)
+        except PgError as e:
+            # The server skips the rest of the query after an error, as psql does with ON_ERROR_STOP.
+            stream.write_text(e.format())
+            return 3
+        except (PgConnectionError, OSError) as e:
+            connection.broken = True
+            stream.write_text('psql: error: ' + str(e) + '\n')
+            return 2
+        except BaseException:
+            connection.broken = True
+            raise
+        finally:
+            stream.metrics.result_complete()
+            connection.on_receive = None
+            # A pooled connection must not be handed on inside a transaction, open or failed.
+            if connection.transaction_status not in ('I', None) and not connection.broken:
+                try:
+                    connection.simple_query('ROLLBACK')
+                except (PgError, PgConnectionError, OSError):
+                    connection.broken = True
+            if cancellation is not None:
+                cancellation.detach()
+            if self.use_pool:
+                connection_pool.release(profile.key, connection)
+            else:
+                connection.close()
+
+    @staticmethod
+    def __connect(profile, metrics):
+        start = time()
+        connection = PgConnection.from_variables(dict(profile.variables)).connect()
+        metrics.connect = time() - start
+        return connection
+
+class PsqlTextFormatter(object):
+    __numeric_types = frozenset((20, 21, 23, 26, 700, 701, 1700))
+    # Rows the column widths are taken from; later rows are written as they arrive,
+    # so that large results stream and stop at the display limit.
+    width_rows = 1000
+
+    def __init__(self, write):
+        self.write = write
+        self.__columns = None
+        self.__type_oids = None
+        self.__rows = []
+        self.__widths = None
+        self.__count = 0
+
+    def description(self, columns, type_oids):
+        self.__columns = columns
+        self.__type_oids = type_oids
+        self.__rows = []
+        self.__widths = None
+        self.__count = 0
+
+    def row(self, values):
+        self.__rows.append([self.format_value(value) for value in values])
+        self.__count += 1
+        if len(self.__rows) >= self.width_rows:
+            self.__write_rows()
+
+    def complete(self, command_tag):
+        if self.__columns is None:
+            self.write(command_tag + '\n')
+        else:
+            self.__write_rows()
+            self.write(self.format_footer(self.__count))
+        self.__columns = None
+        self.__rows = []
+        self.__widths = None
+
+    def __write_rows(self):
+        if self.__widths is None:
+            self.__widths = self.column_widths(self.__columns, self.__rows)
+            self.write(self.format_header(self.__columns, self.__widths))
+        self.write(self.format_rows(self.__type_oids, self.__widths, self.__rows))
+        self.__rows = []
+
+    def notice(self, notice):
+        self.write(notice.format())
+
+    def copy_out(self, data):
+        self.write(data.decode('utf-8', 'replace'))
+
+    def copy_in(self):
+        return iter(())
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return ''
+        if value is True or value is False:
+            return 't' if value else 'f'
+        if isinstance(value, bytes):
+            return '\\x' + ''.join('%02x' % byte for byte in value)
+        return str(value)
+
+    @staticmethod
+    def column_widths(columns, cells):
+        widths = [len(column) for column in columns]
+        for row in cells:
+            for index, value in enumerate(row):
+                widths[index] = max(widths[index], len(value))
+        return widths
+
+    @staticmethod
+    def format_header(columns, widths):
+        if not columns:
+            # psql's header for a result without columns (SELECT;).
+            return '--\n'
+        lines = [' ' + ' | '.join(column.center(widths[index]) for index, column in enumerate(columns)) + ' ']
+        lines.append('+'.join('-' * (width + 2) for width in widths))
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def format_rows(cls, type_oids, widths, cells):
+        if not widths:
+            return ''
+        numeric = [oid in cls.__numeric_types for oid in type_oids]
+        lines = []
+        for row in cells:
+            values = [value.rjust(widths[index]) if numeric[index] else value.ljust(widths[index]) for index, value in enumerate(row)]
+            lines.append(' ' + ' | '.join(values) if numeric and numeric[-1] else (' ' + ' | '.join(values)).rstrip())
+        return ''.join(line + '\n' for line in lines)
+
+    @staticmethod
+    def format_footer(count):
+        return '(' + str(count) + (' row)' if count == 1 else ' rows)') + '\n\n'
+
+    @classmethod
+    def format_table(cls, columns, type_oids, rows):
+        cells = [[cls.format_value(value) for value in row] for row in rows]
+        widths = cls.column_widths(columns, cells)
+        return cls.format_header(columns, widths) + cls.format_rows(type_oids, widths, cells) + cls.format_footer(len(rows))
+
+class PsqlCopyHandler(object):
+    def __init__(self, write, sink=None, data=()):
+        self.write = write
+        self.sink = sink
+        self.data = data
+        self.command_tag = None
+
+    def description(self, columns, type_oids):
+        pass
+
+    def row(self, values):
+        pass
+
+    def complete(self, command_tag):
+        self.command_tag = command_tag
+        self.write(command_tag + '\n')
+
+    def notice(self, notice):
+        self.write(notice.format())
+
+    def copy_out(self, data):
+        self.sink(data)
+
+    def copy_in(self):
+        return iter(self.data)
+
+backends = {'psql': PsqlProcessBackend, 'native': PsqlNativeBackend}
+
+def get_backend(name, use_pool=True):
+    if name not in backends:
+        raise ValueError('Backend ' + name + ' not recognized.')
+    return backends[name](use_pool)
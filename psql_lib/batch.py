@@ -0,0 +1,165 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from uuid import uuid4
+from time import time
+from re import compile as re_compile, M
+from .pool import marker_prefix_length
+
+error_line = re_compile(br'^(?:psql:[^\n]*?: )?(?:ERROR|FATAL|PANIC):', M)
+
+def quote_path(path):
+    return "'" + path.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+class PsqlFileResult(object):
+    def __init__(self, path):
+        self.path = path
+        self.start_time = None
+        self.end_time = None
+        self.failed = False
+        self.rolled_back = False
+
+    @property
+    def elapsed(self):
+        return (self.end_time or time()) - (self.start_time or time())
+
+def check_options(on_error_stop, savepoints):
+    # Savepoints let the files after a failed one run, which stopping at the first error rules out.
+    if savepoints and on_error_stop:
+        raise ValueError('PostgreSQL file_batch_savepoints needs file_batch_on_error_stop set to False.')
+
+class PsqlFileBatch(object):
+    # Runs files one after the other in a single session, optionally in one
+    # transaction with a savepoint around every file.
+    def __init__(self, files, transaction=False, on_error_stop=True, savepoints=False, on_file=None):
+        check_options(on_error_stop, savepoints)
+        self.files = list(files)
+        self.savepoints = savepoints
+        self.transaction = transaction or self.savepoints
+        self.on_error_stop = on_error_stop
+        self.on_file = on_file
+        self.results = [PsqlFileResult(path) for path in self.files]
+        self.marker = '__psql_file_' + uuid4().hex + '__'
+
+    @staticmethod
+    def savepoint(index):
+        return 'psql_file_' + str(index + 1)
+
+    def started(self, index):
+        self.results[index].start_time = time()
+
+    def finished(self, index, failed, rolled_back=False):
+        result = self.results[index]
+        result.end_time = time()
+        result.failed = failed
+        result.rolled_back = rolled_back
+        if self.on_file is not None:
+            self.on_file(self, index)
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.failed]
+
+    def script(self):
+        # psql input; \echo lines with the marker report the progress (see PsqlMarkerFilter).
+        lines = ['\\set ON_ERROR_STOP ' + ('on' if self.on_error_stop else 'off')]
+        if self.transaction:
+            lines.append('BEGIN;')
+        for index, path in enumerate(self.files):
+            echo = '\\echo ' + self.marker + ' '
+            lines.append(echo + 'start ' + str(index))
+            if self.savepoints:
+                lines.append('SAVEPOINT ' + self.savepoint(index) + ';')
+            lines.append('\\i ' + quote_path(path))
+            if self.savepoints:
+                # :ERROR tells whether the last statement failed, which it does
+                # in an aborted transaction.
+                lines.extend(['\\if :ERROR', 'ROLLBACK TO SAVEPOINT ' + self.savepoint(index) + ';', echo + 'rollback ' + str(index),
+                    '\\else', 'RELEASE SAVEPOINT ' + self.savepoint(index) + ';', echo + 'end ' + str(index), '\\endif'])
+            else:
+                lines.append(echo + 'end ' + str(index))
+        if self.transaction:
+            lines.append('COMMIT;')
+        lines.append('\\set ON_ERROR_STOP off')
+        return '\n'.join(lines) + '\n'
+
+class PsqlMarkerFilter(object):
+    # Stands in for the output stream of a batch: passes output on and turns the
+    # marker lines into started/finished calls on the batch.
+    def __init__(self, stream, batch):
+        self.stream = stream
+        self.metrics = stream.metrics
+        self.batch = batch
+        self.__marker = batch.marker.encode('ascii')
+        self.__pending = b''
+        self.__line = b''
+        self.__failed = False
+        self.__current = None
+
+    def write_text(self, text):
+        self.stream.write_text(text)
+
+    def write(self, data):
+        data = self.__pending + data
+        self.__pending = b''
+        position = 0
+        while True:
+            index = data.find(self.__marker, position)
+            if index < 0:
+                break
+            end = data.find(b'\n', index)
+            if end < 0:
+                break
+            self.__pass(data[position:index])
+            kind, number = data[index + len(self.__marker):end].split()
+            self.__marked(kind.decode('ascii'), int(number))
+            position = end + 1
+        limit = index if index >= 0 else len(data)
+        keep = marker_prefix_length(data[position:limit], self.__marker) if index < 0 else 0
+        self.__pending = data[limit - keep:]
+        self.__pass(data[position:limit - keep])
+
+    def close(self):
+        self.__pass(self.__pending)
+        self.__pending = b''
+        if self.__current is not None:
+            # psql stopped within the file (ON_ERROR_STOP, lost connection).
+            self.batch.finished(self.__current, True)
+            self.__current = None
+
+    def __pass(self, data):
+        if not data:
+            return
+        if error_line.search(self.__line + data) is not None:
+            self.__failed = True
+        newline = data.rfind(b'\n')
+        self.__line = data[newline + 1:][-256:] if newline >= 0 else (self.__line + data)[-256:]
+        self.stream.write(data)
+
+    def __marked(self, kind, index):
+        if kind == 'start':
+            self.__failed = False
+            self.__current = index
+            self.batch.started(index)
+        else:
+            self.__current = None
+            self.batch.finished(index, self.__failed or kind == 'rollback', kind == 'rollback')
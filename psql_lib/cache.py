@@ -0,0 +1,140 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from re import compile as re_compile, M, S, X
+from .statements import split_statements
+
+__token = re_compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+    |(?P<literal>(?<![\w$])[eE]'(?:\\.|''|[^'\\])*'|'(?:''|[^'])*'|"(?:""|[^"])*"|(?<![\w$])(?P<tag>\$(?:[^\W\d]\w*)?\$).*?(?P=tag))
+    |(?P<space>\s+)
+    |(?P<word>[^\s'"$/-]+|.)
+    """, S | X)
+__word = re_compile(r'[a-z_][a-z0-9_$]*')
+__error = re_compile(r'^(?:psql:[^\n]*?: )?(?:ERROR|FATAL|PANIC):', M)
+
+read_only_commands = frozenset(('select', 'values', 'table', 'show', 'with', 'explain'))
+writing_words = frozenset(('insert', 'update', 'delete', 'merge', 'into', 'create', 'drop', 'alter', 'truncate',
+    'grant', 'revoke', 'copy', 'call', 'do', 'lock', 'set', 'reset', 'vacuum', 'analyze', 'analyse', 'cluster',
+    'reindex', 'refresh', 'listen', 'notify', 'begin', 'commit', 'rollback', 'savepoint', 'prepare', 'execute',
+    'deallocate', 'discard', 'import', 'comment', 'security', 'load', 'share', 'nowait'))
+volatile_functions = re_compile(r'^(?:nextval|setval|currval|lastval|random|pg_sleep\w*|pg_advisory\w*|pg_try_advisory\w*|'
+    r'pg_terminate_backend|pg_cancel_backend|pg_reload_conf|pg_rotate_logfile|pg_switch_\w+|pg_create_\w+|pg_drop_\w+|'
+    r'pg_notify|set_config|txid_current\w*|lo_\w+|dblink\w*|clock_timestamp|timeofday|gen_random_\w+|uuid_generate_\w+)$')
+
+def normalize(sql):
+    # Comments and runs of white space become one space; everything outside literals and
+    # quoted identifiers is folded to lower case, as the server does for unquoted names.
+    parts = []
+    for match in __token.finditer(sql):
+        kind = match.lastgroup if match.lastgroup != 'tag' else 'literal'
+        if kind in ('comment', 'space'):
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+        elif kind == 'literal':
+            parts.append(match.group())
+        else:
+            parts.append(match.group().lower())
+    return ''.join(parts).strip().rstrip('; ')
+
+def skeleton(sql):
+    parts = []
+    for match in __token.finditer(sql):
+        if match.lastgroup in ('word',):
+            parts.append(match.group().lower())
+        else:
+            parts.append(' ')
+    return ''.join(parts)
+
+def is_read_only(sql):
+    statements = [statement for statement in split_statements(sql) if normalize(statement)]
+    if not statements:
+        return False
+    for statement in statements:
+        if statement.lstrip().startswith('\\'):
+            return False
+        words = __word.findall(skeleton(statement))
+        if not words or words[0] not in read_only_commands:
+            return False
+        if any(word in writing_words for word in words):
+            return False
+        if any(volatile_functions.match(word) for word in words):
+            return False
+    return True
+
+def has_error(text):
+    return __error.search(text) is not None
+
+class PsqlResultCache(object):
+    def __init__(self, max_size=10485760, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and self.ttl > 0 and time() - entry[1] > self.ttl:
+                self.__remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, text):
+        size = len(text)
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            if size > self.max_size:
+                return False
+            self.__entries[key] = (text, time())
+            self.size += size
+            while self.size > self.max_size:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, profile_key=None):
+        with self.__lock:
+            for key in [key for key in self.__entries if profile_key is None or key[0] == profile_key]:
+                self.__remove(key)
+
+    def __remove(self, key):
+        text, created = self.__entries.pop(key)
+        self.size -= len(text)
+
+result_cache = PsqlResultCache()
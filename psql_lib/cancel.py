@@ -0,0 +1,188 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from threading import Thread, Lock, Event, Timer
+from signal import SIGINT
+from os import name as os_name
+
+class PsqlCancellation(object):
+    grace_period = 3.0
+
+    def __init__(self, label=None):
+        self.label = label
+        self.detail = None
+        self.reason = None
+        self.finished = False
+        self.__interrupt = None
+        self.__terminate = None
+        self.__released = Event()
+        self.__lock = Lock()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def attach(self, interrupt, terminate=None):
+        # interrupt asks politely (cancel request, SIGINT); terminate is used when that
+        # has not ended the query within the grace period.
+        with self.__lock:
+            self.__interrupt = interrupt
+            self.__terminate = terminate
+            self.__released.clear()
+            cancelled = self.cancelled
+        if cancelled:
+            self.__start()
+
+    def detach(self):
+        with self.__lock:
+            self.__interrupt = None
+            self.__terminate = None
+            self.__released.set()
+
+    def finish(self):
+        with self.__lock:
+            self.finished = True
+
+    def cancel(self, reason='cancelled'):
+        with self.__lock:
+            if self.cancelled or self.finished:
+                return
+            self.reason = reason
+            attached = self.__interrupt is not None
+        if attached:
+            self.__start()
+
+    def __start(self):
+        worker = Thread(target=self.__stop)
+        worker.daemon = True
+        worker.start()
+
+    def __stop(self):
+        with self.__lock:
+            interrupt, terminate = self.__interrupt, self.__terminate
+        if interrupt is None:
+            return
+        try:
+            interrupt()
+        except Exception:
+            pass
+        if not self.__released.wait(self.grace_period):
+            with self.__lock:
+                terminate = self.__terminate
+            if terminate is not None:
+                try:
+                    terminate()
+                except Exception:
+                    pass
+
+    def start_timeout(self, seconds):
+        if seconds <= 0:
+            return None
+        timer = Timer(seconds, self.cancel, ['timeout'])
+        timer.daemon = True
+        timer.start()
+        return timer
+
+class PsqlCancellationGroup(PsqlCancellation):
+    # One entry for psql_cancel that stops the queries of all its members, e.g.
+    # the clients of a load test.
+    def __init__(self, label=None):
+        super().__init__(label)
+        self.members = []
+
+    def member(self):
+        cancellation = PsqlCancellation(self.label)
+        self.members.append(cancellation)
+        return cancellation
+
+    def cancel(self, reason='cancelled'):
+        super().cancel(reason)
+        for cancellation in list(self.members):
+            cancellation.cancel(reason)
+
+def interrupt_process(process):
+    # psql answers SIGINT by sending a cancel request for the running query and,
+    # as it is not interactive, exits afterwards.
+    if process.poll() is not None:
+        return
+    if os_name == 'nt':
+        process.terminate()
+    else:
+        process.send_signal(SIGINT)
+
+def kill_process(process):
+    if process.poll() is None:
+        process.kill()
+
+class PsqlInFlight(object):
+    __windows = {}
+    __lock = Lock()
+
+    @classmethod
+    def for_window(cls, window):
+        with cls.__lock:
+            queries = cls.__windows.get(window.id())
+            if queries is None:
+                queries = cls.__windows[window.id()] = cls()
+            return queries
+
+    @classmethod
+    def window_ids(cls):
+        with cls.__lock:
+            return list(cls.__windows)
+
+    @classmethod
+    def window_closed(cls, window_id):
+        # Waiting queries are skipped when their turn comes, running ones are interrupted.
+        with cls.__lock:
+            queries = cls.__windows.pop(window_id, None)
+        if queries is not None:
+            queries.cancel_all()
+
+    @classmethod
+    def counters(cls):
+        with cls.__lock:
+            windows = list(cls.__windows.values())
+        return [('queries in flight', sum(len(queries.queries()) for queries in windows))]
+
+    def __init__(self):
+        self.__queries = []
+        self.__lock = Lock()
+
+    def add(self, cancellation):
+        with self.__lock:
+            self.__queries.append(cancellation)
+
+    def remove(self, cancellation):
+        with self.__lock:
+            if cancellation in self.__queries:
+                self.__queries.remove(cancellation)
+
+    def queries(self):
+        with self.__lock:
+            return list(self.__queries)
+
+    def cancel_all(self, reason='cancelled'):
+        queries = self.queries()
+        for cancellation in queries:
+            cancellation.cancel(reason)
+        return len(queries)
@@ -0,0 +1,387 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from sublime import ok_cancel_dialog, Region
+from os.path import isfile, expanduser, split
+from traceback import format_exc
+from time import time
+from ..pool import session_pool
+from ..backend import get_backend, connection_pool
+from ..scheduler import scheduler, PsqlBatch
+from ..stream import PsqlOutputStream
+from ..output import PsqlOutputDispatcher
+from ..statements import PsqlStatementIndexes, split_statements
+from ..cancel import PsqlCancellation, PsqlInFlight
+from ..cache import result_cache, normalize, is_read_only, has_error
+from ..schema import PsqlSchemaCache, ddl_schemas
+from ..grid import PsqlGridState
+from ..batch import PsqlFileBatch, check_options
+from ..source import PsqlFileSource, PsqlBufferSource
+from ..history import PsqlHistory
+from ..progress import PsqlScriptProgress
+from ..plugin import PsqlBaseTextCommand, set_status, is_true, get_execution_log, get_query_history, get_schema_cache
+
+class PsqlCommand(PsqlBaseTextCommand):  
+    def run(self, edit, *args, **kwargs):  
+        self.edit = edit
+        self.statement_at_cursor = is_true(kwargs.pop('statement_at_cursor', False))
+        self.bypass_cache = is_true(kwargs.pop('bypass_cache', False))
+        self.result_format = kwargs.pop('result_format', None)
+        self.settings = kwargs
+        self.encoding = self.view.encoding()
+        if self.encoding == 'Undefined':
+            self.encoding = 'UTF-8'
+        if 'files' in self.settings and self.settings.get('file_batch', 'separate') == 'session':
+            try:
+                check_options(is_true(self.settings.get('file_batch_on_error_stop', True)), is_true(self.settings.get('file_batch_savepoints', False)))
+            except ValueError as e:
+                set_status(str(e))
+                return
+        self.selections = None
+        if 'files' not in self.settings:
+            # Resolved before anything is shown, there may be nothing to run.
+            self.selections = self.__selections()
+            if self.statement_at_cursor and not self.selections:
+                set_status('No PostgreSQL statement under the cursor.')
+                return
+
+        password = None
+        if 'password' in self.settings:
+            password = self.settings['password']
+        elif self.__is_password_required():
+            set_status('Enter password for PostgreSQL database.')
+            self.window.show_input_panel('Enter password:', '', self.__run_with_password, None, self.__cancelled)
+            return
+        self.__run_with_password(password)
+
+    def __cancelled(self):
+        self.__run_with_password(None)
+
+    def is_output_to_newfile(self):
+        return 'output_to_newfile' in self.settings and self.settings['output_to_newfile'] 
+
+    def __is_password_required(self):
+        return 'prompt_for_password' in self.settings and self.settings['prompt_for_password'] and 'passfile' not in self.settings and 'service' not in self.settings and not isfile(expanduser('~/.pgpass'))
+
+    def __run_with_password(self, password):
+        if not password and self.__is_password_required():
+            if 'warn_on_empty_password' in self.settings and self.settings['warn_on_empty_password'] and not ok_cancel_dialog('Proceed with empty password?', 'Proceed'):
+                set_status('PostgreSQL query cancelled.')
+                return
+        elif 'password' not in self.settings:
+            self.settings['password'] = password
+
+        self.output_panel = None
+        if not self.is_output_to_newfile():
+            self.output_panel = self.window.create_output_panel('psql')
+            self.output_panel.set_scratch(True)
+            self.output_panel.run_command('erase_view')
+            self.output_panel.set_encoding(self.encoding)
+
+        set_status('PostgreSQL query executing...')
+        thread_num = 0
+
+        scheduler.max_workers = int(self.settings.get('max_concurrent_queries', 4))
+        connection_limit = int(self.settings.get('max_connections_per_profile', 4))
+        profile = self.settings.snapshot(self.encoding)
+        if is_true(self.settings.get('schema_completions', 'True')):
+            # Completions read the catalog of this connection from now on.
+            get_schema_cache(self.settings, self.encoding)
+        backend = get_backend(self.settings.get('backend', 'psql'), is_true(self.settings.get('session_pool', 'True')))
+        session_pool.idle_timeout = connection_pool.idle_timeout = float(self.settings.get('session_idle_timeout', 300))
+        execution_order = self.settings.get('execution_order', 'parallel')
+        progress = self.__PostgresQueryProgress()
+        in_flight = PsqlInFlight.for_window(self.window)
+        self.execution_log = None
+        if is_true(self.settings.get('execution_log', 'True')):
+            self.execution_log = get_execution_log()
+            self.execution_log.max_size = int(self.settings.get('execution_log_size', 1048576))
+        self.query_history = None
+        if is_true(self.settings.get('query_history', 'True')) and PsqlHistory.available():
+            self.query_history = get_query_history()
+            self.query_history.max_age = float(self.settings.get('query_history_max_age', 90))
+            self.query_history.max_size = int(self.settings.get('query_history_max_size', 50000000))
+            self.query_history.preview_size = int(self.settings.get('query_history_preview', 2000))
+        self.use_result_cache = is_true(self.settings.get('result_cache', False))
+        if self.use_result_cache:
+            result_cache.ttl = float(self.settings.get('result_cache_ttl', 300))
+            result_cache.max_size = int(self.settings.get('result_cache_size', 10485760))
+        self.grid = None
+        if (self.result_format or self.settings.get('result_format', 'text')) == 'grid':
+            self.grid = PsqlGridState.for_window(self.window)
+            self.grid.reset(int(self.settings.get('grid_page_size', 100)), int(self.settings.get('grid_column_width', 60)))
+        batch = PsqlBatch(scheduler, execution_order, progress.completed)
+        dispatcher = PsqlOutputDispatcher.for_window(self.window)
+        output = dispatcher.begin_run(self.encoding, self.output_panel, execution_order == 'ordered-output')
+
+        if 'files' in self.settings and self.settings.get('file_batch', 'separate') == 'session':
+            files = sorted(fileobj for fileobj in self.settings['files'] if isfile(fileobj))
+            if files:
+                thread_num = 1
+                query = self.__PostgresQueryExecute(self, dispatcher, in_flight, profile, backend, files=files)
+                job = batch.add(profile.key, query.run, None, connection_limit)
+                progress.add(job, query, str(len(files)) + (' file' if len(files) == 1 else ' files'))
+                dispatcher.open(output, query.stream, progress.labels[job])
+
+        elif 'files' in self.settings:
+            for fileobj in self.settings['files']:  
+                if isfile(fileobj):
+                    thread_num += 1
+                    query = self.__PostgresQueryExecute(self, dispatcher, in_flight, profile, backend, file=fileobj)
+                    job = batch.add(profile.key, query.run, None, connection_limit)
+                    progress.add(job, query, 'file ' + split(fileobj)[1])
+                    dispatcher.open(output, query.stream, progress.labels[job])
+
+        else:
+            queries = []
+            noSelections = not self.selections
+            for sel in self.selections:
+                thread_num += 1
+                # Get the selected text  
+                query = self.__PostgresQueryExecute(self, dispatcher, in_flight, profile, backend, query=self.view.substr(sel))
+                queries.append((batch.add(profile.key, query.run, None, connection_limit, query.cached is not None), query))
+
+            if noSelections:
+                thread_num += 1
+                stream_input_size = int(self.settings.get('stream_input_size', 0) or 0)
+                if stream_input_size and self.view.size() > stream_input_size:
+                    # Too large to copy out of the buffer, the input is sent to the server as it is read
+                    query = self.__PostgresQueryExecute(self, dispatcher, in_flight, profile, backend, source=self.__input_source())
+                else:
+                    # Get all the text  
+                    query = self.__PostgresQueryExecute(self, dispatcher, in_flight, profile, backend, query=self.view.substr(Region(0, self.view.size())))
+                queries.append((batch.add(profile.key, query.run, None, connection_limit, query.cached is not None), query))
+
+            for num, (job, query) in enumerate(queries, 1):
+                progress.add(job, query, 'query ' + str(num) + '/' + str(thread_num) if thread_num > 1 else 'query')
+                dispatcher.open(output, query.stream, progress.labels[job])
+
+        batch.start()
+
+    def __selections(self):
+        # The selected regions, with empty ones replaced by the statement under the cursor
+        # when statement_at_cursor is set.
+        selections = []
+        for sel in self.view.sel():
+            if self.statement_at_cursor and sel.empty():
+                # Get the statement under the cursor
+                sel = Region(*self.__statement_index().statement_at(sel.begin()))
+                if sel in selections or not self.view.substr(sel).strip():
+                    continue
+            if not sel.empty():
+                selections.append(sel)
+        return selections
+
+    def __input_source(self):
+        # A saved, unmodified file is read from disk instead of from the buffer.
+        path = self.view.file_name()
+        if path and not self.view.is_dirty() and isfile(path):
+            return PsqlFileSource(path)
+        return PsqlBufferSource(split(path)[1] if path else self.view.name() or 'untitled', self.view.size(), lambda begin, end: self.view.substr(Region(begin, end)))
+
+    def __statement_index(self):
+        return PsqlStatementIndexes.get_or_create(self.view.buffer_id(), lambda begin, end: self.view.substr(Region(begin, end)), self.view.size)
+
+    class __PostgresQueryProgress(object):
+        __outcomes = {None: ' completed in ', 'cancelled': ' cancelled after ', 'timeout': ' timed out after '}
+
+        def __init__(self):
+            self.labels = {}
+            self.queries = {}
+
+        def add(self, job, query, label):
+            self.labels[job] = query.cancellation.label = label
+            self.queries[job] = query
+
+        def completed(self, job, completed, total):
+            completion_time = (job.end_time - job.start_time) * 1000
+            query = self.queries[job]
+            outcome = ' served from cache in ' if query.cached is not None else self.__outcomes[query.cancellation.reason]
+            if query.cancellation.reason is None and query.file_batch is not None and query.file_batch.failed:
+                outcome = ' failed after '
+            message = 'PostgreSQL ' + self.labels[job] + outcome + str(int(completion_time)) + ' ms'
+            if total > 1:
+                message += ' (' + str(completed) + ' of ' + str(total) + ' done'
+                if completed == total:
+                    run_time = (max(done.end_time for done in self.labels) - min(done.start_time for done in self.labels)) * 1000
+                    message += ', all in ' + str(int(run_time)) + ' ms'
+                message += ')'
+            set_status(message + '.')
+
+    class __PostgresQueryExecute(object):
+        def __init__(self, parent, dispatcher, in_flight, profile, backend, query=None, file=None, files=None, source=None):
+            self.profile = profile
+            self.backend = backend
+            self.encoding = parent.encoding
+            self.query = query
+            self.file = file
+            self.source = source
+            self.stream = PsqlOutputStream(parent.encoding, dispatcher.emit, int(parent.settings.get('output_display_limit', 0)))
+            self.query_timeout = float(parent.settings.get('query_timeout', 0) or 0)
+            self.in_flight = in_flight
+            self.cancellation = PsqlCancellation()
+            self.cancellation.detail = file if file is not None else source.name if source is not None else ', '.join(split(path)[1] for path in files)[:100] if files else ' '.join(query.split())[:100]
+            self.file_batch = None
+            if files:
+                self.file_batch = PsqlFileBatch(files, is_true(parent.settings.get('file_batch_transaction', False)),
+                    is_true(parent.settings.get('file_batch_on_error_stop', True)), is_true(parent.settings.get('file_batch_savepoints', False)), self.__file_done)
+            in_flight.add(self.cancellation)
+            self.execution_log = parent.execution_log
+            # Streamed input and file batches are not kept, their text may be any size.
+            self.query_history = parent.query_history if query is not None or file is not None else None
+            self.grid = parent.grid if source is None else None
+            self.backend_name = parent.settings.get('backend', 'psql')
+            self.cache_key = None
+            self.cached = None
+            # Anything that may write drops the cached results of the connection once it has run.
+            self.invalidates_cache = file is not None or bool(files) or source is not None or ((parent.use_result_cache or len(result_cache)) and not is_read_only(query))
+            if parent.use_result_cache and not self.invalidates_cache and self.grid is None:
+                self.cache_key = (profile.key, self.backend_name, normalize(query))
+                if not parent.bypass_cache:
+                    self.cached = result_cache.get(self.cache_key)
+            if source is not None:
+                source.on_progress = self.__sent
+            # Scripts report how far they got while they run, single statements do not need to.
+            self.script_progress = None
+            if is_true(parent.settings.get('script_progress', 'True')) and self.grid is None and self.cached is None:
+                statements = None if query is None else [statement for statement in split_statements(query) if not statement.lstrip().startswith('\\')]
+                if statements is None or len(statements) > 1:
+                    self.script_progress = PsqlScriptProgress(statements, int(parent.settings.get('script_slowest', 5)), self.__script_progressed)
+                    self.stream.on_text = self.script_progress.feed
+            if self.query_history is not None and self.cached is None:
+                self.stream.keep_preview(self.query_history.preview_size)
+            if self.execution_log is not None and self.cached is None:
+                self.stream.on_rendered = self.__rendered
+            # Only schemas already loaded for completions are kept up to date after DDL.
+            # Only schemas already loaded for completions are kept up to date after DDL.
+            self.tracks_schemas = PsqlSchemaCache.loaded(profile)
+
+        def __rendered(self, stream):
+            self.execution_log.append(stream.metrics.record(profile=self.profile.describe(), backend=self.backend_name,
+                pooled=self.backend.use_pool, label=self.cancellation.label, cancelled=self.cancellation.reason))
+
+        def __script_progressed(self, progress):
+            sent = ', ' + str(self.source.percent) + '% of ' + self.source.name + ' sent' if self.source is not None else ''
+            set_status('PostgreSQL ' + self.cancellation.label + ': ' + progress.status() + sent + '.')
+
+        def __sent(self, source):
+            if self.script_progress is not None and self.script_progress.completed:
+                return
+            set_status('PostgreSQL ' + self.cancellation.label + ': ' + str(source.percent) + '% of ' + source.name + ' sent (line ' + str(source.line) + ').')
+
+        def __file_done(self, batch, index):
+            result = batch.results[index]
+            outcome = ' rolled back after ' if result.rolled_back else ' failed after ' if result.failed else ' completed in '
+            message = split(result.path)[1] + outcome + str(int(result.elapsed * 1000)) + ' ms (' + str(index + 1) + ' of ' + str(len(batch.files)) + ')'
+            self.stream.write_text('-- ' + message + ' --\n')
+            set_status('PostgreSQL file ' + message + '.')
+
+        def __batch_done(self, retcode):
+            batch = self.file_batch
+            skipped = len([result for result in batch.results if result.start_time is None])
+            if skipped:
+                self.stream.write_text('-- ' + str(skipped) + (' file' if skipped == 1 else ' files') + ' not run --\n')
+            if batch.transaction and retcode != 0:
+                self.stream.write_text('-- transaction rolled back --\n')
+
+        def __table(self, table):
+            self.stream.metrics.rows += table.row_count
+            self.stream.write_text(self.grid.preview(self.grid.add(table)))
+
+        def __store(self, retcode):
+            if self.cache_key is None or retcode != 0 or self.stream.captured is None or self.cancellation.cancelled:
+                return
+            text = ''.join(self.stream.captured)
+            if not has_error(text):
+                result_cache.put(self.cache_key, text)
+
+        def __refresh_schemas(self):
+            # Scripts are scanned once they have run, the catalog is only reloaded for DDL.
+            if self.query is not None:
+                chunks = [self.query]
+            elif self.source is not None:
+                self.source.on_progress = None
+                chunks = self.source.texts(self.encoding)
+            else:
+                paths = self.file_batch.files if self.file_batch is not None else [self.file]
+                chunks = (text for path in paths for text in PsqlFileSource(path).texts(self.encoding))
+            try:
+                schemas = ddl_schemas(chunks)
+            except (IOError, OSError):
+                schemas = set()
+            if schemas is not None:
+                PsqlSchemaCache.for_profile(self.profile).refresh(self.backend_name, schemas)
+
+        def run(self):
+            timer = self.cancellation.start_timeout(self.query_timeout)
+            self.stream.metrics.started()
+            if self.script_progress is not None:
+                self.script_progress.start()
+            retcode = None
+            try:
+                if self.cancellation.cancelled:
+                    retcode = 1
+                elif self.cached is not None:
+                    text, created = self.cached
+                    self.stream.write_text('(cached result, ' + str(int(time() - created)) + ' seconds old)\n' + text)
+                    retcode = 0
+                else:
+                    if self.cache_key is not None:
+                        self.stream.capture(result_cache.max_size)
+                    if self.file_batch is not None:
+                        retcode = self.backend.execute_files(self.profile, self.stream, self.file_batch, encoding=self.encoding, cancellation=self.cancellation)
+                        self.__batch_done(retcode)
+                    elif self.grid is not None:
+                        retcode = self.backend.fetch(self.profile, self.stream, self.__table, query=self.query, file=self.file, encoding=self.encoding, cancellation=self.cancellation)
+                    else:
+                        retcode = self.backend.execute(self.profile, self.stream, query=self.query, file=self.file, encoding=self.encoding, cancellation=self.cancellation, source=self.source)
+                    self.__store(retcode)
+
+            except BaseException:
+                self.stream.write_text(format_exc())
+                retcode = 1
+
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                self.cancellation.finish()
+                self.in_flight.remove(self.cancellation)
+                if self.invalidates_cache:
+                    result_cache.invalidate(self.profile.key)
+                if self.tracks_schemas and retcode == 0 and not self.cancellation.cancelled:
+                    self.__refresh_schemas()
+                if self.cancellation.reason == 'timeout':
+                    self.stream.write_text('Query cancelled after exceeding query_timeout of ' + str(self.query_timeout) + ' seconds.\n')
+                elif self.cancellation.cancelled:
+                    self.stream.write_text('Query cancelled.\n')
+                if self.script_progress is not None:
+                    self.stream.on_text = None
+                    self.script_progress.close()
+                    if self.script_progress.completed > 1:
+                        self.stream.write_text(self.script_progress.report())
+                self.stream.metrics.finished(retcode)
+                self.stream.close()
+                if self.query_history is not None and self.cached is None:
+                    self.query_history.add(self.profile.describe(), self.query if self.query is not None else '\\i ' + self.file,
+                        self.stream.metrics.end - self.stream.metrics.start, self.stream.metrics.rows, retcode, ''.join(self.stream.preview))
+
+            return retcode
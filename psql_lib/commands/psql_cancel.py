@@ -0,0 +1,47 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from ..plugin import PsqlBaseWindowCommand, set_status, is_true
+from ..cancel import PsqlInFlight
+
+class PsqlCancelCommand(PsqlBaseWindowCommand):
+    def is_enabled(self):
+        return len(PsqlInFlight.for_window(self.window).queries()) > 0
+    def run(self, *args, **kwargs):
+        self.queries = PsqlInFlight.for_window(self.window).queries()
+        if not self.queries:
+            set_status('No PostgreSQL queries running.')
+        elif len(self.queries) == 1 or is_true(kwargs.get('all', False)):
+            self.__cancel(self.queries)
+        else:
+            items = [['All queries', str(len(self.queries)) + ' running or waiting']]
+            items.extend([query.label or 'query', query.detail or ''] for query in self.queries)
+            self.window.show_quick_panel(items, self.__selected)
+    def __selected(self, index):
+        if index == 0:
+            self.__cancel(self.queries)
+        elif index > 0:
+            self.__cancel([self.queries[index - 1]])
+    def __cancel(self, queries):
+        for query in queries:
+            query.cancel()
+        set_status('PostgreSQL ' + (queries[0].label or 'query' if len(queries) == 1 else str(len(queries)) + ' queries') + ' cancelled.')
@@ -0,0 +1,144 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from sublime import Region, set_timeout, DRAW_NO_OUTLINE
+from traceback import format_exc
+from ..plugin import PsqlBaseTextCommand, set_status, is_true
+from ..backend import get_backend
+from ..scheduler import scheduler, PsqlJob
+from ..stream import PsqlOutputStream
+from ..statements import PsqlStatementIndexes, split_statements
+from ..cancel import PsqlCancellation, PsqlInFlight
+from ..cache import normalize
+from ..explain import PsqlPlan, plan_history, explain_statement, compare_plans, format_ms
+
+class PsqlExplainCommand(PsqlBaseTextCommand):
+    def run(self, edit, *args, **kwargs):
+        self.analyze = is_true(kwargs.pop('analyze', True))
+        self.buffers = is_true(kwargs.pop('buffers', True))
+        action = kwargs.pop('action', 'run')
+        self.settings = kwargs
+        self.encoding = self.view.encoding()
+        if self.encoding == 'Undefined':
+            self.encoding = 'UTF-8'
+
+        self.query = self.__query()
+        if self.query is None:
+            set_status('No PostgreSQL query selected or under the cursor to explain.')
+            return
+        if len(split_statements(self.query)) != 1:
+            set_status('Select a single PostgreSQL query to explain.')
+            return
+        self.profile = self.settings.snapshot(self.encoding)
+        self.key = (self.profile.key, normalize(self.query))
+        plan_history.size = int(self.settings.get('explain_history', 5))
+        if action == 'compare':
+            self.__compare()
+        elif action == 'run':
+            self.__explain()
+        else:
+            set_status('Unknown PostgreSQL explain action ' + action + '.')
+    def __query(self):
+        for sel in self.view.sel():
+            if not sel.empty():
+                return self.view.substr(sel)
+        if len(self.view.sel()) == 0:
+            return None
+        index = PsqlStatementIndexes.get_or_create(self.view.buffer_id(), lambda begin, end: self.view.substr(Region(begin, end)), self.view.size)
+        query = self.view.substr(Region(*index.statement_at(self.view.sel()[0].begin())))
+        return query if query.strip() else None
+    def __explain(self):
+        sql = explain_statement(self.query, self.analyze, self.buffers) + ';'
+        if self.analyze:
+            # EXPLAIN ANALYZE runs the statement, so changes are rolled back; a query
+            # that looks read-only can still write through the functions it calls.
+            sql = 'BEGIN;\n' + sql + '\nROLLBACK;'
+        profile = self.profile
+        backend = get_backend(self.settings.get('backend', 'psql'), is_true(self.settings.get('session_pool', 'True')))
+        cancellation = PsqlCancellation('explain')
+        cancellation.detail = ' '.join(self.query.split())[:100]
+        in_flight = PsqlInFlight.for_window(self.window)
+        in_flight.add(cancellation)
+        timer = cancellation.start_timeout(float(self.settings.get('query_timeout', 0) or 0))
+        tables = []
+        messages = []
+        stream = PsqlOutputStream(self.encoding, lambda stream, text: text and messages.append(text))
+
+        def run():
+            plan = None
+            try:
+                backend.fetch(profile, stream, tables.append, query=sql, encoding=self.encoding, cancellation=cancellation)
+                for table in tables:
+                    if table.columns == ['QUERY PLAN'] and table.row_count:
+                        plan = PsqlPlan.parse(table.cell(0, 0))
+            except OSError as e:
+                messages.append('psql: error: ' + str(e) + '\n')
+            except BaseException:
+                messages.append(format_exc())
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                cancellation.finish()
+                in_flight.remove(cancellation)
+                stream.close()
+            set_timeout(lambda: self.__finished(plan, cancellation, ''.join(messages)))
+
+        set_status('PostgreSQL explain running...')
+        scheduler.max_workers = int(self.settings.get('max_concurrent_queries', 4))
+        scheduler.submit(PsqlJob(profile.key, run, int(self.settings.get('max_connections_per_profile', 4))))
+    def __finished(self, plan, cancellation, message):
+        if plan is None:
+            if cancellation.cancelled:
+                set_status('PostgreSQL explain cancelled.')
+            else:
+                self.__show(message or 'No plan returned.\n')
+                set_status('PostgreSQL explain failed.')
+            return
+        previous = plan_history.plans(self.key)
+        plan_history.add(self.key, plan)
+        self.__show(message, plan, previous[-1] if previous else None)
+        set_status('PostgreSQL explain: ' + format_ms(plan.total_time) + ' ms.')
+    def __compare(self):
+        self.plans = plan_history.plans(self.key)
+        if len(self.plans) < 2:
+            set_status('No earlier PostgreSQL plan of this query to compare with.')
+            return
+        latest = self.plans[-1]
+        self.window.show_quick_panel([[str(int((latest.created - plan.created) / 60)) + ' minutes before the latest plan', format_ms(plan.total_time) + ' ms']
+            for plan in reversed(self.plans[:-1])], self.__compare_selected)
+    def __compare_selected(self, index):
+        if index >= 0:
+            self.__show('', self.plans[-1], self.plans[-2 - index])
+    def __show(self, message, plan=None, before=None):
+        text = message
+        regions = []
+        if plan is not None:
+            if before is not None:
+                text += compare_plans(before, plan) + '\n'
+            rendered, hotspots = plan.render(int(self.settings.get('explain_hotspots', 3)))
+            regions = [Region(len(text) + begin, len(text) + end) for begin, end in hotspots]
+            text += rendered
+        panel = self.window.create_output_panel('psql')
+        panel.set_scratch(True)
+        panel.run_command('erase_view')
+        panel.run_command('append', {'characters': text})
+        panel.add_regions('psql_explain', regions, 'invalid', '', DRAW_NO_OUTLINE)
+        self.window.run_command('show_panel', {'panel': 'output.psql'})
@@ -0,0 +1,127 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from sublime import Region, set_timeout
+from os.path import expanduser, split, join
+from traceback import format_exc
+from ..plugin import PsqlBaseTextCommand, set_status, is_true
+from ..backend import get_backend
+from ..scheduler import scheduler, PsqlJob
+from ..stream import PsqlOutputStream
+from ..statements import PsqlStatementIndexes
+from ..cancel import PsqlCancellation, PsqlInFlight
+from ..export import PsqlExport, export_format, single_statement, copy_statement, format_bytes
+
+class PsqlExportCommand(PsqlBaseTextCommand):
+    def run(self, edit, *args, **kwargs):
+        path = kwargs.pop('path', None)
+        self.format = kwargs.pop('format', None)
+        self.compress = kwargs.pop('gzip', None)
+        self.header = is_true(kwargs.pop('header', True))
+        self.settings = kwargs
+        self.encoding = self.view.encoding()
+        if self.encoding == 'Undefined':
+            self.encoding = 'UTF-8'
+
+        self.query = self.__query()
+        if self.query is None:
+            set_status('No PostgreSQL query selected or under the cursor to export.')
+            return
+        self.query = single_statement(self.query)
+        if self.query is None:
+            set_status('Select a single PostgreSQL query to export.')
+            return
+        if path is None:
+            folder = split(self.view.file_name())[0] if self.view.file_name() else expanduser('~')
+            self.window.show_input_panel('Export to file (.csv, .tsv, .bin, optionally .gz):', join(folder, 'export.csv'), self.__export, None, None)
+        else:
+            self.__export(path)
+    def __query(self):
+        for sel in self.view.sel():
+            if not sel.empty():
+                return self.view.substr(sel)
+        if len(self.view.sel()) == 0:
+            return None
+        index = PsqlStatementIndexes.get_or_create(self.view.buffer_id(), lambda begin, end: self.view.substr(Region(begin, end)), self.view.size)
+        query = self.view.substr(Region(*index.statement_at(self.view.sel()[0].begin())))
+        return query if query.strip() else None
+    def __export(self, path):
+        path = expanduser(path.strip())
+        format, compress = export_format(path)
+        format = self.format or format
+        compress = compress if self.compress is None else is_true(self.compress)
+        try:
+            sql = copy_statement(self.query, format, self.header)
+        except ValueError as e:
+            set_status(str(e))
+            return
+
+        profile = self.settings.snapshot(self.encoding)
+        backend = get_backend(self.settings.get('backend', 'psql'), is_true(self.settings.get('session_pool', 'True')))
+        export = PsqlExport(path, compress, self.__progress)
+        cancellation = PsqlCancellation('export')
+        cancellation.detail = path
+        in_flight = PsqlInFlight.for_window(self.window)
+        in_flight.add(cancellation)
+        messages = []
+        stream = PsqlOutputStream(self.encoding, lambda stream, text: text and messages.append(text))
+
+        def run():
+            retcode = None
+            try:
+                export.open()
+                retcode = backend.copy_out(profile, stream, sql, export.write, self.encoding, cancellation)
+            except BaseException:
+                messages.append(format_exc())
+            finally:
+                cancellation.finish()
+                in_flight.remove(cancellation)
+                stream.close()
+                succeeded = retcode == 0 and not cancellation.cancelled
+                try:
+                    export.close(succeeded)
+                except (OSError, IOError) as e:
+                    succeeded = False
+                    messages.append(str(e))
+            self.__finished(export, succeeded, cancellation, messages)
+
+        set_status('PostgreSQL export to ' + path + ' starting...')
+        scheduler.max_workers = int(self.settings.get('max_concurrent_queries', 4))
+        scheduler.submit(PsqlJob(profile.key, run, int(self.settings.get('max_connections_per_profile', 4))))
+    def __progress(self, export):
+        set_status('PostgreSQL export to ' + split(export.path)[1] + ': ' + format_bytes(export.size) + ' (' + format_bytes(export.rate) + '/s)')
+    def __finished(self, export, succeeded, cancellation, messages):
+        if succeeded:
+            set_status('PostgreSQL export to ' + export.path + ' finished: ' + format_bytes(export.size) + ' in ' +
+                '%.1f' % export.elapsed + ' s (' + format_bytes(export.rate) + '/s).')
+        elif cancellation.cancelled:
+            set_status('PostgreSQL export to ' + export.path + ' cancelled.')
+        else:
+            message = ''.join(messages).strip()
+            set_timeout(lambda: self.__show('PostgreSQL export to ' + export.path + ' failed:\n' + message + '\n'))
+            set_status('PostgreSQL export failed: ' + (message.splitlines()[0] if message else 'unknown error'))
+    def __show(self, text):
+        panel = self.window.create_output_panel('psql')
+        panel.set_scratch(True)
+        panel.run_command('erase_view')
+        panel.run_command('append', {'characters': text})
+        self.window.run_command('show_panel', {'panel': 'output.psql'})
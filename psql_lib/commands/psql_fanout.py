@@ -0,0 +1,142 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from sublime import Region, set_timeout, find_resources, load_resource, decode_value
+from traceback import format_exc
+from time import time
+from ..plugin import PsqlBaseTextCommand, PsqlSettings, set_status, is_true
+from ..backend import get_backend
+from ..scheduler import PsqlScheduler, PsqlBatch
+from ..stream import PsqlOutputStream
+from ..cancel import PsqlCancellation, PsqlInFlight
+from ..grid import PsqlGridState
+from ..fanout import PsqlFanout, PsqlFanoutTarget, menu_connections, select_targets
+
+class PsqlFanoutCommand(PsqlBaseTextCommand):
+    def run(self, edit, *args, **kwargs):
+        names = kwargs.pop('targets', None)
+        pattern = kwargs.pop('pattern', None)
+        self.concurrency = kwargs.pop('concurrency', None)
+        self.settings = kwargs
+        self.encoding = self.view.encoding()
+        if self.encoding == 'Undefined':
+            self.encoding = 'UTF-8'
+        selections = [self.view.substr(sel) for sel in self.view.sel() if not sel.empty()]
+        self.query = '\n'.join(selections) if selections else self.view.substr(Region(0, self.view.size()))
+        if not self.query.strip():
+            set_status('No PostgreSQL query to run.')
+        elif names or pattern:
+            self.__fanout(pattern, names)
+        else:
+            self.window.show_input_panel('Run on connections matching:', '*', self.__fanout, None, None)
+    def __connections(self):
+        connections = []
+        for resource in find_resources('Main.sublime-menu'):
+            try:
+                connections.extend(menu_connections(decode_value(load_resource(resource))))
+            except (ValueError, IOError) as e:
+                set_status('PostgreSQL connections in ' + resource + ' not read: ' + str(e))
+        configured = self.settings.get('connections', None) or {}
+        connections.extend(sorted(configured.items()) if isinstance(configured, dict) else [])
+        return connections
+    def __fanout(self, pattern, names=None):
+        try:
+            chosen = select_targets(self.__connections(), names, pattern)
+        except KeyError as e:
+            set_status(str(e.args[0]))
+            return
+        if not chosen:
+            set_status('No PostgreSQL connections match ' + (pattern or '') + '.')
+            return
+
+        targets = []
+        for name, args in chosen:
+            settings = PsqlSettings()
+            settings.update(self.settings)
+            try:
+                settings.update(args)
+            except ValueError as e:
+                target = PsqlFanoutTarget(name, None)
+                target.messages.append(str(e))
+                target.retcode = 1
+                targets.append(target)
+                continue
+            target = PsqlFanoutTarget(name, settings.snapshot(self.encoding))
+            target.backend = get_backend(settings.get('backend', 'psql'), is_true(settings.get('session_pool', 'True')))
+            targets.append(target)
+
+        self.fanout = PsqlFanout(targets)
+        self.query_timeout = float(self.settings.get('query_timeout', 0) or 0)
+        self.in_flight = PsqlInFlight.for_window(self.window)
+        # A scheduler of its own, so that the fan-out neither waits for nor holds up other queries.
+        limit = int(self.concurrency or self.settings.get('fanout_concurrency', 8))
+        batch = PsqlBatch(PsqlScheduler(limit), 'parallel', self.__progress)
+        for target in targets:
+            if target.profile is not None:
+                batch.add(target.profile.key, lambda target=target: self.__execute(target), None)
+        set_status('PostgreSQL query running on ' + str(len(targets)) + ' connections...')
+        if not batch.jobs:
+            set_timeout(self.__show)
+        batch.start()
+    def __execute(self, target):
+        cancellation = PsqlCancellation(target.name)
+        cancellation.detail = ' '.join(self.query.split())[:100]
+        self.in_flight.add(cancellation)
+        stream = PsqlOutputStream(self.encoding, lambda stream, text: text and target.messages.append(text))
+        timer = cancellation.start_timeout(self.query_timeout)
+        target.start_time = time()
+        retcode = None
+        try:
+            retcode = target.backend.fetch(target.profile, stream, target.tables.append, query=self.query, encoding=self.encoding, cancellation=cancellation)
+        except OSError as e:
+            target.messages.append('psql: error: ' + str(e))
+            retcode = 2
+        except BaseException:
+            target.messages.append(format_exc())
+            retcode = 1
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cancellation.finish()
+            self.in_flight.remove(cancellation)
+            stream.close()
+            target.end_time = time()
+            target.retcode = retcode
+            target.cancelled = cancellation.reason
+    def __progress(self, job, completed, total):
+        failed = len([target for target in self.fanout.targets if target.end_time is not None and target.failed])
+        set_status('PostgreSQL query done on ' + str(completed) + ' of ' + str(total) + ' connections' + (' (' + str(failed) + ' failed)' if failed else '') + '.')
+        if completed == total:
+            set_timeout(self.__show)
+    def __show(self):
+        grid = PsqlGridState.for_window(self.window)
+        grid.reset(int(self.settings.get('grid_page_size', 100)), int(self.settings.get('grid_column_width', 60)))
+        previews = [grid.preview(grid.add(self.fanout.summary(), 'connections'))]
+        for table in self.fanout.merged():
+            previews.append(grid.preview(grid.add(table)))
+        panel = self.window.create_output_panel('psql')
+        panel.set_scratch(True)
+        panel.run_command('erase_view')
+        panel.run_command('append', {'characters': ''.join(previews)})
+        self.window.run_command('show_panel', {'panel': 'output.psql'})
+        failed = len(self.fanout.failed)
+        set_status('PostgreSQL query ran on ' + str(len(self.fanout.targets)) + ' connections' + (', ' + str(failed) + ' failed' if failed else '') + '.')
@@ -0,0 +1,84 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from ..plugin import PsqlBaseWindowCommand, set_status, is_true
+from ..grid import PsqlGridState
+
+class PsqlGridCommand(PsqlBaseWindowCommand):
+    def is_enabled(self, *args, **kwargs):
+        return len(PsqlGridState.for_window(self.window).results) > 0
+    def run(self, *args, **kwargs):
+        self.grid = PsqlGridState.for_window(self.window)
+        if not self.grid.results:
+            set_status('No PostgreSQL result grid. Run a query with result_format set to grid.')
+            return
+        action = kwargs.get('action', 'next')
+        if action in ('first', 'previous', 'next', 'last'):
+            pages = {'first': 0, 'previous': self.grid.page - 1, 'next': self.grid.page + 1, 'last': self.grid.pages - 1}
+            self.grid.move(pages[action])
+            self.__render()
+        elif action == 'sort':
+            if 'column' in kwargs:
+                self.__sort(kwargs['column'], is_true(kwargs.get('descending', False)))
+            else:
+                columns = self.grid.table.columns
+                self.sort_items = [(index, descending) for index in range(len(columns)) for descending in (False, True)]
+                self.window.show_quick_panel([[columns[index], 'descending' if descending else 'ascending'] for index, descending in self.sort_items], self.__sort_selected)
+        elif action == 'filter':
+            if 'text' in kwargs:
+                self.__filter(kwargs['text'])
+            else:
+                self.window.show_input_panel('Filter rows containing:', self.grid.needle or '', self.__filter, None, None)
+        elif action == 'clear_filter':
+            self.__filter('')
+        elif action == 'result':
+            if 'index' in kwargs:
+                self.__select(int(kwargs['index']))
+            else:
+                self.window.show_quick_panel([[label, str(table.row_count) + ' rows, ' + ', '.join(table.columns)[:100]] for label, table in self.grid.results], self.__select)
+        else:
+            set_status('Unknown PostgreSQL grid action ' + action + '.')
+    def __sort_selected(self, index):
+        if index >= 0:
+            self.__sort(*self.sort_items[index])
+    def __sort(self, column, descending):
+        columns = self.grid.table.columns
+        if column in columns:
+            column = columns.index(column)
+        elif not str(column).isdigit() or int(column) >= len(columns):
+            set_status('No column ' + str(column) + ' in the PostgreSQL result grid.')
+            return
+        self.grid.sort(int(column), descending)
+        self.__render()
+    def __filter(self, text):
+        self.grid.filter(text)
+        self.__render()
+    def __select(self, index):
+        if 0 <= index < len(self.grid.results):
+            self.grid.select(index)
+            self.__render()
+    def __render(self):
+        panel = self.window.create_output_panel('psql')
+        panel.set_scratch(True)
+        panel.run_command('erase_view')
+        panel.run_command('append', {'characters': self.grid.render()})
+        self.window.run_command('show_panel', {'panel': 'output.psql'})
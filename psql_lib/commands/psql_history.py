@@ -0,0 +1,72 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from sublime import set_timeout
+from threading import Thread
+from time import localtime, strftime
+from ..plugin import PsqlBaseWindowCommand, set_status, get_query_history
+from ..history import PsqlHistory
+
+class PsqlHistoryCommand(PsqlBaseWindowCommand):
+    def is_enabled(self, *args, **kwargs):
+        return PsqlHistory.available()
+    def run(self, *args, **kwargs):
+        self.action = kwargs.get('action', 'run')
+        if not PsqlHistory.available():
+            set_status('PostgreSQL query history needs sqlite3, which this Python lacks.')
+        elif 'text' in kwargs:
+            self.__search(kwargs['text'])
+        else:
+            self.window.show_input_panel('Search query history (empty for the latest):', '', self.__search, None, None)
+    def __search(self, text):
+        history = get_query_history()
+
+        def search():
+            try:
+                entries = history.search(text)
+            except Exception as e:
+                set_status('PostgreSQL query history not searched: ' + str(e))
+                return
+            set_timeout(lambda: self.__show(text, entries))
+
+        worker = Thread(target=search)
+        worker.daemon = True
+        worker.start()
+    def __show(self, text, entries):
+        if not entries:
+            set_status('No PostgreSQL queries in the history' + (' match ' + text if text.strip() else '') + '.')
+            return
+        self.entries = entries
+        items = []
+        for entry in entries:
+            outcome = ' ms, failed' if entry.retcode else ' ms, ' + str(entry.rows) + (' row' if entry.rows == 1 else ' rows')
+            preview = ' '.join(entry.preview.split())
+            items.append([' '.join(entry.sql.split())[:120],
+                strftime('%Y-%m-%d %H:%M', localtime(entry.created)) + '  ' + entry.profile + '  ' + str(int((entry.duration or 0) * 1000)) + outcome,
+                preview[:120] or '(no output)'])
+        self.window.show_quick_panel(items, self.__selected)
+    def __selected(self, index):
+        if index < 0:
+            return
+        view = self.window.new_file()
+        view.run_command('append', {'characters': self.entries[index].sql})
+        if self.action == 'run':
+            view.run_command('psql')
@@ -0,0 +1,123 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from os.path import isfile, split
+from threading import Lock
+from traceback import format_exc
+from time import time
+from sublime import set_timeout
+from ..plugin import PsqlBaseWindowCommand, set_status, is_true
+from ..backend import get_backend
+from ..scheduler import scheduler, PsqlJob
+from ..stream import PsqlOutputStream
+from ..cancel import PsqlCancellation, PsqlInFlight
+from ..export import export_format, format_bytes
+from ..importer import PsqlImport, import_table
+
+class PsqlImportCommand(PsqlBaseWindowCommand):
+    def run(self, *args, **kwargs):
+        files = kwargs.pop('files', None)
+        table = kwargs.pop('table', None)
+        self.format = kwargs.pop('format', None)
+        self.compress = kwargs.pop('gzip', None)
+        self.header = is_true(kwargs.pop('header', True))
+        self.parallel = kwargs.pop('parallel', None)
+        self.settings = kwargs
+        if not files:
+            view = self.window.active_view()
+            files = [view.file_name()] if view is not None and view.file_name() else []
+        self.files = [fileobj for fileobj in files if isfile(fileobj)]
+        if not self.files:
+            set_status('No files to import into PostgreSQL.')
+        elif table is None:
+            self.window.show_input_panel('Import into table:', import_table(self.files[0]), self.__import, None, None)
+        else:
+            self.__import(table)
+    def __import(self, table):
+        table = table.strip()
+        if not table:
+            set_status('PostgreSQL import cancelled, no table given.')
+            return
+        self.output_panel = self.window.create_output_panel('psql')
+        self.output_panel.set_scratch(True)
+        self.output_panel.run_command('erase_view')
+        for path in self.files:
+            self.__start(path, table)
+    def __start(self, path, table):
+        format, compressed = export_format(path)
+        format = self.format or format
+        compressed = compressed if self.compress is None else is_true(self.compress)
+        parallel = max(1, int(self.parallel or self.settings.get('import_parallelism', 1)))
+        try:
+            job = PsqlImport(path, table, format, self.header, parallel, compressed, self.__progress)
+        except (OSError, IOError, ValueError) as e:
+            set_status('PostgreSQL import of ' + split(path)[1] + ' failed: ' + str(e))
+            return
+
+        profile = self.settings.snapshot('UTF-8')
+        backend = get_backend(self.settings.get('backend', 'psql'), is_true(self.settings.get('session_pool', 'True')))
+        in_flight = PsqlInFlight.for_window(self.window)
+        remaining = [len(job.chunks)]
+        lock = Lock()
+
+        def run(chunk, sql, cancellation):
+            messages = []
+            stream = PsqlOutputStream('UTF-8', lambda stream, text: text and messages.append(text))
+            chunk.start_time = time()
+            retcode = None
+            try:
+                retcode = backend.copy_in(profile, stream, sql, chunk.blocks(job.block_sent), 'UTF-8', cancellation)
+            except BaseException:
+                messages.append(format_exc())
+            finally:
+                cancellation.finish()
+                in_flight.remove(cancellation)
+                stream.close()
+                if cancellation.cancelled:
+                    messages.append('Import cancelled.')
+                    retcode = retcode or 1
+                chunk.finish(retcode, ''.join(messages))
+                with lock:
+                    remaining[0] -= 1
+                    finished = not remaining[0]
+                if finished:
+                    self.__finished(job)
+
+        set_status('PostgreSQL import of ' + split(path)[1] + ' into ' + table + ' starting...')
+        scheduler.max_workers = int(self.settings.get('max_concurrent_queries', 4))
+        for chunk, sql in zip(job.chunks, job.statements):
+            cancellation = PsqlCancellation('import ' + chunk.describe())
+            cancellation.detail = path
+            in_flight.add(cancellation)
+            scheduler.submit(PsqlJob(profile.key, lambda chunk=chunk, sql=sql, cancellation=cancellation: run(chunk, sql, cancellation), parallel))
+    def __progress(self, job):
+        done = '' if job.chunks[0].compressed else ' ' + str(int(100 * job.sent / max(job.size, 1))) + '%,'
+        set_status('PostgreSQL import into ' + job.table + ':' + done + ' ' + format_bytes(job.sent) + ', ~' + str(job.rows) +
+            ' rows (' + str(int(job.rows / max(job.elapsed, 0.001))) + ' rows/s)')
+    def __finished(self, job):
+        report = job.report()
+        set_timeout(lambda: self.__show(report))
+        summary = report.rstrip().splitlines()[-1]
+        set_status('PostgreSQL import of ' + split(job.path)[1] + ' into ' + job.table + (' failed: ' if job.failed else ' finished: ') + summary + '.')
+    def __show(self, report):
+        self.output_panel.run_command('append', {'characters': report})
+        self.window.run_command('show_panel', {'panel': 'output.psql'})
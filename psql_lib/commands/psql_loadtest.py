@@ -0,0 +1,134 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from sublime import Region, set_timeout
+from traceback import format_exc
+from time import time
+from ..plugin import PsqlBaseTextCommand, set_status, is_true
+from ..backend import get_backend
+from ..scheduler import PsqlScheduler, PsqlBatch
+from ..stream import PsqlOutputStream
+from ..statements import PsqlStatementIndexes
+from ..cancel import PsqlCancellationGroup, PsqlInFlight
+from ..loadtest import PsqlLoadTest, load_parameters
+
+class PsqlLoadtestCommand(PsqlBaseTextCommand):
+    def run(self, edit, *args, **kwargs):
+        clients = kwargs.pop('clients', None)
+        duration = kwargs.pop('duration', None)
+        iterations = kwargs.pop('iterations', None)
+        parameters = kwargs.pop('parameters', None)
+        self.settings = kwargs
+        self.encoding = self.view.encoding()
+        if self.encoding == 'Undefined':
+            self.encoding = 'UTF-8'
+
+        query = self.__query()
+        if query is None:
+            set_status('No PostgreSQL query selected or under the cursor to load test.')
+            return
+        try:
+            parameters = load_parameters(parameters)
+        except (OSError, IOError, ValueError, TypeError) as e:
+            set_status('PostgreSQL load test parameters not read: ' + str(e))
+            return
+        self.test = PsqlLoadTest(query, int(clients or self.settings.get('loadtest_clients', 4)),
+            float(duration or self.settings.get('loadtest_duration', 10)),
+            int(iterations or self.settings.get('loadtest_iterations', 0) or 0), parameters, self.__progress)
+        self.profile = self.settings.snapshot(self.encoding)
+        self.backend = get_backend(self.settings.get('backend', 'psql'), is_true(self.settings.get('session_pool', 'True')))
+        self.cancellation = PsqlCancellationGroup('load test')
+        self.cancellation.detail = ' '.join(query.split())[:100]
+        self.in_flight = PsqlInFlight.for_window(self.window)
+        self.in_flight.add(self.cancellation)
+
+        # A scheduler of its own with a worker per client, apart from the queries of the editor.
+        batch = PsqlBatch(PsqlScheduler(self.test.clients), 'parallel', self.__client_done)
+        for number in range(self.test.clients):
+            cancellation = self.cancellation.member()
+            batch.add(self.profile.key, lambda cancellation=cancellation: self.__client(cancellation), None)
+        set_status('PostgreSQL load test starting with ' + str(self.test.clients) + ' clients...')
+        self.test.start()
+        batch.start()
+    def __query(self):
+        selections = [self.view.substr(sel) for sel in self.view.sel() if not sel.empty()]
+        if selections:
+            return '\n'.join(selections)
+        if len(self.view.sel()) == 0:
+            return None
+        index = PsqlStatementIndexes.get_or_create(self.view.buffer_id(), lambda begin, end: self.view.substr(Region(begin, end)), self.view.size)
+        query = self.view.substr(Region(*index.statement_at(self.view.sel()[0].begin())))
+        return query if query.strip() else None
+    def __client(self, cancellation):
+        # Pooled sessions and connections are taken back after every run, so each
+        # client keeps working on a warm one; latency counts from the moment the query is sent
+        # until its result is in, leaving out the reset of the session that follows.
+        try:
+            while not cancellation.cancelled:
+                statement = self.test.next_statement()
+                if statement is None:
+                    break
+                output = []
+                stream = PsqlOutputStream(self.encoding, lambda stream, text: text and output.append(text))
+                start = time()
+                try:
+                    retcode = self.backend.execute(self.profile, stream, query=statement, encoding=self.encoding, cancellation=cancellation)
+                except OSError as e:
+                    output.append('psql: error: ' + str(e) + '\n')
+                    retcode = 2
+                except BaseException:
+                    output.append(format_exc())
+                    retcode = 1
+                finally:
+                    stream.close()
+                end = time()
+                if cancellation.cancelled:
+                    break
+                self.test.record((stream.metrics.result_end or end) - (stream.metrics.sent or start), ''.join(output), retcode, bool(stream.metrics.spawn or stream.metrics.connect))
+                # Without a connection the client would only pile up errors.
+                if retcode == 2:
+                    break
+        finally:
+            cancellation.finish()
+    def __progress(self, test):
+        remaining = ' of ' + str(test.iterations) if test.iterations > 0 else ', ' + str(max(0, int(test.duration - test.elapsed))) + ' s left'
+        set_status('PostgreSQL load test: ' + str(test.completed) + remaining + ', ' + '%.1f' % test.throughput + '/s' +
+            (', ' + str(test.failed) + ' failed' if test.failed else '') + '.')
+    def __client_done(self, job, completed, total):
+        if completed == total:
+            self.test.finish()
+            self.cancellation.finish()
+            self.in_flight.remove(self.cancellation)
+            set_timeout(self.__show)
+    def __show(self):
+        test = self.test
+        header = ['PostgreSQL load test of ' + ' '.join(test.query.split())[:200],
+            str(test.clients) + ' clients, ' + (str(test.iterations) + ' iterations' if test.iterations > 0 else '%g' % test.duration + ' s') +
+            (', ' + str(len(test.parameters)) + ' parameter sets' if test.parameters else '') + ', ' + self.settings.get('backend', 'psql') + ' backend' +
+            (' with pooled connections' if self.backend.use_pool else ''), '']
+        if self.cancellation.cancelled:
+            header.insert(2, 'Cancelled before the end.')
+        view = self.window.new_file()
+        view.set_name('PostgreSQL Load Test')
+        view.set_scratch(True)
+        view.run_command('append', {'characters': '\n'.join(header) + '\n' + test.report()})
+        set_status('PostgreSQL load test: ' + str(test.completed) + ' runs, ' + '%.1f' % test.throughput + '/s' +
+            (', ' + str(test.failed) + ' failed' if test.failed else '') + '.')
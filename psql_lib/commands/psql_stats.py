@@ -0,0 +1,61 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from ..plugin import PsqlBaseWindowCommand, set_status, get_execution_log
+from ..metrics import PsqlExecutionLog
+from ..cache import result_cache
+from ..windows import window_registry
+from ..statements import PsqlStatementIndexes
+from ..pool import session_pool
+from ..backend import connection_pool
+from ..lazy import load_times
+
+class PsqlStatsCommand(PsqlBaseWindowCommand):
+    def run(self, *args, **kwargs):
+        statistics = get_execution_log().statistics()
+        resources = window_registry.counters() + [('statement indexes', PsqlStatementIndexes.count()),
+            ('idle psql sessions', session_pool.idle_count()), ('idle native connections', connection_pool.idle_count())]
+        lines = ['Resources: ' + ', '.join(label + ' ' + str(value) for label, value in resources),
+            'Load: %.1f ms for %d commands at startup, ' % (load_times.startup() * 1000, load_times.stubs) +
+            ', '.join('%s %.1f ms' % (name, seconds * 1000) for name, seconds in load_times.modules) + ' on first use', '']
+        if result_cache.hits + result_cache.misses:
+            lines.append('Result cache: ' + str(result_cache.hits) + ' hits, ' + str(result_cache.misses) + ' misses, ' +
+                str(len(result_cache)) + ' results (' + str(result_cache.size) + ' characters), ' + str(result_cache.evictions) + ' evicted')
+            lines.append('')
+        for profile in sorted(statistics):
+            summary = statistics[profile]
+            lines.append(profile + ' (' + str(summary['count']) + ' queries)')
+            lines.append('  ' + ''.ljust(12) + ''.join(column.rjust(12) for column in ('p50', 'p95', 'p99')))
+            for name in PsqlExecutionLog.phases + PsqlExecutionLog.quantities:
+                if name not in summary:
+                    continue
+                if name in PsqlExecutionLog.phases:
+                    values = ['%.1f ms' % (summary[name][percentile] * 1000) for percentile in (50, 95, 99)]
+                else:
+                    values = [str(summary[name][percentile]) for percentile in (50, 95, 99)]
+                lines.append('  ' + name.ljust(12) + ''.join(value.rjust(12) for value in values))
+            lines.append('')
+        view = self.window.new_file()
+        view.set_name('PostgreSQL Execution Statistics')
+        view.set_scratch(True)
+        view.run_command('append', {'characters': '\n'.join(lines)})
+        set_status('PostgreSQL execution statistics for ' + str(len(statistics)) + ' connections.' if statistics else 'No PostgreSQL queries logged yet.')
@@ -0,0 +1,188 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from collections import deque
+from difflib import unified_diff
+from json import loads
+from threading import Lock
+from time import time
+
+def explain_statement(query, analyze=True, buffers=True):
+    query = query.strip()
+    while query.endswith(';'):
+        query = query[:-1].rstrip()
+    options = (['ANALYZE'] if analyze else []) + (['BUFFERS'] if buffers else []) + ['FORMAT JSON']
+    return 'EXPLAIN (' + ', '.join(options) + ')\n' + query
+
+def format_ms(value):
+    return '-' if value is None else '%.3f' % value
+
+class PsqlPlanNode(object):
+    def __init__(self, plan, depth=0):
+        self.depth = depth
+        self.node_type = plan.get('Node Type', '?')
+        self.relationship = plan.get('Parent Relationship')
+        self.label = self.__label(plan)
+        self.loops = plan.get('Actual Loops')
+        self.total_time = plan.get('Actual Total Time')
+        self.actual_rows = plan.get('Actual Rows')
+        self.plan_rows = plan.get('Plan Rows')
+        self.shared_hit = plan.get('Shared Hit Blocks')
+        self.shared_read = plan.get('Shared Read Blocks')
+        self.children = [PsqlPlanNode(child, depth + 1) for child in plan.get('Plans', [])]
+
+    @staticmethod
+    def __label(plan):
+        label = plan.get('Node Type', '?')
+        if plan.get('Join Type', 'Inner') != 'Inner':
+            label = label.replace('Join', plan['Join Type'] + ' Join') if 'Join' in label else label + ' ' + plan['Join Type'] + ' Join'
+        if plan.get('Strategy') in ('Hashed', 'Sorted') and label == 'Aggregate':
+            label = ('Hash' if plan['Strategy'] == 'Hashed' else 'Group') + 'Aggregate'
+        if 'Index Name' in plan:
+            label += ' using ' + plan['Index Name']
+        if 'Relation Name' in plan:
+            label += ' on ' + plan['Relation Name']
+            if plan.get('Alias', plan['Relation Name']) != plan['Relation Name']:
+                label += ' ' + plan['Alias']
+        elif 'CTE Name' in plan:
+            label += ' on ' + plan['CTE Name']
+        return label
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+    @property
+    def inclusive_time(self):
+        if self.total_time is None or self.loops is None:
+            return None
+        return self.total_time * self.loops
+
+    @property
+    def self_time(self):
+        # Times are per loop, so each node counts loops times; with parallel
+        # workers the children can add up to more than the node, hence the floor.
+        if self.inclusive_time is None:
+            return None
+        children = sum(child.inclusive_time or 0 for child in self.children if child.relationship != 'InitPlan')
+        return max(self.inclusive_time - children, 0.0)
+
+    @property
+    def estimate_factor(self):
+        # How many times more (above 1) or fewer (below 1) rows came than were estimated.
+        if self.actual_rows is None or self.plan_rows is None or not self.loops:
+            return None
+        return max(self.actual_rows, 1) / float(max(self.plan_rows, 1))
+
+    @property
+    def hit_ratio(self):
+        if self.shared_hit is None or self.shared_read is None or self.shared_hit + self.shared_read == 0:
+            return None
+        return self.shared_hit / float(self.shared_hit + self.shared_read)
+
+class PsqlPlan(object):
+    def __init__(self, document):
+        top = document[0] if isinstance(document, list) else document
+        self.root = PsqlPlanNode(top['Plan'])
+        self.planning_time = top.get('Planning Time')
+        self.execution_time = top.get('Execution Time')
+        self.nodes = list(self.root.walk())
+        self.created = time()
+
+    @classmethod
+    def parse(cls, text):
+        return cls(loads(text))
+
+    @property
+    def total_time(self):
+        return self.execution_time if self.execution_time is not None else self.root.inclusive_time
+
+    def hotspots(self, count):
+        timed = [node for node in self.nodes if node.self_time]
+        return sorted(timed, key=lambda node: node.self_time, reverse=True)[:count]
+
+    def shape(self):
+        return ['  ' * node.depth + node.label for node in self.nodes]
+
+    def render(self, hotspots=3):
+        # Returns the text and the (begin, end) offsets of the hotspot lines.
+        ranks = dict((id(node), rank) for rank, node in enumerate(self.hotspots(hotspots), 1))
+        total = self.total_time
+        lines = ['Execution ' + format_ms(self.execution_time) + ' ms, planning ' + format_ms(self.planning_time) + ' ms\n\n',
+            '%-3s %10s %6s %12s %12s %6s  %s\n' % ('', 'self ms', 'self%', 'rows', 'estimate', 'hit%', 'node')]
+        regions = []
+        offset = sum(len(line) for line in lines)
+        for node in self.nodes:
+            rank = ranks.get(id(node))
+            factor = node.estimate_factor
+            if factor is None:
+                estimate = '-'
+            elif 0.5 <= factor <= 2:
+                estimate = 'ok'
+            else:
+                estimate = ('x%.0f under' % factor) if factor > 1 else ('x%.0f over' % (1 / factor))
+            line = '%-3s %10s %6s %12s %12s %6s  %s%s\n' % (
+                '#' + str(rank) if rank else '',
+                format_ms(node.self_time),
+                '%.1f' % (node.self_time * 100 / total) if node.self_time is not None and total else '-',
+                '-' if node.actual_rows is None else str(int(node.actual_rows * (node.loops or 1))),
+                estimate,
+                '-' if node.hit_ratio is None else '%.0f' % (node.hit_ratio * 100),
+                '   ' * node.depth + ('->  ' if node.depth else ''),
+                node.label)
+            if rank:
+                regions.append((offset, offset + len(line) - 1))
+            lines.append(line)
+            offset += len(line)
+        return ''.join(lines), regions
+
+def compare_plans(before, after):
+    before_time, after_time = before.total_time, after.total_time
+    lines = ['Compared with the plan of ' + str(int((after.created - before.created) / 60)) + ' minutes before: ']
+    if before_time and after_time is not None:
+        lines[0] += format_ms(before_time) + ' ms -> ' + format_ms(after_time) + ' ms (%+.1f%%)\n' % ((after_time - before_time) * 100 / before_time)
+    else:
+        lines[0] += 'no timing to compare\n'
+    diff = list(unified_diff(before.shape(), after.shape(), 'before', 'after', lineterm='', n=1))
+    lines.append('\n'.join(diff) + '\n' if diff else 'Plan shape unchanged.\n')
+    return ''.join(lines)
+
+class PsqlPlanHistory(object):
+    # The last plans of every statement, by connection and normalized text.
+    def __init__(self, size=5):
+        self.size = size
+        self.__plans = {}
+        self.__lock = Lock()
+
+    def add(self, key, plan):
+        with self.__lock:
+            plans = self.__plans.get(key)
+            if plans is None or plans.maxlen != self.size:
+                plans = self.__plans[key] = deque(plans or (), max(self.size, 1))
+            plans.append(plan)
+
+    def plans(self, key):
+        with self.__lock:
+            return list(self.__plans.get(key, ()))
+
+plan_history = PsqlPlanHistory()
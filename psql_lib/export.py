@@ -0,0 +1,132 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from gzip import GzipFile
+from os import remove, replace
+from time import time
+from .statements import split_statements
+from .cache import normalize
+
+formats = {
+    'csv': "FORMAT csv",
+    'tsv': "FORMAT csv, DELIMITER E'\\t'",
+    'binary': "FORMAT binary"
+}
+
+def export_format(path):
+    # Picks format and compression from the file name, e.g. rows.tsv.gz.
+    name = path.lower()
+    compress = name.endswith('.gz')
+    if compress:
+        name = name[:-3]
+    if name.endswith('.tsv') or name.endswith('.tab'):
+        return 'tsv', compress
+    if name.endswith('.bin') or name.endswith('.copy'):
+        return 'binary', compress
+    return 'csv', compress
+
+def single_statement(query):
+    # The one statement in query, ignoring pieces that are only comments or white space, or None.
+    statements = [statement for statement in split_statements(query) if normalize(statement)]
+    return statements[0] if len(statements) == 1 else None
+
+def copy_statement(query, format='csv', header=True):
+    if format not in formats:
+        raise ValueError('Export format ' + format + ' not recognized.')
+    query = query.strip()
+    while query.endswith(';'):
+        query = query[:-1].rstrip()
+    options = formats[format] + (', HEADER' if header and format != 'binary' else '')
+    return 'COPY (' + query + '\n) TO STDOUT WITH (' + options + ')'
+
+def format_bytes(size):
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return (str(int(size)) if unit == 'bytes' else '%.1f' % size) + ' ' + unit
+        size /= 1024.0
+
+class PsqlExport(object):
+    # Data is written in fixed-size chunks to a temporary file that replaces the
+    # target only when the export succeeded.
+    chunk_size = 1048576
+    progress_interval = 0.5
+
+    def __init__(self, path, compress=False, on_progress=None):
+        self.path = path
+        self.compress = compress
+        self.on_progress = on_progress
+        self.size = 0
+        self.written = 0
+        self.start_time = None
+        self.end_time = None
+        self.__buffer = bytearray()
+        self.__file = None
+        self.__reported = 0
+
+    @property
+    def elapsed(self):
+        return ((self.end_time or time()) - self.start_time) if self.start_time is not None else 0.0
+
+    @property
+    def rate(self):
+        return self.size / max(self.elapsed, 0.001)
+
+    def open(self):
+        self.start_time = time()
+        self.__file = open(self.path + '.part', 'wb')
+        if self.compress:
+            self.__file = GzipFile(filename='', mode='wb', compresslevel=6, fileobj=self.__file)
+
+    def write(self, data):
+        self.size += len(data)
+        self.__buffer += data
+        while len(self.__buffer) >= self.chunk_size:
+            self.__write(self.chunk_size)
+        now = time()
+        if self.on_progress is not None and now - self.__reported >= self.progress_interval:
+            self.__reported = now
+            self.on_progress(self)
+
+    def __write(self, size):
+        self.__file.write(self.__buffer[:size])
+        del self.__buffer[:size]
+        self.written += size
+
+    def close(self, succeeded):
+        if self.__file is None:
+            return
+        try:
+            if succeeded and self.__buffer:
+                self.__write(len(self.__buffer))
+            fileobj = getattr(self.__file, 'fileobj', None)
+            self.__file.close()
+            if fileobj is not None:
+                fileobj.close()
+        finally:
+            self.end_time = time()
+            if succeeded:
+                replace(self.path + '.part', self.path)
+            else:
+                try:
+                    remove(self.path + '.part')
+                except OSError:
+                    pass
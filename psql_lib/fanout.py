@@ -0,0 +1,108 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from fnmatch import fnmatchcase
+from time import time
+from .grid import PsqlResultTable
+from .cache import has_error
+
+def menu_connections(menu, found=None):
+    # Connections defined in a menu: entries running psql_conn_new or psql_conn with arguments.
+    found = [] if found is None else found
+    for item in menu if isinstance(menu, list) else []:
+        if not isinstance(item, dict):
+            continue
+        if item.get('command') in ('psql_conn_new', 'psql_conn') and item.get('args'):
+            found.append((item.get('caption') or item.get('id') or '', dict(item['args'])))
+        menu_connections(item.get('children'), found)
+    return found
+
+def select_targets(connections, names=None, pattern=None):
+    # connections is a list of (name, arguments); names match exactly, patterns are
+    # shell style (shard-*) and case insensitive. Later definitions of a name win.
+    named = {}
+    for name, args in connections:
+        named[name] = args
+    if names:
+        missing = [name for name in names if name not in named]
+        if missing:
+            raise KeyError('Connections not found: ' + ', '.join(missing))
+        return [(name, named[name]) for name in names]
+    pattern = (pattern or '*').lower()
+    return [(name, args) for name, args in named.items() if fnmatchcase(name.lower(), pattern)]
+
+class PsqlFanoutTarget(object):
+    def __init__(self, name, profile):
+        self.name = name
+        self.profile = profile
+        self.tables = []
+        self.messages = []
+        self.retcode = None
+        self.cancelled = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def elapsed(self):
+        return (self.end_time or time()) - (self.start_time or time())
+
+    @property
+    def failed(self):
+        # The native backend reports SQL errors as output, like psql without ON_ERROR_STOP.
+        return self.retcode != 0 or self.cancelled is not None or has_error(self.message)
+
+    @property
+    def message(self):
+        return ''.join(self.messages).strip()
+
+class PsqlFanout(object):
+    def __init__(self, targets):
+        self.targets = targets
+
+    @property
+    def failed(self):
+        return [target for target in self.targets if target.failed]
+
+    def summary(self):
+        table = PsqlResultTable(['source', 'status', 'ms', 'rows', 'message'])
+        for target in self.targets:
+            status = 'timeout' if target.cancelled == 'timeout' else 'cancelled' if target.cancelled else 'failed' if target.failed else 'ok'
+            message = target.message.splitlines()
+            table.append([target.name, status, str(int(target.elapsed * 1000)), str(sum(result.row_count for result in target.tables)),
+                ' '.join(line.strip() for line in message if line.strip())[:500] or None])
+        return table.compact()
+
+    def merged(self):
+        # The nth result of every target goes into one table with the target in front;
+        # targets whose nth result has other columns get a table of their own.
+        merged = []
+        tables = {}
+        for target in self.targets:
+            for position, result in enumerate(target.tables):
+                key = (position, tuple(result.columns))
+                if key not in tables:
+                    tables[key] = PsqlResultTable(['source'] + result.columns)
+                    merged.append(tables[key])
+                table = tables[key]
+                for row in range(result.row_count):
+                    table.append([target.name] + [result.cell(row, column) for column in range(len(result.columns))])
+        return [table.compact() for table in merged]
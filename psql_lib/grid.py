@@ -0,0 +1,391 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from array import array
+from threading import Lock
+
+NULL = '\x1d'
+RESULT_MARKER = '\x1d\x1dRESULT'
+
+class PsqlIntColumn(object):
+    numeric = True
+
+    def __init__(self, values, nulls):
+        self.values = values
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.values)
+
+    def is_null(self, row):
+        return self.nulls is not None and self.nulls[row]
+
+    def text(self, row):
+        return None if self.is_null(row) else str(self.values[row])
+
+    def sort_key(self, row):
+        return (1, 0) if self.is_null(row) else (0, self.values[row])
+
+class PsqlFloatColumn(PsqlIntColumn):
+    def text(self, row):
+        return None if self.is_null(row) else repr(self.values[row])
+
+class PsqlDictionaryColumn(object):
+    # Repeated values are stored once; rows only keep a code into the dictionary.
+    def __init__(self, codes, values, numeric=False):
+        self.codes = codes
+        self.values = values
+        self.numeric = numeric
+        self.__keys = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def is_null(self, row):
+        return self.values[self.codes[row]] is None
+
+    def text(self, row):
+        return self.values[self.codes[row]]
+
+    def sort_key(self, row):
+        if self.__keys is None:
+            self.__keys = [(1, 0) if value is None else (0, float(value) if self.numeric else value) for value in self.values]
+        return self.__keys[self.codes[row]]
+
+    def matcher(self, needle):
+        matching = set(code for code, value in enumerate(self.values) if value is not None and needle in value.lower())
+        return lambda row: self.codes[row] in matching
+
+class PsqlTextColumn(object):
+    def __init__(self, values, numeric=False):
+        self.values = values
+        self.numeric = numeric
+
+    def __len__(self):
+        return len(self.values)
+
+    def is_null(self, row):
+        return self.values[row] is None
+
+    def text(self, row):
+        return self.values[row]
+
+    def sort_key(self, row):
+        value = self.values[row]
+        return (1, 0) if value is None else (0, float(value) if self.numeric else value)
+
+def compact_column(values):
+    # values are strings or None; pick the smallest representation that keeps them.
+    present = [value for value in values if value is not None]
+    nulls = bytearray(1 if value is None else 0 for value in values) if len(present) < len(values) else None
+    # Numbers are only stored as such when they print back exactly as psql printed them,
+    # other numeric text (numeric(10,2), huge integers) is kept as text but sorted as numbers.
+    for typecode, parse, show in (('q', int, str), ('d', float, repr)):
+        try:
+            parsed = array(typecode, (parse(value) if value is not None else 0 for value in values))
+        except (ValueError, OverflowError):
+            continue
+        if all(value is None or show(number) == value for value, number in zip(values, parsed)):
+            return (PsqlIntColumn if typecode == 'q' else PsqlFloatColumn)(parsed, nulls)
+    try:
+        numeric = bool(present) and all(float(value) == float(value) for value in present)
+    except ValueError:
+        numeric = False
+
+    dictionary = {}
+    for value in present:
+        if value not in dictionary:
+            dictionary[value] = len(dictionary)
+            if len(dictionary) > max(1024, len(values) // 2):
+                return PsqlTextColumn(list(values), numeric)
+    codes = array('I')
+    table = [None] * len(dictionary)
+    for value, code in dictionary.items():
+        table[code] = value
+    null_code = None
+    for value in values:
+        if value is None:
+            if null_code is None:
+                null_code = len(table)
+                table.append(None)
+            codes.append(null_code)
+        else:
+            codes.append(dictionary[value])
+    return PsqlDictionaryColumn(codes, table, numeric)
+
+class PsqlResultTable(object):
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.__pending = [[] for column in self.columns]
+        self.__interned = [{} for column in self.columns]
+        self.data = None
+
+    def append(self, row):
+        for index, value in enumerate(row[:len(self.columns)]):
+            if value is not None:
+                interned = self.__interned[index]
+                value = interned.setdefault(value, value) if len(interned) < 65536 else value
+            self.__pending[index].append(value)
+        for index in range(len(row), len(self.columns)):
+            self.__pending[index].append(None)
+
+    def compact(self):
+        self.data = [compact_column(values) for values in self.__pending]
+        self.__pending = None
+        self.__interned = None
+        return self
+
+    @property
+    def row_count(self):
+        return len(self.data[0]) if self.data else 0
+
+    def cell(self, row, column):
+        return self.data[column].text(row)
+
+    def order(self, sort_column=None, descending=False, needle=None, filter_column=None):
+        rows = range(self.row_count)
+        if needle:
+            needle = needle.lower()
+            columns = self.data if filter_column is None else [self.data[filter_column]]
+            matchers = [column.matcher(needle) if hasattr(column, 'matcher') else
+                (lambda column: lambda row: needle in (column.text(row) or '').lower())(column) for column in columns]
+            rows = [row for row in rows if any(matches(row) for matches in matchers)]
+        if sort_column is not None:
+            rows = sorted(rows, key=self.data[sort_column].sort_key, reverse=descending)
+        return array('I', rows)
+
+class PsqlUnalignedParser(object):
+    # Parses psql -A output with \x1f between fields, \x1e between records and an
+    # \echo RESULT_MARKER line before every statement.
+    __marker_line = RESULT_MARKER + '\n'
+
+    def __init__(self, on_table):
+        self.on_table = on_table
+        self.__buffer = []
+        self.__tail = ''
+
+    def feed(self, text):
+        self.__buffer.append(text)
+        # The marker can be split across chunks, so the end of the earlier ones is searched too.
+        recent = self.__tail + text
+        if self.__marker_line not in recent:
+            self.__tail = recent[-(len(self.__marker_line) - 1):]
+            return
+        sections = ''.join(self.__buffer).split(self.__marker_line)
+        for section in sections[:-1]:
+            self.__section(section)
+        self.__buffer = [sections[-1]]
+        self.__tail = sections[-1][-(len(self.__marker_line) - 1):]
+
+    def close(self):
+        for section in ''.join(self.__buffer).split(self.__marker_line):
+            self.__section(section)
+        self.__buffer = []
+        self.__tail = ''
+
+    def __section(self, section):
+        if section.endswith('\n'):
+            section = section[:-1]
+        if not section:
+            return
+        records = section.split('\x1e')
+        table = PsqlResultTable(records[0].split('\x1f'))
+        for record in records[1:]:
+            table.append([None if value == NULL else value for value in record.split('\x1f')])
+        self.on_table(table.compact())
+
+def marked_statements(statements):
+    return ''.join('\\echo ' + RESULT_MARKER + '\n' + statement.rstrip() + '\n' for statement in statements)
+
+class PsqlTableCollector(object):
+    # Result handler for PgConnection that builds tables instead of text.
+    def __init__(self, on_table, write, format_value):
+        self.on_table = on_table
+        self.write = write
+        self.format_value = format_value
+        self.__table = None
+
+    def description(self, columns, type_oids):
+        self.__table = PsqlResultTable(columns)
+
+    def row(self, values):
+        self.__table.append([None if value is None else self.format_value(value) for value in values])
+
+    def complete(self, command_tag):
+        if self.__table is None:
+            self.write(command_tag + '\n')
+        else:
+            self.on_table(self.__table.compact())
+        self.__table = None
+
+    def notice(self, notice):
+        self.write(notice.format())
+
+    def copy_out(self, data):
+        self.write(data.decode('utf-8', 'replace'))
+
+    def copy_in(self):
+        return iter(())
+
+class PsqlGridState(object):
+    __windows = {}
+
+    @classmethod
+    def for_window(cls, window):
+        if window.id() not in cls.__windows:
+            cls.__windows[window.id()] = cls()
+        return cls.__windows[window.id()]
+
+    @classmethod
+    def window_ids(cls):
+        return list(cls.__windows)
+
+    @classmethod
+    def window_closed(cls, window_id):
+        cls.__windows.pop(window_id, None)
+
+    @classmethod
+    def counters(cls):
+        grids = list(cls.__windows.values())
+        return [('grid results', sum(len(grid.results) for grid in grids)),
+            ('grid rows', sum(table.row_count for grid in grids for label, table in grid.results))]
+
+    def __init__(self):
+        self.results = []
+        self.current = 0
+        self.page = 0
+        self.page_size = 100
+        self.column_width = 60
+        self.sort_column = None
+        self.descending = False
+        self.needle = None
+        self.rows = None
+        self.__lock = Lock()
+
+    def reset(self, page_size=100, column_width=60):
+        with self.__lock:
+            self.results = []
+            self.page_size = max(1, page_size)
+            self.column_width = max(4, column_width)
+            self.select(0)
+
+    def add(self, table, label=None):
+        with self.__lock:
+            self.results.append((label or 'result ' + str(len(self.results) + 1), table))
+            return len(self.results) - 1
+
+    def preview(self, index):
+        # First page in query order, for the output of the run itself.
+        label, table = self.results[index]
+        last = min(table.row_count, self.page_size)
+        caption = label + ': ' + str(table.row_count) + (' row' if table.row_count == 1 else ' rows')
+        if last < table.row_count:
+            caption += ', showing 1-' + str(last) + ' (page 1 of ' + str(-(-table.row_count // self.page_size)) + ')'
+        return render_page(table, range(last), self.column_width, caption)
+
+    @property
+    def table(self):
+        return self.results[self.current][1] if self.current < len(self.results) else None
+
+    def select(self, index):
+        self.current = index
+        self.page = 0
+        self.sort_column = None
+        self.descending = False
+        self.needle = None
+        self.rows = None
+
+    def sort(self, column, descending=False):
+        self.sort_column = column
+        self.descending = descending
+        self.page = 0
+        self.rows = None
+
+    def filter(self, needle):
+        self.needle = needle or None
+        self.page = 0
+        self.rows = None
+
+    @property
+    def visible_rows(self):
+        if self.rows is None:
+            table = self.table
+            if self.sort_column is None and self.needle is None:
+                return table.row_count
+            self.rows = table.order(self.sort_column, self.descending, self.needle)
+        return len(self.rows)
+
+    @property
+    def pages(self):
+        return max(1, -(-self.visible_rows // self.page_size))
+
+    def move(self, page):
+        self.page = max(0, min(self.pages - 1, page))
+
+    def render(self, index=None):
+        if index is not None and index != self.current:
+            self.select(index)
+        table = self.table
+        if table is None:
+            return ''
+        label = self.results[self.current][0]
+        count = self.visible_rows
+        first = self.page * self.page_size
+        last = min(count, first + self.page_size)
+        rows = range(first, last) if self.rows is None else [self.rows[position] for position in range(first, last)]
+        return render_page(table, rows, self.column_width, self.__caption(label, table, count, first, last))
+
+    def __caption(self, label, table, count, first, last):
+        caption = (label + ': ' if label else '') + str(table.row_count) + (' row' if table.row_count == 1 else ' rows')
+        if count:
+            caption += ', showing ' + str(first + 1) + '-' + str(last) + ' (page ' + str(self.page + 1) + ' of ' + str(self.pages) + ')'
+        details = []
+        if self.sort_column is not None:
+            details.append('sorted by ' + table.columns[self.sort_column] + (' descending' if self.descending else ''))
+        if self.needle is not None:
+            details.append(str(count) + ' matching "' + self.needle + '"')
+        if len(self.results) > 1:
+            details.append('result ' + str(self.current + 1) + ' of ' + str(len(self.results)))
+        return caption + (' [' + ', '.join(details) + ']' if details else '')
+
+def render_page(table, rows, column_width, caption):
+    def shown(value):
+        if value is None:
+            return ''
+        value = value.replace('\r', '').replace('\n', '↵').replace('\t', ' ')
+        return value if len(value) <= column_width else value[:column_width - 1] + '…'
+
+    cells = [[shown(table.cell(row, column)) for column in range(len(table.columns))] for row in rows]
+    headers = [shown(name) for name in table.columns]
+    widths = [len(header) for header in headers]
+    for row in cells:
+        for index, value in enumerate(row):
+            if len(value) > widths[index]:
+                widths[index] = len(value)
+    numeric = [column.numeric for column in table.data]
+    lines = ['-- ' + caption + ' --',
+        ' ' + ' | '.join(header.center(widths[index]) for index, header in enumerate(headers)),
+        '+'.join('-' * (width + 2) for width in widths)]
+    for row in cells:
+        lines.append((' ' + ' | '.join(value.rjust(widths[index]) if numeric[index] else value.ljust(widths[index])
+            for index, value in enumerate(row))).rstrip())
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,214 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from os import makedirs
+from os.path import dirname, exists
+from re import compile as re_compile
+from threading import Thread, Lock
+from time import time
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+try:
+    import sqlite3
+except ImportError:
+    # Some builds of Sublime Text ship Python without sqlite3.
+    sqlite3 = None
+
+__word = re_compile(r'\w+')
+
+def search_words(text):
+    return __word.findall(text)
+
+def match_expression(text):
+    # Every word must match, as a prefix; operators in the text are ignored.
+    return ' '.join(word.lower() + '*' for word in search_words(text))
+
+class PsqlHistoryEntry(object):
+    __slots__ = ('id', 'created', 'profile', 'sql', 'duration', 'rows', 'retcode', 'preview')
+
+    def __init__(self, id, created, profile, sql, duration, rows, retcode, preview):
+        self.id = id
+        self.created = created
+        self.profile = profile
+        self.sql = sql
+        self.duration = duration
+        self.rows = rows
+        self.retcode = retcode
+        self.preview = preview
+
+class PsqlHistory(object):
+    # Executions are written by a thread of their own, so that neither the UI nor the
+    # queries wait for the disk; searches open a connection of their own.
+    prune_interval = 100
+    __columns = 'history.id, created, history.profile, history.sql, duration, rows, retcode, preview'
+    __tables = [
+        'CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, created REAL NOT NULL, profile TEXT NOT NULL, sql TEXT NOT NULL, '
+            'duration REAL, rows INTEGER, retcode INTEGER, preview TEXT NOT NULL, size INTEGER NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS history_created ON history (created)'
+    ]
+    # The text index keeps no copy of the text, triggers keep it in step with the table.
+    __indexes = [
+        ('fts5', [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS history_text USING fts5(sql, profile, content='history', content_rowid='id')",
+            'CREATE TRIGGER IF NOT EXISTS history_text_insert AFTER INSERT ON history BEGIN '
+                'INSERT INTO history_text (rowid, sql, profile) VALUES (new.id, new.sql, new.profile); END',
+            'CREATE TRIGGER IF NOT EXISTS history_text_delete AFTER DELETE ON history BEGIN '
+                "INSERT INTO history_text (history_text, rowid, sql, profile) VALUES ('delete', old.id, old.sql, old.profile); END"
+        ]),
+        ('fts4', [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS history_text USING fts4(sql, profile, content='history')",
+            'CREATE TRIGGER IF NOT EXISTS history_text_insert AFTER INSERT ON history BEGIN '
+                'INSERT INTO history_text (docid, sql, profile) VALUES (new.id, new.sql, new.profile); END',
+            'CREATE TRIGGER IF NOT EXISTS history_text_delete BEFORE DELETE ON history BEGIN '
+                'DELETE FROM history_text WHERE docid = old.id; END'
+        ])
+    ]
+
+    def __init__(self, path, max_age=90, max_size=50000000, preview_size=2000):
+        self.path = path
+        self.max_age = max_age
+        self.max_size = max_size
+        self.preview_size = preview_size
+        self.error = None
+        self.on_error = None
+        self.text_index = None
+        self.__queue = Queue()
+        self.__writer = None
+        self.__lock = Lock()
+
+    @staticmethod
+    def available():
+        return sqlite3 is not None
+
+    def add(self, profile, sql, duration, rows, retcode, preview):
+        if sqlite3 is None:
+            return
+        self.__queue.put((time(), profile, sql, duration, rows, retcode, preview[:self.preview_size]))
+        with self.__lock:
+            if self.__writer is None:
+                self.__writer = Thread(target=self.__write)
+                self.__writer.daemon = True
+                self.__writer.start()
+
+    def flush(self):
+        self.__queue.join()
+
+    def __connect(self):
+        directory = dirname(self.path)
+        if directory and not exists(directory):
+            makedirs(directory)
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def __create(self, connection):
+        if connection.execute("SELECT count(*) FROM sqlite_master WHERE name = 'history'").fetchone()[0] == 0:
+            # Space of pruned entries is handed back to the file system bit by bit.
+            connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        for statement in self.__tables:
+            connection.execute(statement)
+        for kind, statements in self.__indexes:
+            try:
+                for statement in statements:
+                    connection.execute(statement)
+                self.text_index = kind
+                break
+            except sqlite3.OperationalError:
+                pass
+        connection.commit()
+
+    def __write(self):
+        connection = None
+        written = 0
+        while True:
+            entry = self.__queue.get()
+            try:
+                if connection is None:
+                    connection = self.__connect()
+                    self.__create(connection)
+                    self.prune(connection)
+                created, profile, sql, duration, rows, retcode, preview = entry
+                connection.execute('INSERT INTO history (created, profile, sql, duration, rows, retcode, preview, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (created, profile, sql, duration, rows, retcode, preview, len(sql) + len(preview)))
+                connection.commit()
+                written += 1
+                if written % self.prune_interval == 0:
+                    self.prune(connection)
+            except Exception as e:
+                self.error = str(e)
+                if self.on_error is not None:
+                    self.on_error(self)
+                if connection is not None:
+                    connection.close()
+                connection = None
+            finally:
+                self.__queue.task_done()
+
+    def prune(self, connection):
+        # Drops entries older than max_age days, then the oldest until the text takes at most max_size characters.
+        if self.max_age > 0:
+            connection.execute('DELETE FROM history WHERE created < ?', (time() - self.max_age * 86400,))
+        if self.max_size > 0:
+            total = 0
+            cutoff = None
+            for id, size in connection.execute('SELECT id, size FROM history ORDER BY id DESC'):
+                total += size
+                if total > self.max_size:
+                    cutoff = id
+                    break
+            if cutoff is not None:
+                connection.execute('DELETE FROM history WHERE id <= ?', (cutoff,))
+        connection.commit()
+        connection.execute('PRAGMA incremental_vacuum')
+
+    def search(self, text='', limit=200):
+        # The latest entries matching every word of text, or the latest of all without text.
+        if sqlite3 is None or not exists(self.path):
+            return []
+        connection = self.__connect()
+        try:
+            if self.text_index is None:
+                self.__create(connection)
+            expression = match_expression(text)
+            if not expression:
+                cursor = connection.execute('SELECT ' + self.__columns + ' FROM history ORDER BY id DESC LIMIT ?', (limit,))
+            elif self.text_index is not None:
+                # The text index hands out its matches newest first without sorting them all.
+                cursor = connection.execute('SELECT ' + self.__columns + ' FROM (SELECT rowid AS id FROM history_text WHERE history_text MATCH ? '
+                    'ORDER BY rowid DESC LIMIT ?) AS found JOIN history ON history.id = found.id ORDER BY history.id DESC', (expression, limit))
+            else:
+                words = search_words(text)
+                cursor = connection.execute('SELECT ' + self.__columns + ' FROM history WHERE ' + ' AND '.join(['(sql LIKE ? OR profile LIKE ?)'] * len(words)) +
+                    ' ORDER BY id DESC LIMIT ?', [pattern for word in words for pattern in ('%' + word + '%',) * 2] + [limit])
+            return [PsqlHistoryEntry(*row) for row in cursor]
+        finally:
+            connection.close()
+
+    def count(self):
+        if sqlite3 is None or not exists(self.path):
+            return 0
+        connection = self.__connect()
+        try:
+            return connection.execute('SELECT count(*) FROM history').fetchone()[0]
+        finally:
+            connection.close()
@@ -0,0 +1,196 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from gzip import GzipFile
+from os.path import getsize, basename
+from threading import Lock
+from time import time
+from re import compile as re_compile
+from .export import formats, format_bytes
+
+command_tag = re_compile(r'^COPY (\d+)$')
+name_part = re_compile(r'"(?:[^"]|"")*"|[^.]+')
+plain_name = re_compile(r'^[^\W\d][\w$]*$')
+
+def quote_table(table):
+    # Quotes the parts of a possibly schema qualified name that are not plain identifiers
+    # (a table named after my-data.csv), leaving quoted and plain parts as they are.
+    parts = [part.strip() for part in name_part.findall(table)]
+    return '.'.join(part if part.startswith('"') or plain_name.match(part) else '"' + part.replace('"', '""') + '"' for part in parts)
+
+def import_table(path):
+    # What is left of the file name is one identifier: sales.2024.csv names table "sales.2024",
+    # not table 2024 in schema sales.
+    name = basename(path)
+    while '.' in name and name.rsplit('.', 1)[1].lower() in ('gz', 'csv', 'tsv', 'tab', 'txt', 'bin', 'copy'):
+        name = name.rsplit('.', 1)[0]
+    return name if plain_name.match(name) else '"' + name.replace('"', '""') + '"'
+
+def copy_from_statement(table, format='csv', header=True):
+    if format not in formats:
+        raise ValueError('Import format ' + format + ' not recognized.')
+    options = formats[format] + (', HEADER' if header and format != 'binary' else '')
+    return 'COPY ' + quote_table(table) + ' FROM STDIN WITH (' + options + ')'
+
+def split_ranges(path, parts, block_size=1048576):
+    # Cuts the file into parts byte ranges that end at row boundaries. Quotes are
+    # counted from the start of the file so that newlines inside quoted CSV values
+    # ("" escapes keep the count even) never end a range.
+    size = getsize(path)
+    targets = [size * part // parts for part in range(1, parts)]
+    cuts = [0]
+    quotes = 0
+    offset = 0
+    with open(path, 'rb') as datafile:
+        for block in iter(lambda: datafile.read(block_size), b''):
+            position = 0
+            while targets and offset + len(block) > targets[0]:
+                position = max(position, targets[0] - offset, 0)
+                newline = block.find(b'\n', position)
+                while newline >= 0 and (quotes + block.count(b'"', 0, newline)) % 2:
+                    newline = block.find(b'\n', newline + 1)
+                if newline < 0:
+                    break
+                cut = offset + newline + 1
+                if cut > cuts[-1]:
+                    cuts.append(cut)
+                targets.pop(0)
+                position = newline + 1
+            quotes += block.count(b'"')
+            offset += len(block)
+    if size > cuts[-1]:
+        cuts.append(size)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+class PsqlImportChunk(object):
+    def __init__(self, number, path, start=0, end=None, compressed=False):
+        self.number = number
+        self.path = path
+        self.start = start
+        self.end = end
+        self.compressed = compressed
+        self.sent = 0
+        self.lines = 0
+        self.rows = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+
+    def byte_range(self):
+        return str(self.start) + '-' + str(self.end)
+
+    def describe(self):
+        if self.end is None:
+            return 'chunk ' + str(self.number)
+        return 'chunk ' + str(self.number) + ' (bytes ' + self.byte_range() + ')'
+
+    def blocks(self, on_block, block_size=65536):
+        # Streams the range in small blocks so that memory use does not depend on the file size.
+        with open(self.path, 'rb') as datafile:
+            source = GzipFile(fileobj=datafile, mode='rb') if self.compressed else datafile
+            source.seek(self.start)
+            remaining = self.end - self.start if self.end is not None else None
+            while remaining is None or remaining > 0:
+                block = source.read(block_size if remaining is None else min(block_size, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                self.sent += len(block)
+                self.lines += block.count(b'\n')
+                on_block()
+                yield block
+
+    def finish(self, retcode, output):
+        self.end_time = time()
+        rows = [int(match.group(1)) for match in map(command_tag.match, output.splitlines()) if match]
+        if retcode == 0 and rows:
+            self.rows = rows[-1]
+        else:
+            self.error = output.strip() or 'psql exited with ' + str(retcode)
+
+class PsqlImport(object):
+    progress_interval = 0.5
+
+    def __init__(self, path, table, format, header=True, parallel=1, compressed=False, on_progress=None):
+        self.path = path
+        self.table = table
+        self.format = format
+        self.on_progress = on_progress
+        self.start_time = time()
+        self.size = getsize(path)
+        self.__reported = 0
+        self.__lock = Lock()
+        # Compressed and binary files can't be cut at row boundaries without reading them.
+        if parallel > 1 and not compressed and format != 'binary' and self.size > 0:
+            ranges = split_ranges(path, parallel)
+        else:
+            ranges = [(0, None)]
+        self.chunks = [PsqlImportChunk(number, path, start, end, compressed) for number, (start, end) in enumerate(ranges, 1)]
+        self.statements = [copy_from_statement(table, format, header and chunk.start == 0) for chunk in self.chunks]
+
+    @property
+    def sent(self):
+        return sum(chunk.sent for chunk in self.chunks)
+
+    @property
+    def rows(self):
+        return sum(chunk.rows if chunk.rows is not None else chunk.lines for chunk in self.chunks)
+
+    @property
+    def elapsed(self):
+        return time() - self.start_time
+
+    @property
+    def failed(self):
+        return [chunk for chunk in self.chunks if chunk.error is not None]
+
+    def block_sent(self):
+        now = time()
+        if self.on_progress is not None and now - self.__reported >= self.progress_interval:
+            with self.__lock:
+                if now - self.__reported < self.progress_interval:
+                    return
+                self.__reported = now
+            self.on_progress(self)
+
+    def report(self):
+        lines = ['-- import of ' + self.path + ' into ' + self.table + ' --']
+        for chunk in self.chunks:
+            elapsed = (chunk.end_time or time()) - (chunk.start_time or time())
+            if chunk.error is not None:
+                lines.append(chunk.describe() + ' failed after ' + '%.1f' % elapsed + ' s, none of its rows committed:')
+                lines.extend('    ' + line for line in chunk.error.splitlines())
+            elif chunk.rows is not None:
+                lines.append(chunk.describe() + ': ' + str(chunk.rows) + ' rows committed in ' + '%.1f' % elapsed + ' s (' +
+                    str(int(chunk.rows / max(elapsed, 0.001))) + ' rows/s)')
+            else:
+                lines.append(chunk.describe() + ': not run')
+        rows = sum(chunk.rows or 0 for chunk in self.chunks)
+        lines.append(str(rows) + ' rows, ' + format_bytes(self.size) + ' in ' + '%.1f' % self.elapsed + ' s (' +
+            str(int(rows / max(self.elapsed, 0.001))) + ' rows/s)' + (', ' + str(len(self.failed)) + ' of ' + str(len(self.chunks)) + ' chunks failed' if self.failed else ''))
+        committed = [chunk for chunk in self.chunks if chunk.error is None and chunk.rows is not None]
+        if committed and len(committed) < len(self.chunks):
+            # Every chunk is a COPY of its own, so the ones that went through stay in the table.
+            lines.insert(-1, 'committed: bytes ' + ', '.join(chunk.byte_range() for chunk in committed) + '; not committed: bytes ' +
+                ', '.join(chunk.byte_range() for chunk in self.chunks if chunk not in committed))
+        return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,112 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from time import perf_counter
+started = perf_counter()
+from importlib import import_module
+from sublime_plugin import TextCommand, WindowCommand
+
+# Sublime Text imports every top-level module of the package at startup, so those
+# only define command stubs; the engine and a command's implementation in
+# psql_lib/commands are imported when the command first runs.
+
+class PsqlLoadTimes(object):
+    def __init__(self):
+        self.started = started
+        self.defined = started
+        self.stubs = 0
+        self.modules = []
+
+    def begin(self):
+        # psql.py is loaded first, so a reload of the plugin starts the measurement again.
+        if self.stubs:
+            self.started = perf_counter()
+            self.stubs = 0
+
+    def stub_defined(self):
+        self.stubs += 1
+        self.defined = perf_counter()
+
+    def startup(self):
+        return self.defined - self.started
+
+    def first_use(self):
+        return sum(seconds for name, seconds in self.modules)
+
+load_times = PsqlLoadTimes()
+loaded = {}
+
+def load(name):
+    module = loaded.get(name)
+    if module is None:
+        if name != 'plugin':
+            load('plugin')
+        start = perf_counter()
+        module = import_module('.' + name, __package__)
+        load_times.modules.append((name, perf_counter() - start))
+        if hasattr(module, 'plugin_loaded'):
+            module.plugin_loaded()
+        loaded[name] = module
+    return module
+
+def loaded_module(name):
+    return loaded.get(name)
+
+def unload():
+    for name in list(loaded):
+        module = loaded.pop(name)
+        if hasattr(module, 'plugin_unloaded'):
+            module.plugin_unloaded()
+
+class PsqlLazyMeta(type):
+    def __init__(cls, name, bases, namespace):
+        type.__init__(cls, name, bases, namespace)
+        if cls.__module__ != __name__:
+            load_times.stub_defined()
+
+class PsqlLazyCommand(object):
+    # Before the engine is loaded there are no queries, results or window settings to act on.
+    enabled_before_load = True
+
+    __command = None
+    def command(self, target):
+        if self.__command is None:
+            # The implementation is the class of the same name in the module of the same name.
+            module = load('commands.' + type(self).__module__.rsplit('.', 1)[-1])
+            self.__command = getattr(module, type(self).__name__)(target)
+        return self.__command
+
+class PsqlLazyTextCommand(PsqlLazyCommand, TextCommand, metaclass=PsqlLazyMeta):
+    def is_enabled(self, **kwargs):
+        if loaded_module('plugin') is None:
+            return self.enabled_before_load
+        return self.command(self.view).is_enabled(**kwargs)
+    def run(self, edit, **kwargs):
+        return self.command(self.view).run(edit, **kwargs)
+
+class PsqlLazyWindowCommand(PsqlLazyCommand, WindowCommand, metaclass=PsqlLazyMeta):
+    def is_enabled(self, **kwargs):
+        if loaded_module('plugin') is None:
+            return self.enabled_before_load
+        return self.command(self.window).is_enabled(**kwargs)
+    def run(self, **kwargs):
+        return self.command(self.window).run(**kwargs)
@@ -0,0 +1,155 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from array import array
+from csv import DictReader
+from itertools import count
+from re import compile as re_compile
+from threading import Lock
+from time import time
+from .cache import has_error
+from .metrics import nearest_rank
+
+__variable = re_compile(r"(?<![:\w]):(?:'(\w+)'|\"(\w+)\"|(\w+))")
+
+def bind_parameters(query, parameters):
+    # :name, :'name' and :"name" as in psql; names not in parameters are left alone.
+    def replace(match):
+        literal, identifier, plain = match.groups()
+        name = literal or identifier or plain
+        if name not in parameters:
+            return match.group()
+        value = parameters[name]
+        if value is None:
+            return 'NULL'
+        value = str(value)
+        if literal:
+            return "'" + value.replace("'", "''") + "'"
+        if identifier:
+            return '"' + value.replace('"', '""') + '"'
+        return value
+    return __variable.sub(replace, query)
+
+def load_parameters(parameters):
+    # A list of objects, or the path of a CSV file with the names in its first line.
+    if not parameters:
+        return []
+    if isinstance(parameters, str):
+        with open(parameters, newline='') as inputfile:
+            return [dict(row) for row in DictReader(inputfile)]
+    if isinstance(parameters, dict):
+        return [parameters]
+    return [dict(item) for item in parameters]
+
+class PsqlLoadTest(object):
+    progress_interval = 0.5
+    max_error_messages = 10
+
+    def __init__(self, query, clients=4, duration=10, iterations=0, parameters=None, on_progress=None):
+        self.query = query
+        self.clients = clients
+        self.duration = duration
+        self.iterations = iterations
+        self.parameters = parameters or []
+        self.on_progress = on_progress
+        self.latencies = array('d')
+        self.failed = 0
+        self.connects = 0
+        self.errors = {}
+        self.start_time = None
+        self.end_time = None
+        self.__claimed = count()
+        self.__reported = 0
+        self.__lock = Lock()
+
+    def start(self):
+        self.start_time = time()
+
+    def finish(self):
+        self.end_time = time()
+
+    @property
+    def elapsed(self):
+        return ((self.end_time or time()) - self.start_time) if self.start_time is not None else 0.0
+
+    @property
+    def completed(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.completed / max(self.elapsed, 0.001)
+
+    def next_statement(self):
+        # Claims the next iteration and returns its statement, or None when the test is over.
+        number = next(self.__claimed)
+        if self.iterations > 0 and number >= self.iterations:
+            return None
+        if self.iterations <= 0 and time() - self.start_time >= self.duration:
+            return None
+        if not self.parameters:
+            return self.query
+        return bind_parameters(self.query, self.parameters[number % len(self.parameters)])
+
+    def record(self, latency, output, retcode, connected=False):
+        failed = retcode != 0 or has_error(output)
+        with self.__lock:
+            self.latencies.append(latency)
+            if connected:
+                self.connects += 1
+            if failed:
+                self.failed += 1
+                lines = [line for line in output.splitlines() if line.strip()]
+                message = ([line for line in lines if has_error(line)] or lines or ['exit code ' + str(retcode)])[0][:200]
+                if message in self.errors or len(self.errors) < self.max_error_messages:
+                    self.errors[message] = self.errors.get(message, 0) + 1
+            now = time()
+            report = self.on_progress is not None and now - self.__reported >= self.progress_interval
+            if report:
+                self.__reported = now
+        if report:
+            self.on_progress(self)
+
+    def report(self):
+        with self.__lock:
+            latencies = sorted(self.latencies)
+            errors = sorted(self.errors.items(), key=lambda item: -item[1])
+            failed = self.failed
+            connects = self.connects
+        total = len(latencies)
+        ms = lambda value: '-' if value is None else '%.3f' % (value * 1000)
+        percentile = lambda percent: nearest_rank(latencies, percent) if latencies else None
+        lines = [
+            'transactions   ' + str(total) + ' (' + str(failed) + ' failed, ' + ('%.2f' % (failed * 100.0 / total) if total else '0.00') + '%)',
+            'duration       ' + '%.3f' % self.elapsed + ' s',
+            'throughput     ' + '%.1f' % self.throughput + ' per second',
+            'connections    ' + str(connects) + ' opened during the test',
+            '',
+            'latency ms     min ' + ms(latencies[0] if latencies else None) +
+                '   p50 ' + ms(percentile(50)) +
+                '   p95 ' + ms(percentile(95)) +
+                '   p99 ' + ms(percentile(99)) +
+                '   max ' + ms(latencies[-1] if latencies else None) +
+                '   mean ' + ms(sum(latencies) / total if total else None)]
+        if errors:
+            lines.extend(['', 'errors'])
+            lines.extend('%8d  %s' % (number, message) for message, number in errors)
+        return '\n'.join(lines) + '\n'
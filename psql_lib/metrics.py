@@ -0,0 +1,201 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from threading import Thread, Lock
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+from time import time
+from os import makedirs, remove, rename
+from os.path import dirname, exists, getsize
+from re import compile as re_compile, M
+import json
+
+class PsqlQueryMetrics(object):
+    __footer = re_compile(r'^\((\d+) rows?\)$', M)
+
+    def __init__(self):
+        self.created = time()
+        self.start = None
+        self.end = None
+        self.sent = None
+        self.first_byte = None
+        self.last_byte = None
+        self.result_end = None
+        self.spawn = 0.0
+        self.connect = None
+        self.decode = 0.0
+        self.render = 0.0
+        self.bytes = 0
+        self.characters = 0
+        self.rows = 0
+        self.retcode = None
+        self.__line = ''
+
+    def started(self):
+        self.start = time()
+
+    def input_sent(self):
+        if self.sent is None:
+            self.sent = time()
+
+    def result_complete(self):
+        # The whole result is in; resetting a pooled session or connection comes after.
+        if self.result_end is None:
+            self.result_end = time()
+
+    def received(self, size):
+        now = time()
+        if self.first_byte is None:
+            self.first_byte = now
+        self.last_byte = now
+        self.bytes += size
+
+    def text(self, text):
+        # Rows are counted from the "(n rows)" footers of psql and the native formatter.
+        self.characters += len(text)
+        last = text.rfind('\n')
+        if last < 0:
+            self.__line += text
+            return
+        for match in self.__footer.finditer(self.__line + text[:last + 1]):
+            self.rows += int(match.group(1))
+        self.__line = text[last + 1:]
+
+    def finished(self, retcode):
+        self.end = time()
+        self.retcode = retcode
+
+    def __since_sent(self, moment):
+        if moment is None or self.sent is None:
+            return None
+        return max(0.0, moment - self.sent)
+
+    def record(self, **fields):
+        record = {
+            'time': self.created,
+            'queued': self.start - self.created if self.start is not None else None,
+            'spawn': self.spawn,
+            'connect': self.connect,
+            'first_byte': self.__since_sent(self.first_byte),
+            'last_byte': self.__since_sent(self.last_byte),
+            'decode': self.decode,
+            'render': self.render,
+            'total': self.end - self.start if self.start is not None and self.end is not None else None,
+            'bytes': self.bytes,
+            'characters': self.characters,
+            'rows': self.rows,
+            'retcode': self.retcode
+        }
+        record.update(fields)
+        return record
+
+class PsqlExecutionLog(object):
+    phases = ('queued', 'spawn', 'connect', 'first_byte', 'last_byte', 'decode', 'render', 'total')
+    quantities = ('bytes', 'rows')
+
+    def __init__(self, path, max_size=1048576, backups=2):
+        self.path = path
+        self.max_size = max_size
+        self.backups = backups
+        self.error = None
+        self.on_error = None
+        self.__lock = Lock()
+        # Records are written by a thread of their own, queries finish on the UI thread.
+        self.__queue = Queue()
+        self.__writer = None
+
+    def __files(self):
+        return [self.path + '.' + str(number) for number in range(self.backups, 0, -1)] + [self.path]
+
+    def __rotate(self):
+        files = self.__files()
+        if exists(files[0]):
+            remove(files[0])
+        for older, newer in zip(files, files[1:]):
+            if exists(newer):
+                rename(newer, older)
+
+    def append(self, record):
+        self.__queue.put(json.dumps(record, sort_keys=True) + '\n')
+        with self.__lock:
+            if self.__writer is None:
+                self.__writer = Thread(target=self.__write)
+                self.__writer.daemon = True
+                self.__writer.start()
+
+    def flush(self):
+        self.__queue.join()
+
+    def __write(self):
+        while True:
+            line = self.__queue.get()
+            try:
+                with self.__lock:
+                    directory = dirname(self.path)
+                    if directory and not exists(directory):
+                        makedirs(directory)
+                    if self.max_size > 0 and exists(self.path) and getsize(self.path) + len(line) > self.max_size:
+                        self.__rotate()
+                    with open(self.path, 'a', encoding='utf-8') as logfile:
+                        logfile.write(line)
+            except (OSError, IOError) as e:
+                self.error = str(e)
+                if self.on_error is not None:
+                    self.on_error(self)
+            finally:
+                self.__queue.task_done()
+
+    def records(self):
+        # The files are read under the lock, the records parsed after it is released.
+        self.flush()
+        lines = []
+        with self.__lock:
+            for path in self.__files():
+                if exists(path):
+                    with open(path, encoding='utf-8') as logfile:
+                        lines.extend(logfile)
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+        return records
+
+    def statistics(self):
+        by_profile = {}
+        for record in self.records():
+            by_profile.setdefault(record.get('profile', ''), []).append(record)
+        statistics = {}
+        for profile, records in by_profile.items():
+            statistics[profile] = summary = {'count': len(records)}
+            for name in self.phases + self.quantities:
+                values = sorted(record[name] for record in records if record.get(name) is not None)
+                if values:
+                    summary[name] = dict((percentile, nearest_rank(values, percentile)) for percentile in (50, 95, 99))
+        return statistics
+
+def nearest_rank(values, percentile):
+    rank = -(-len(values) * percentile // 100)
+    return values[max(0, int(rank) - 1)]
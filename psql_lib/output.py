@@ -0,0 +1,240 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from sublime import set_timeout
+from collections import deque
+from time import time
+from os import remove
+
+class PsqlOutputRun(object):
+    def __init__(self, panel=None, ordered=False):
+        self.panel = panel
+        self.ordered = ordered
+        self.streams = []
+
+class PsqlOutputDispatcher(object):
+    __dispatchers = {}
+    __frame_interval = 30
+
+    @classmethod
+    def for_window(cls, window):
+        if window.id() not in cls.__dispatchers:
+            cls.__dispatchers[window.id()] = cls(window)
+        return cls.__dispatchers[window.id()]
+
+    @classmethod
+    def window_ids(cls):
+        return list(cls.__dispatchers)
+
+    @classmethod
+    def window_closed(cls, window_id):
+        dispatcher = cls.__dispatchers.pop(window_id, None)
+        if dispatcher is not None:
+            dispatcher.release()
+
+    @classmethod
+    def counters(cls):
+        dispatchers = list(cls.__dispatchers.values())
+        return [('output fragments pending', sum(dispatcher.pending for dispatcher in dispatchers)),
+            ('output spill files', sum(len(dispatcher.spill_files) for dispatcher in dispatchers))]
+
+    @property
+    def pending(self):
+        return len(self.__fragments)
+
+    def release(self):
+        # Output still arriving for the closed window is dropped.
+        self.__released = True
+        self.__fragments.clear()
+        self.__streams = []
+        for state in (self.__runs, self.__labels, self.__pending, self.__closed, self.__labelled, self.__views):
+            state.clear()
+        self.__owner = None
+        self.__remove_spill_files()
+
+    def __init__(self, window):
+        self.window = window
+        self.spill_files = []
+        self.render_time = 0.0
+        self.frames = 0
+        # Workers only ever append to this deque; the UI thread is the only consumer.
+        self.__fragments = deque()
+        self.__scheduled = False
+        self.__streams = []
+        self.__runs = {}
+        self.__labels = {}
+        self.__pending = {}
+        self.__closed = set()
+        self.__labelled = set()
+        self.__views = {}
+        self.__owner = None
+        self.__released = False
+
+    def begin_run(self, encoding, panel=None, ordered=False):
+        if panel is not None:
+            self.__remove_spill_files()
+        run = PsqlOutputRun(panel, ordered)
+        run.encoding = encoding
+        return run
+
+    def __remove_spill_files(self):
+        for path in self.spill_files:
+            try:
+                remove(path)
+            except OSError:
+                pass
+        self.spill_files = []
+
+    def open(self, run, stream, label=None):
+        if self.__released:
+            return
+        run.streams.append(stream)
+        self.__fragments.append((stream, (run, label)))
+
+    def emit(self, stream, text):
+        if self.__released:
+            return
+        self.__fragments.append((stream, text))
+        if not self.__scheduled:
+            self.__scheduled = True
+            set_timeout(self.__flush, 0 if text is None else self.__frame_interval)
+
+    def __collect(self):
+        fragments = self.__fragments
+        while fragments:
+            stream, text = fragments.popleft()
+            if isinstance(text, tuple):
+                self.__streams.append(stream)
+                self.__runs[stream], self.__labels[stream] = text
+                self.__pending[stream] = []
+            elif text is not None:
+                self.__pending[stream].append(text)
+            else:
+                self.__closed.add(stream)
+
+    def __eligible(self, stream):
+        run = self.__runs[stream]
+        if run.ordered:
+            index = run.streams.index(stream)
+            return all(earlier not in self.__pending for earlier in run.streams[:index])
+        return True
+
+    def __next_owner(self, waiting):
+        if self.__owner is not None and self.__owner in self.__pending:
+            return self.__owner
+        eligible = [stream for stream in waiting if self.__eligible(stream)]
+        # Finished results go out whole before a running query takes over the panel.
+        for stream in eligible:
+            if stream in self.__closed:
+                return stream
+        for stream in eligible:
+            if self.__pending[stream]:
+                return stream
+        return None
+
+    def __flush(self):
+        self.__scheduled = False
+        if self.__released:
+            return
+        start = time()
+        self.__collect()
+
+        panel_text = []
+        panel_streams = []
+        panel = None
+        finished = []
+        while True:
+            waiting = [stream for stream in self.__streams if self.__runs[stream].panel is not None]
+            self.__owner = self.__next_owner(waiting)
+            if self.__owner is None:
+                break
+            panel = self.__runs[self.__owner].panel
+            if self.__owner in self.__closed:
+                finished.append(self.__owner)
+            panel_text.append(self.__take(self.__owner))
+            panel_streams.append(self.__owner)
+            if self.__owner in self.__pending:
+                break
+            self.__owner = None
+
+        edits = []
+        for stream in [stream for stream in self.__streams if self.__runs[stream].panel is None]:
+            closed = stream in self.__closed
+            view = self.__view_for(stream) if self.__pending[stream] or closed else None
+            text = self.__take(stream)
+            if text:
+                edits.append((stream, view, text))
+            if closed:
+                self.__views.pop(stream, None)
+                finished.append(stream)
+
+        text = ''.join(panel_text)
+        if text:
+            # One append serves several results; each is charged its share of the time.
+            append_start = time()
+            panel.run_command('append', {'characters': text})
+            self.window.run_command('show_panel', {'panel': 'output.psql'})
+            elapsed = time() - append_start
+            for stream, part in zip(panel_streams, panel_text):
+                stream.metrics.render += elapsed * len(part) / max(1, len(text))
+        for stream, view, text in edits:
+            append_start = time()
+            view.run_command('append', {'characters': text})
+            stream.metrics.render += time() - append_start
+
+        if text or edits:
+            self.render_time += time() - start
+            self.frames += 1
+        for stream in finished:
+            stream.rendered()
+
+        if self.__fragments and not self.__scheduled:
+            self.__scheduled = True
+            set_timeout(self.__flush, self.__frame_interval)
+
+    def __take(self, stream):
+        text = ''.join(self.__pending[stream])
+        self.__pending[stream] = []
+        run = self.__runs[stream]
+        if run.panel is not None and len(run.streams) > 1 and stream not in self.__labelled:
+            self.__labelled.add(stream)
+            text = '-- ' + self.__labels[stream] + ' --\n' + text
+        if stream in self.__closed:
+            if stream.spill_path is not None:
+                self.spill_files.append(stream.spill_path)
+                text += ('\n(Output truncated after ' + str(stream.length) + ' characters, the remaining ' + str(stream.spilled) +
+                    ' were written to ' + stream.spill_path + '. Use "Open full PostgreSQL query output" to view them.)\n')
+            self.__streams.remove(stream)
+            self.__closed.discard(stream)
+            self.__labelled.discard(stream)
+            for state in (self.__pending, self.__runs, self.__labels):
+                del state[stream]
+        return text
+
+    def __view_for(self, stream):
+        view = self.__views.get(stream)
+        if view is None:
+            view = self.__views[stream] = self.window.new_file()
+            view.set_scratch(True)
+            view.set_encoding(self.__runs[stream].encoding)
+            self.window.focus_view(view)
+        return view
@@ -0,0 +1,547 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from struct import pack, unpack_from
+from hashlib import md5, sha256
+from base64 import b64encode, b64decode
+from decimal import Decimal
+from datetime import date
+from os import environ, urandom
+from os.path import expanduser, exists
+import socket
+import hmac
+
+try:
+    from hashlib import pbkdf2_hmac
+except ImportError:
+    pbkdf2_hmac = None
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+class PgError(Exception):
+    def __init__(self, fields):
+        self.fields = fields
+        Exception.__init__(self, fields.get('M', 'unknown error'))
+
+    @property
+    def severity(self):
+        return self.fields.get('V', self.fields.get('S', 'ERROR'))
+
+    @property
+    def sqlstate(self):
+        return self.fields.get('C')
+
+    def format(self):
+        text = self.severity + ':  ' + self.fields.get('M', '') + '\n'
+        for code, label in (('D', 'DETAIL'), ('H', 'HINT'), ('W', 'CONTEXT')):
+            if code in self.fields:
+                text += label + ':  ' + self.fields[code] + '\n'
+        return text
+
+class PgConnectionError(Exception):
+    pass
+
+class PgResult(object):
+    def __init__(self):
+        self.columns = None
+        self.type_oids = None
+        self.rows = []
+        self.command_tag = None
+
+    @property
+    def row_count(self):
+        if self.columns is not None:
+            return len(self.rows)
+        parts = (self.command_tag or '').split()
+        return int(parts[-1]) if parts and parts[-1].isdigit() else None
+
+class PgResultCollector(object):
+    def __init__(self):
+        self.results = []
+        self.notices = []
+        self.__current = None
+
+    def __result(self):
+        if self.__current is None:
+            self.__current = PgResult()
+        return self.__current
+
+    def description(self, columns, type_oids):
+        result = self.__result()
+        result.columns = columns
+        result.type_oids = type_oids
+
+    def row(self, values):
+        self.__result().rows.append(values)
+
+    def complete(self, command_tag):
+        result = self.__result()
+        result.command_tag = command_tag
+        self.results.append(result)
+        self.__current = None
+
+    def notice(self, notice):
+        self.notices.append(notice)
+
+    def copy_out(self, data):
+        pass
+
+    def copy_in(self):
+        return iter(())
+
+def parse_bool(value):
+    return value == 't'
+
+def parse_bytea(value):
+    if value.startswith('\\x'):
+        return bytes.fromhex(value[2:])
+    return value.encode('latin-1').decode('unicode_escape').encode('latin-1')
+
+def parse_date(value):
+    try:
+        year, month, day = value.split('-')
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return value
+
+type_parsers = {
+    16: parse_bool, 17: parse_bytea, 20: int, 21: int, 23: int, 26: int,
+    700: float, 701: float, 1700: Decimal, 1082: parse_date
+}
+
+class PgConnection(object):
+    __protocol_version = 196608
+    __ssl_request_code = 80877103
+    __cancel_request_code = 80877102
+
+    def __init__(self, host=None, port=5432, user=None, password=None, database=None, hostaddr=None,
+            options=None, application_name=None, sslmode='prefer', sslrootcert=None, sslcert=None, sslkey=None,
+            connect_timeout=None, passfile=None):
+        self.host = host
+        self.hostaddr = hostaddr
+        self.port = int(port or 5432)
+        self.user = user or environ.get('USER') or environ.get('USERNAME') or 'postgres'
+        self.database = database or self.user
+        self.password = password
+        self.options = options
+        self.application_name = application_name
+        self.sslmode = sslmode or 'prefer'
+        self.sslrootcert = sslrootcert
+        self.sslcert = sslcert
+        self.sslkey = sslkey
+        self.connect_timeout = float(connect_timeout) if connect_timeout else None
+        self.passfile = passfile
+        self.parameters = {}
+        self.backend_pid = None
+        self.backend_secret = None
+        self.transaction_status = None
+        self.sock = None
+        self.broken = False
+        self.idle_since = None
+        self.on_receive = None
+        self.__started = False
+        self.__buffer = b''
+
+    @classmethod
+    def from_variables(cls, variables):
+        if variables.get('PGSERVICE'):
+            raise PgConnectionError('Connection services (PGSERVICE) are not supported by the native backend.')
+        return cls(host=variables.get('PGHOST'), port=variables.get('PGPORT'), user=variables.get('PGUSER'),
+            password=variables.get('PGPASSWORD'), database=variables.get('PGDATABASE'), hostaddr=variables.get('PGHOSTADDR'),
+            options=variables.get('PGOPTIONS'), application_name=variables.get('PGAPPNAME'), sslmode=variables.get('PGSSLMODE'),
+            sslrootcert=variables.get('PGSSLROOTCERT'), sslcert=variables.get('PGSSLCERT'), sslkey=variables.get('PGSSLKEY'),
+            connect_timeout=variables.get('PGCONNECT_TIMEOUT'), passfile=variables.get('PGPASSFILE'))
+
+    def __address(self):
+        host = self.hostaddr or self.host
+        if host and not host.startswith('/'):
+            return socket.AF_INET6 if ':' in host else socket.AF_INET, (host, self.port), False
+        if not host and not hasattr(socket, 'AF_UNIX'):
+            return socket.AF_INET, ('localhost', self.port), False
+        for directory in ([host] if host else ['/var/run/postgresql', '/tmp']):
+            path = directory + '/.s.PGSQL.' + str(self.port)
+            if exists(path) or host:
+                return socket.AF_UNIX, path, True
+        raise PgConnectionError('No PostgreSQL server socket found for port ' + str(self.port) + '.')
+
+    def __open_socket(self):
+        family, address, local = self.__address()
+        if family == socket.AF_UNIX:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            sock.connect(address)
+        else:
+            sock = socket.create_connection(address, self.connect_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(None)
+        return sock, local
+
+    def connect(self):
+        self.__started = False
+        self.sock, local = self.__open_socket()
+        try:
+            if not local and self.sslmode not in ('disable', 'allow'):
+                self.__negotiate_ssl()
+            parameters = {'user': self.user, 'database': self.database, 'client_encoding': 'UTF8'}
+            if self.application_name:
+                parameters['application_name'] = self.application_name
+            if self.options:
+                parameters['options'] = self.options
+            payload = pack('!i', self.__protocol_version)
+            for name in parameters:
+                payload += name.encode('utf-8') + b'\x00' + parameters[name].encode('utf-8') + b'\x00'
+            payload += b'\x00'
+            self.sock.sendall(pack('!i', len(payload) + 4) + payload)
+            self.__started = True
+            self.__authenticate()
+            self.__wait_ready(None)
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def __negotiate_ssl(self):
+        if ssl is None:
+            if self.sslmode in ('require', 'verify-ca', 'verify-full'):
+                raise PgConnectionError('sslmode ' + self.sslmode + ' requires the ssl module.')
+            return
+        self.sock.sendall(pack('!ii', 8, self.__ssl_request_code))
+        answer = self.sock.recv(1)
+        if answer != b'S':
+            if self.sslmode in ('require', 'verify-ca', 'verify-full'):
+                raise PgConnectionError('Server does not support SSL but sslmode is ' + self.sslmode + '.')
+            return
+        # As with libpq, require checks the certificate when a root certificate is there
+        # and only verify-full checks the host name.
+        rootcert = expanduser(self.sslrootcert or '~/.postgresql/root.crt')
+        verify = self.sslmode in ('verify-ca', 'verify-full') or (self.sslmode == 'require' and rootcert != 'system' and exists(rootcert))
+        # A root certificate file replaces the system certificates rather than adding to them.
+        context = ssl.create_default_context(cafile=rootcert if verify and rootcert != 'system' else None)
+        context.check_hostname = verify and self.sslmode == 'verify-full'
+        if not verify:
+            context.verify_mode = ssl.CERT_NONE
+        if self.sslcert:
+            context.load_cert_chain(expanduser(self.sslcert), expanduser(self.sslkey) if self.sslkey else None)
+        self.sock = context.wrap_socket(self.sock, server_hostname=self.host if self.sslmode == 'verify-full' else None)
+
+    def __lookup_password(self):
+        path = expanduser(self.passfile or environ.get('PGPASSFILE') or '~/.pgpass')
+        if not exists(path):
+            return None
+        host = self.host or 'localhost'
+        wanted = (host, str(self.port), self.database, self.user)
+        with open(path, encoding='utf-8') as passfile:
+            for line in passfile:
+                line = line.rstrip('\r\n')
+                if not line or line.startswith('#'):
+                    continue
+                fields, field, escaped = [], '', False
+                for char in line:
+                    if escaped:
+                        field += char
+                        escaped = False
+                    elif char == '\\':
+                        escaped = True
+                    elif char == ':' and len(fields) < 4:
+                        fields.append(field)
+                        field = ''
+                    else:
+                        field += char
+                fields.append(field)
+                if len(fields) == 5 and all(pattern in ('*', value) or (pattern == 'localhost' and value.startswith('/')) for pattern, value in zip(fields, wanted)):
+                    return fields[4]
+        return None
+
+    def __require_password(self):
+        if self.password is None:
+            self.password = self.__lookup_password()
+        if self.password is None:
+            raise PgConnectionError('The server requested password authentication but no password was supplied.')
+        return self.password.encode('utf-8')
+
+    def __authenticate(self):
+        scram = None
+        while True:
+            kind, payload = self.__read_message()
+            if kind == b'E':
+                raise PgError(self.__parse_fields(payload))
+            if kind == b'v':
+                # NegotiateProtocolVersion: the server only speaks an older minor version or
+                # lacks protocol options. 3.0 without options is all that is asked for.
+                minor = unpack_from('!i', payload)[0]
+                if minor < self.__protocol_version & 0xffff:
+                    raise PgConnectionError('Server does not support protocol version 3.' + str(self.__protocol_version & 0xffff) + '.')
+                continue
+            if kind != b'R':
+                raise PgConnectionError('Unexpected message during authentication: ' + repr(kind))
+            code = unpack_from('!i', payload)[0]
+            if code == 0:
+                return
+            elif code == 3:
+                self.__send(b'p', self.__require_password() + b'\x00')
+            elif code == 5:
+                password = self.__require_password()
+                inner = md5(password + self.user.encode('utf-8')).hexdigest().encode('ascii')
+                self.__send(b'p', b'md5' + md5(inner + payload[4:8]).hexdigest().encode('ascii') + b'\x00')
+            elif code == 10:
+                mechanisms = payload[4:].split(b'\x00')
+                if b'SCRAM-SHA-256' not in mechanisms:
+                    raise PgConnectionError('Unsupported SASL mechanisms: ' + repr(mechanisms))
+                scram = PgScramClient(self.__require_password())
+                first = scram.client_first()
+                self.__send(b'p', b'SCRAM-SHA-256\x00' + pack('!i', len(first)) + first)
+            elif code == 11:
+                self.__send(b'p', scram.client_final(payload[4:]))
+            elif code == 12:
+                scram.verify_server_final(payload[4:])
+            else:
+                raise PgConnectionError('Unsupported authentication method ' + str(code) + '.')
+
+    def __send(self, kind, payload=b''):
+        self.sock.sendall(kind + pack('!i', len(payload) + 4) + payload)
+
+    def __recv(self, size):
+        while len(self.__buffer) < size:
+            chunk = self.sock.recv(max(65536, size - len(self.__buffer)))
+            if not chunk:
+                self.broken = True
+                raise PgConnectionError('Server closed the connection unexpectedly.')
+            if self.on_receive is not None:
+                self.on_receive(len(chunk))
+            self.__buffer += chunk
+        data = self.__buffer[:size]
+        self.__buffer = self.__buffer[size:]
+        return data
+
+    def __read_message(self):
+        header = self.__recv(5)
+        length = unpack_from('!i', header, 1)[0]
+        return header[:1], self.__recv(length - 4)
+
+    @staticmethod
+    def __parse_fields(payload):
+        fields = {}
+        for item in payload.split(b'\x00'):
+            if item:
+                fields[item[:1].decode('ascii')] = item[1:].decode('utf-8', 'replace')
+        return fields
+
+    @staticmethod
+    def __parse_description(payload):
+        count = unpack_from('!h', payload)[0]
+        offset = 2
+        columns = []
+        type_oids = []
+        for index in range(count):
+            end = payload.index(b'\x00', offset)
+            columns.append(payload[offset:end].decode('utf-8'))
+            type_oids.append(unpack_from('!i', payload, end + 7)[0])
+            offset = end + 19
+        return columns, type_oids
+
+    @staticmethod
+    def __parse_row(payload, type_oids):
+        count = unpack_from('!h', payload)[0]
+        offset = 2
+        values = []
+        for index in range(count):
+            length = unpack_from('!i', payload, offset)[0]
+            offset += 4
+            if length < 0:
+                values.append(None)
+                continue
+            value = payload[offset:offset + length].decode('utf-8')
+            offset += length
+            parser = type_parsers.get(type_oids[index]) if type_oids else None
+            values.append(parser(value) if parser is not None else value)
+        return tuple(values)
+
+    def __wait_ready(self, handler):
+        error = None
+        type_oids = None
+        while True:
+            kind, payload = self.__read_message()
+            if kind == b'D':
+                handler.row(self.__parse_row(payload, type_oids))
+            elif kind == b'T':
+                columns, type_oids = self.__parse_description(payload)
+                handler.description(columns, type_oids)
+            elif kind == b'C':
+                handler.complete(payload[:-1].decode('utf-8'))
+                type_oids = None
+            elif kind == b'I':
+                type_oids = None
+            elif kind == b'Z':
+                self.transaction_status = payload.decode('ascii')
+                if error is not None:
+                    raise error
+                return
+            elif kind == b'E':
+                error = PgError(self.__parse_fields(payload))
+            elif kind == b'N':
+                if handler is not None:
+                    handler.notice(PgError(self.__parse_fields(payload)))
+            elif kind == b'S':
+                name, value = payload.split(b'\x00')[:2]
+                self.parameters[name.decode('utf-8')] = value.decode('utf-8')
+            elif kind == b'K':
+                self.backend_pid, self.backend_secret = unpack_from('!ii', payload)
+            elif kind == b'H':
+                error = self.__copy_out(handler) or error
+            elif kind == b'G':
+                self.__copy_in(handler)
+            elif kind in (b'1', b'2', b'3', b'n', b't', b's', b'A'):
+                pass
+            else:
+                raise PgConnectionError('Unexpected message from server: ' + repr(kind))
+
+    def __copy_out(self, handler):
+        while True:
+            kind, payload = self.__read_message()
+            if kind == b'd':
+                handler.copy_out(payload)
+            elif kind == b'c':
+                return None
+            elif kind == b'E':
+                return PgError(self.__parse_fields(payload))
+            elif kind == b'N':
+                handler.notice(PgError(self.__parse_fields(payload)))
+
+    def __copy_in(self, handler):
+        try:
+            for chunk in handler.copy_in():
+                if chunk:
+                    self.__send(b'd', chunk)
+        except Exception as e:
+            self.__send(b'f', str(e).encode('utf-8') + b'\x00')
+        else:
+            self.__send(b'c')
+
+    def is_alive(self):
+        return self.sock is not None and not self.broken
+
+    def simple_query(self, sql, handler=None):
+        collector = handler or PgResultCollector()
+        self.__send(b'Q', sql.encode('utf-8') + b'\x00')
+        self.__wait_ready(collector)
+        return collector
+
+    def execute(self, sql, parameters=(), handler=None):
+        collector = handler or PgResultCollector()
+        bind = b'\x00\x00' + pack('!hh', 0, len(parameters))
+        for value in parameters:
+            if value is None:
+                bind += pack('!i', -1)
+            else:
+                if isinstance(value, bool):
+                    value = 't' if value else 'f'
+                data = str(value).encode('utf-8')
+                bind += pack('!i', len(data)) + data
+        bind += pack('!h', 0)
+        message = b''
+        for kind, payload in ((b'P', b'\x00' + sql.encode('utf-8') + b'\x00' + pack('!h', 0)), (b'B', bind),
+                (b'D', b'P\x00'), (b'E', b'\x00' + pack('!i', 0)), (b'S', b'')):
+            message += kind + pack('!i', len(payload) + 4) + payload
+        self.sock.sendall(message)
+        self.__wait_ready(collector)
+        return collector
+
+    def cancel(self):
+        if self.backend_pid is None:
+            return
+        sock, local = self.__open_socket()
+        try:
+            sock.sendall(pack('!iiii', 16, self.__cancel_request_code, self.backend_pid, self.backend_secret))
+            sock.recv(1)
+        finally:
+            sock.close()
+
+    def abort(self):
+        # Unblocks a query waiting on the server; the connection cannot be used afterwards.
+        self.broken = True
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, socket.error):
+                pass
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                # Terminate is a protocol message, a server still waiting for the startup packet would misread it.
+                if self.__started:
+                    self.__send(b'X')
+            except (OSError, socket.error):
+                pass
+            try:
+                self.sock.close()
+            except (OSError, socket.error):
+                pass
+            self.sock = None
+
+class PgScramClient(object):
+    def __init__(self, password):
+        self.password = password
+        self.nonce = b64encode(urandom(18))
+
+    def client_first(self):
+        self.client_first_bare = b'n=,r=' + self.nonce
+        return b'n,,' + self.client_first_bare
+
+    def client_final(self, server_first):
+        fields = dict(item.split(b'=', 1) for item in server_first.split(b','))
+        if not fields[b'r'].startswith(self.nonce):
+            raise PgConnectionError('SCRAM server nonce does not match.')
+        salt = b64decode(fields[b's'])
+        iterations = int(fields[b'i'])
+        self.salted = pbkdf2(self.password, salt, iterations)
+        client_key = hmac.new(self.salted, b'Client Key', sha256).digest()
+        final_without_proof = b'c=biws,r=' + fields[b'r']
+        self.auth_message = self.client_first_bare + b',' + server_first + b',' + final_without_proof
+        signature = hmac.new(sha256(client_key).digest(), self.auth_message, sha256).digest()
+        proof = bytes(key ^ sign for key, sign in zip(client_key, signature))
+        return final_without_proof + b',p=' + b64encode(proof)
+
+    def verify_server_final(self, server_final):
+        fields = dict(item.split(b'=', 1) for item in server_final.split(b','))
+        server_key = hmac.new(self.salted, b'Server Key', sha256).digest()
+        expected = hmac.new(server_key, self.auth_message, sha256).digest()
+        if b'v' not in fields or not hmac.compare_digest(b64decode(fields[b'v']), expected):
+            raise PgConnectionError('SCRAM server signature does not match.')
+
+def pbkdf2(password, salt, iterations):
+    if pbkdf2_hmac is not None:
+        return pbkdf2_hmac('sha256', password, salt, iterations)
+    mac = hmac.new(password, None, sha256)
+    def prf(data):
+        digest = mac.copy()
+        digest.update(data)
+        return digest.digest()
+    block = prf(salt + b'\x00\x00\x00\x01')
+    result = int.from_bytes(block, 'big')
+    for index in range(iterations - 1):
+        block = prf(block)
+        result ^= int.from_bytes(block, 'big')
+    return result.to_bytes(32, 'big')
@@ -0,0 +1,414 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from sublime import save_settings, load_settings, status_message, Region, active_window, set_timeout, cache_path
+from sublime_plugin import TextCommand, WindowCommand
+try:
+    from sublime_plugin import TextChangeListener
+except ImportError:
+    TextChangeListener = None
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+from abc import ABCMeta
+from os import environ
+from os.path import join
+from .pool import session_pool
+from .backend import connection_pool
+from .output import PsqlOutputDispatcher
+from .profile import PsqlConnectionProfile
+from .statements import PsqlStatementIndexes
+from .cancel import PsqlInFlight
+from .metrics import PsqlExecutionLog
+from .schema import PsqlSchemaCache
+from .grid import PsqlGridState
+from .windows import window_registry
+from .history import PsqlHistory
+from re import compile as re_compile
+
+def set_status(msg):
+    set_timeout(lambda:status_message(msg))
+
+def is_true(value):
+    return str(value).strip().lower() in ('true', '1', 'yes', 'on')
+
+execution_log = None
+
+def get_execution_log():
+    global execution_log
+    if execution_log is None:
+        execution_log = PsqlExecutionLog(join(cache_path(), 'PostgreSQL Developer Tools', 'executions.jsonl'))
+        execution_log.on_error = lambda log: set_status('PostgreSQL execution log not written: ' + log.error)
+    return execution_log
+
+query_history = None
+
+def get_query_history():
+    global query_history
+    if query_history is None:
+        query_history = PsqlHistory(join(cache_path(), 'PostgreSQL Developer Tools', 'history.sqlite'))
+        query_history.on_error = lambda history: set_status('PostgreSQL query history not written: ' + history.error)
+    return query_history
+
+def get_schema_cache(settings, encoding):
+    if PsqlSchemaCache.directory is None:
+        PsqlSchemaCache.directory = join(cache_path(), 'PostgreSQL Developer Tools', 'schema')
+    return PsqlSchemaCache.for_profile(settings.snapshot(encoding))
+
+def schema_loaded(cache):
+    if cache.error is not None:
+        set_status('PostgreSQL schema for ' + cache.profile.describe() + ' not loaded: ' + cache.error.splitlines()[0])
+    elif cache.index is not None:
+        set_status('PostgreSQL schema for ' + cache.profile.describe() + ' loaded (' + str(len(cache.index)) + ' objects).')
+
+def plugin_loaded():
+    window_registry.on_error = set_status
+    window_registry.start()
+
+def plugin_unloaded():
+    window_registry.stop()
+    session_pool.close_all()
+    connection_pool.close_all()
+
+class PsqlBaseTextCommand(TextCommand, metaclass=ABCMeta):  
+
+    __settings = None
+    __window = None
+    @property
+    def window(self):
+        if self.__window is None:
+            self.__window = self.view.window()
+            if self.__window is None:
+                self.__window = active_window()
+        return self.__window
+
+    @property
+    def settings(self):
+        if self.__settings is None:
+            self.__settings = PsqlSettings(window=self.window)
+        return self.__settings
+
+    @settings.setter
+    def settings(self, values):
+        self.settings.update(values)
+
+class PsqlBaseWindowCommand(WindowCommand, metaclass=ABCMeta):  
+
+    __settings = None
+    @property
+    def settings(self):
+        if self.__settings is None:
+            self.__settings = PsqlSettings(window=self.window)
+        return self.__settings
+
+    @settings.setter
+    def settings(self, values):
+        self.settings.update(values)
+
+class PsqlEvents(object):
+    __qualifier = re_compile(r'("[^"]+"|[\w$]+)\.[\w$]*$')
+    __plain_name = re_compile(r'^[a-z_][a-z0-9_$]*$')
+
+    def post_window_command(self, window, command_name, args):
+        if command_name == 'close_window':
+            window_registry.release(window.id())
+
+    def on_pre_close_window(self, window):
+        window_registry.release(window.id())
+
+    def on_selection_modified(self, view):
+        # Remembered for on_modified, by which time text typed or pasted over the selection has replaced it.
+        index = PsqlStatementIndexes.get(view.buffer_id())
+        if index is not None and TextChangeListener is None:
+            index.last_selection = [(sel.begin(), sel.end()) for sel in view.sel()]
+
+    def on_modified(self, view):
+        # Without text change events, work out the edited range from the selection: text
+        # typed or pasted over a selection replaces it, and typing, deleting and undo leave
+        # the caret next to the change.
+        index = PsqlStatementIndexes.get(view.buffer_id())
+        if index is None or TextChangeListener is not None:
+            return
+        size = view.size()
+        delta = size - index.last_size
+        index.last_size = size
+        previous = index.last_selection
+        index.last_selection = None
+        selections = view.sel()
+        if len(selections) != 1:
+            index.invalidate(max(0, min(sel.begin() for sel in selections) - abs(delta) - 1))
+            return
+        caret = selections[0].end()
+        if previous is not None and len(previous) == 1 and previous[0][0] != previous[0][1]:
+            begin, end = previous[0]
+            inserted = delta + end - begin
+            if inserted >= 0 and caret == begin + inserted:
+                index.replaced(begin, end - begin, inserted)
+                return
+        position = max(0, min(caret - max(delta, 0), size, size - delta) - 1)
+        removed = min(size - delta, caret + 1 - delta) - position
+        inserted = min(size, caret + 1) - position
+        if removed < 0 or inserted < 0:
+            index.invalidate(0)
+        elif previous is None:
+            # Nothing tells whether a selection was replaced, so the whole line is scanned again.
+            index.invalidate(max(0, min(view.line(caret).begin(), caret - inserted - abs(delta))))
+        else:
+            index.replaced(position, removed, inserted)
+
+    def on_query_completions(self, view, prefix, locations):
+        window = view.window()
+        if window is None or not view.match_selector(locations[0], 'source.sql'):
+            return None
+        settings = PsqlSettings(window=window)
+        if not is_true(settings.get('schema_completions', 'True')):
+            return None
+        encoding = view.encoding() if view.encoding() != 'Undefined' else 'UTF-8'
+        cache = PsqlSchemaCache.get(settings.snapshot(encoding))
+        if cache is None:
+            # The catalog is only read for connections queries have been run on.
+            return None
+        index = cache.index
+        if index is None:
+            cache.ensure_loaded(settings.get('backend', 'psql'), float(settings.get('schema_refresh_interval', 3600)), schema_loaded)
+            return None
+
+        line = view.substr(Region(view.line(locations[0]).begin(), locations[0]))
+        match = self.__qualifier.search(line)
+        qualifier = match.group(1).strip('"') if match else None
+        completions = []
+        for name, kind, detail in index.complete(prefix, qualifier):
+            contents = name if self.__plain_name.match(name) else '"' + name.replace('"', '""') + '"'
+            annotation = kind + ('(' + detail + ')' if kind == 'function' else ' ' + detail if detail else '')
+            completions.append([name + '\t' + annotation, contents.replace('$', '\\$')])
+        return completions
+
+    def on_revert(self, view):
+        PsqlStatementIndexes.discard(view.buffer_id())
+
+    def on_close(self, view):
+        PsqlStatementIndexes.discard(view.buffer_id())
+
+    def on_text_changed(self, buffer_id, changes):
+        index = PsqlStatementIndexes.get(buffer_id)
+        if index is not None:
+            for change in changes:
+                index.replaced(change.a.pt, change.b.pt - change.a.pt, len(change.str))
+
+events = PsqlEvents()
+
+
+class PsqlSettings(MutableMapping):
+    __settings_name = 'PostgreSQL Developer Tools.sublime-settings'
+    __settings = None
+    __windows = {}
+
+    __postgres_variables = { 
+        'host':'PGHOST', 'hostaddr':'PGHOSTADDR', 'port':'PGPORT', 
+        'database':'PGDATABASE', 'user':'PGUSER', 'password':'PGPASSWORD',
+        'passfile':'PGPASSFILE', 'service':'PGSERVICE', 'servicefile':'PGSERVICEFILE',
+        'kerberos_realm':'PGREALM', 'options':'PGOPTIONS', 'application_name':'PGAPPNAME',
+        'sslmode':'PGSSLMODE', 'requiressl':'PGREQUIRESSL', 'sslcompression':'PGSSLCOMPRESSION',
+        'sslcert':'PGSSLCERT', 'sslkey':'PGSSLKEY', 'sslrootcert':'PGSSLROOTCERT', 
+        'sslcrl':'PGSSLCRL', 'requirepeer':'PGREQUIREPEER', 'krbsrvname':'PGKRBSRVNAME',
+        'gsslib':'PGGSSLIB', 'connect_timeout':'PGCONNECT_TIMEOUT',
+        'client_encoding':'PGCLIENTENCODING', 'datestyle':'PGDATESTYLE',
+        'timezone':'PGTZ', 'geqo':'PGGEQO', 'sysconfdir':'PGSYSCONFDIR',
+        'localedir':'PGLOCALEDIR', 'psql_path': '', 'prompt_for_password': '',
+        'warn_on_empty_password':'', 'output_to_newfile':'', 'files': '',
+        'session_pool': '', 'session_idle_timeout': '', 'max_concurrent_queries': '',
+        'max_connections_per_profile': '', 'execution_order': '', 'output_display_limit': '', 'backend': '',
+        'query_timeout': '', 'query_timeout_on_server': '', 'execution_log': '', 'execution_log_size': '',
+        'result_cache': '', 'result_cache_ttl': '', 'result_cache_size': '',
+        'schema_completions': '', 'schema_refresh_interval': '',
+        'result_format': '', 'grid_page_size': '', 'grid_column_width': '', 'import_parallelism': '',
+        'connections': '', 'fanout_concurrency': '', 'file_batch': '', 'file_batch_transaction': '',
+        'file_batch_on_error_stop': '', 'file_batch_savepoints': '', 'stream_input_size': '',
+        'explain_history': '', 'explain_hotspots': '',
+        'loadtest_clients': '', 'loadtest_duration': '', 'loadtest_iterations': '',
+        'query_history': '', 'query_history_max_age': '', 'query_history_max_size': '', 'query_history_preview': '',
+        'script_progress': '', 'script_slowest': ''
+    }
+
+    __generation = 0
+
+    @property
+    def postgres_variables(self):
+        return self.__postgres_variables.copy()
+
+    def __new__(cls, window=None, *args, **kwargs):
+        if window is not None:
+            if window.id() not in cls.__windows:
+                cls.__windows[window.id()] = MutableMapping.__new__(cls, *args, **kwargs)
+            return cls.__windows[window.id()]
+        return MutableMapping.__new__(cls, *args, **kwargs)
+
+    def __init__(self, *args, **kwargs):
+        kwargs.pop('window', None)
+        # Window settings are shared, so only the first construction starts them empty.
+        if not hasattr(self, '_PsqlSettings__defaults'):
+            self.__defaults = {}
+            self.__userspecified = {}
+            self.__snapshots = {}
+            self.__reload()
+        self.update(dict(*args, **kwargs))
+
+
+    @classmethod
+    def window_ids(cls):
+        return list(cls.__windows)
+
+    @classmethod
+    def window_closed(cls, window_id):
+        cls.__windows.pop(window_id, None)
+
+    @classmethod
+    def counters(cls):
+        return [('window settings', len(cls.__windows))]
+
+    @classmethod
+    def __get_settings(cls):
+        if cls.__settings is None:
+            cls.__settings = load_settings(cls.__settings_name)
+            cls.__settings.clear_on_change('reload')
+            cls.__settings.add_on_change('reload', cls.__reload_all_windows)
+        return cls.__settings
+
+    @classmethod
+    def __reload_all_windows(cls):
+        cls.__generation += 1
+        for window in cls.__windows:
+            cls.__windows[window].__reload()
+
+
+    @classmethod
+    def __try_validate_name(cls, name):
+        return name in cls.__postgres_variables
+
+    @classmethod
+    def __validate_name(cls, name):
+        if not cls.__try_validate_name(name):
+            raise ValueError('Argument ' + name + ' not recognized.')
+
+    def __getitem__(self, name):
+        self.__validate_name(name)
+        return self.__get(self.__keytransform__(name))
+
+    def __setitem__(self, name, value):
+        self.__validate_name(name)
+        if self.__defaults.get(self.__keytransform__(name)) != value:
+            self.__defaults[self.__keytransform__(name)] = value
+            self.__invalidate()
+
+    def __delitem__(self, name):
+        self.__validate_name(name)
+        del self.__defaults[self.__keytransform__(name)]
+        self.__invalidate()
+
+    def __iter__(self):
+        return iter(self.__defaults)
+
+    def __len__(self):
+        return len(self.__defaults)
+
+    def __contains__(self, name):
+        self.__validate_name(name)
+        if self.__keytransform__(name) in self.__defaults:
+            return True
+        else:
+            value = self.__get_settings().get('default_'+name)
+            if value:
+                return True
+        return False
+
+    def __keytransform__(self, name):
+        return name
+
+    def __get(self, name):
+        if self.__keytransform__(name) not in self.__defaults:
+            value = self.__get_settings().get('default_'+name)
+            if value:
+                self.__defaults[self.__keytransform__(name)] = value
+        return self.__defaults[self.__keytransform__(name)]
+
+    def __reload(self):
+        self.__defaults = self.__userspecified.copy()
+        self.__invalidate()
+
+    def __invalidate(self):
+        self.__snapshots = {}
+
+    def snapshot(self, encoding):
+        snapshot = self.__snapshots.get(encoding)
+        if snapshot is not None and snapshot[0] == self.__generation:
+            return snapshot[1]
+
+        variables = {}
+        for name, variable in self.__postgres_variables.items():
+            if variable and name in self and self[name]:
+                variables[variable] = str(self[name])
+        if 'PGCLIENTENCODING' not in variables and 'PGCLIENTENCODING' not in environ:
+            variables['PGCLIENTENCODING'] = encoding
+        query_timeout = float(self.get('query_timeout', 0) or 0)
+        if query_timeout > 0 and is_true(self.get('query_timeout_on_server', False)):
+            options = variables.get('PGOPTIONS', environ.get('PGOPTIONS', ''))
+            variables['PGOPTIONS'] = (options + ' ' if options else '') + '-c statement_timeout=' + str(int(query_timeout * 1000))
+        argv = [self['psql_path'] if 'psql_path' in self else '/usr/bin/psql', '--no-password']
+
+        profile = PsqlConnectionProfile(argv, variables)
+        self.__snapshots[encoding] = (self.__generation, profile)
+        return profile
+
+    def save(self):
+        updates = False
+        for name in self.__userspecified:
+            updates = True
+            self.__get_settings().set('default_' + name, self.__userspecified[name])
+        if updates:
+            save_settings(self.__settings_name)
+            self.clear()
+
+    def clear(self):
+        self.__userspecified = {}
+        self.__reload()
+
+    def has_user_specified(self):
+        return len(self.__userspecified) > 0
+
+    def set_user_specified(self, name, value):
+        self.__validate_name(name)
+        self.__userspecified[name] = value
+        self.__defaults[name] = value
+        self.__invalidate()
+
+    def unset_user_specified(self, name):
+        self.__validate_name(name)
+        if name in self.__userspecified:
+            del self.__userspecified[name]
+            self.__defaults.pop(name, None)
+            self.__invalidate()
+
+window_registry.register('settings', PsqlSettings)
+window_registry.register('running queries', PsqlInFlight)
+window_registry.register('output', PsqlOutputDispatcher)
+window_registry.register('result grid', PsqlGridState)
@@ -0,0 +1,315 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from threading import Thread, Lock, Timer
+from subprocess import Popen, PIPE, STDOUT
+from time import time
+from uuid import uuid4
+from io import open as open_fd
+from os import close as close_fd
+from .cancel import interrupt_process, kill_process
+
+try:
+    from pty import openpty
+    from tty import setraw
+except ImportError:
+    openpty = None
+
+def is_pool_supported():
+    return openpty is not None
+
+def execute_once(cmd, env, sink, query=None, file=None, chunk_size=65536, cancellation=None, metrics=None, errors=None, terminal=False):
+    # errors, when given, receives stderr separately instead of it being mixed into the output.
+    # With terminal, psql writes to a pty (see PsqlSession) so that its output is line buffered
+    # and stays in order with the errors.
+    terminal = terminal and errors is None and openpty is not None
+    inputfile = open(file, 'rb') if file is not None else None
+    try:
+        start = time()
+        if terminal:
+            master, slave = openpty()
+            setraw(slave)
+            try:
+                process = Popen(list(cmd) + ['--pset', 'pager=off'], stdin=inputfile or PIPE, stdout=slave, stderr=slave, env=env)
+            except BaseException:
+                close_fd(master)
+                raise
+            finally:
+                close_fd(slave)
+            output = open_fd(master, 'rb')
+        else:
+            process = Popen(cmd, stdin=inputfile or PIPE, stdout=PIPE, stderr=STDOUT if errors is None else PIPE, env=env)
+            output = process.stdout
+        if metrics is not None:
+            metrics.spawn = time() - start
+            metrics.input_sent()
+        if cancellation is not None:
+            cancellation.attach(lambda: interrupt_process(process), lambda: kill_process(process))
+        if inputfile is None:
+            writer = Thread(target=write_and_close, args=(process.stdin, query or b''))
+            writer.daemon = True
+            writer.start()
+        if errors is not None:
+            reader = Thread(target=read_and_close, args=(process.stderr, errors, chunk_size))
+            reader.daemon = True
+            reader.start()
+        for chunk in iter(lambda: read_output(output, chunk_size), b''):
+            sink(chunk)
+        output.close()
+        if errors is not None:
+            reader.join()
+        return process.wait()
+    finally:
+        if cancellation is not None:
+            cancellation.detach()
+        if inputfile is not None:
+            inputfile.close()
+
+def read_output(stream, chunk_size):
+    try:
+        return stream.read1(chunk_size)
+    except OSError:
+        # Reading a pty whose child has exited fails with EIO instead of EOF.
+        return b''
+
+def write_and_close(stream, data):
+    # data is bytes or an iterable of bytes, which is written as it is produced.
+    try:
+        for chunk in [data] if isinstance(data, bytes) else data:
+            stream.write(chunk)
+    except (OSError, ValueError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except (OSError, ValueError):
+            pass
+
+def marker_prefix_length(data, marker):
+    # Length of the longest end of data that could be the start of marker, which
+    # has to be held back until more output arrives.
+    for size in range(min(len(marker) - 1, len(data)), 0, -1):
+        if data.endswith(marker[:size]):
+            return size
+    return 0
+
+def read_and_close(stream, sink, chunk_size):
+    try:
+        for chunk in iter(lambda: stream.read1(chunk_size), b''):
+            sink(chunk)
+        stream.close()
+    except (OSError, ValueError):
+        pass
+
+class PsqlSession(object):
+    __chunk_size = 65536
+    # Drops SET values, temporary tables, prepared statements, listeners and advisory locks.
+    __reset = b'DISCARD ALL;'
+
+    def __init__(self, cmd, env):
+        # psql fully buffers stdout when it is a pipe, so the end of result marker
+        # would sit in its buffer while it waits for more input. A raw pty keeps
+        # stdout line buffered without making psql interactive (stdin stays a pipe).
+        master, slave = openpty()
+        setraw(slave)
+        try:
+            self.process = Popen(cmd + ['--pset', 'pager=off'], stdin=PIPE, stdout=slave, stderr=slave, env=env)
+        except BaseException:
+            close_fd(master)
+            raise
+        finally:
+            close_fd(slave)
+        self.stdout = open_fd(master, 'rb')
+        self.broken = False
+        self.idle_since = time()
+
+    def is_alive(self):
+        return not self.broken and self.process.poll() is None
+
+    def __write_input(self, query, file, marker):
+        try:
+            if file is not None:
+                with open(file, 'rb') as inputfile:
+                    for chunk in iter(lambda: inputfile.read(self.__chunk_size), b''):
+                        self.process.stdin.write(chunk)
+            elif query is not None:
+                self.process.stdin.write(query)
+            # Terminate a trailing statement without a semicolon, the way psql
+            # does at end of input, then ask for the end of result marker. The
+            # session is reset for the next query, with a second marker after it.
+            self.process.stdin.write(b'\n;\n\\echo ' + marker + b'\n' + self.__reset + b'\n\\echo ' + marker + b'\n')
+            self.process.stdin.flush()
+        except (OSError, ValueError):
+            self.broken = True
+
+    def execute(self, sink, query=None, file=None, cancellation=None, metrics=None):
+        if cancellation is not None:
+            # An interrupted psql exits, so a cancelled session is never reused.
+            cancellation.attach(lambda: interrupt_process(self.process), lambda: kill_process(self.process))
+        try:
+            return self.__execute(sink, query, file, metrics)
+        finally:
+            if cancellation is not None:
+                cancellation.detach()
+
+    def __execute(self, sink, query, file, metrics):
+        marker = ('__psql_session_' + uuid4().hex + '__').encode('ascii')
+        writer = Thread(target=self.__write_input, args=(query, file, marker))
+        writer.daemon = True
+        writer.start()
+
+        # The marker is only recognized on a line of its own, so the output is
+        # treated as starting after a newline that is never passed to the sink.
+        marker_line = b'\n' + marker + b'\n'
+        rest = self.__read_until(sink, marker_line, b'\n', 1)
+        if metrics is not None:
+            metrics.result_complete()
+        writer.join()
+        if self.broken:
+            return self.process.wait()
+
+        # DISCARD ALL fails inside a transaction, open or aborted, which must not be
+        # handed to the next query; such a session is closed when it is released.
+        reset = []
+        self.__read_until(reset.append, marker_line, rest, 1)
+        if b''.join(reset).strip() not in (b'', b'DISCARD ALL'):
+            self.broken = True
+        return 0
+
+    def __read_until(self, sink, marker_line, data, skip):
+        # Passes the output before marker_line to sink and returns what follows it,
+        # holding back an end of data that could be the start of the marker.
+        while True:
+            index = data.find(marker_line)
+            if index >= 0:
+                if index + 1 > skip:
+                    sink(data[skip:index + 1])
+                return data[index + len(marker_line) - 1:]
+            cut = len(data) - marker_prefix_length(data, marker_line)
+            if cut > skip:
+                sink(data[skip:cut])
+            data = data[cut:]
+            skip = max(0, skip - cut)
+            chunk = self.__read()
+            if not chunk:
+                # psql exited before reaching the marker (\q, ON_ERROR_STOP, lost connection).
+                self.broken = True
+                if len(data) > skip:
+                    sink(data[skip:])
+                return b''
+            data += chunk
+
+    def __read(self):
+        return read_output(self.stdout, self.__chunk_size)
+
+    def close(self):
+        self.broken = True
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.close()
+                try:
+                    self.process.wait(timeout=1)
+                except Exception:
+                    self.process.kill()
+                    self.process.wait()
+        except (OSError, ValueError):
+            pass
+        for stream in (self.process.stdin, self.stdout):
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+
+class PsqlSessionPool(object):
+    def __init__(self, idle_timeout=300):
+        self.idle_timeout = idle_timeout
+        self.__idle = {}
+        self.__lock = Lock()
+        self.__timer = None
+
+    def idle_count(self):
+        with self.__lock:
+            return sum(len(sessions) for sessions in self.__idle.values())
+
+    def acquire(self, key, factory):
+        expired = []
+        session = None
+        with self.__lock:
+            sessions = self.__idle.get(key, [])
+            while sessions:
+                candidate = sessions.pop()
+                if candidate.is_alive() and time() - candidate.idle_since < self.idle_timeout:
+                    session = candidate
+                    break
+                expired.append(candidate)
+            if not sessions:
+                self.__idle.pop(key, None)
+        for candidate in expired:
+            candidate.close()
+        if session is None:
+            session = factory()
+        return session
+
+    def release(self, key, session):
+        if not session.is_alive():
+            session.close()
+            return
+        session.idle_since = time()
+        with self.__lock:
+            self.__idle.setdefault(key, []).append(session)
+            self.__schedule_sweep()
+
+    def __schedule_sweep(self):
+        if self.__timer is None:
+            self.__timer = Timer(self.idle_timeout, self.sweep)
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    def sweep(self):
+        expired = []
+        with self.__lock:
+            self.__timer = None
+            now = time()
+            for key in list(self.__idle):
+                sessions = self.__idle[key]
+                for session in sessions:
+                    if not session.is_alive() or now - session.idle_since >= self.idle_timeout:
+                        expired.append(session)
+                sessions[:] = [session for session in sessions if session not in expired]
+                if not sessions:
+                    del self.__idle[key]
+            if self.__idle:
+                self.__schedule_sweep()
+        for session in expired:
+            session.close()
+
+    def close_all(self):
+        with self.__lock:
+            sessions = [session for key in self.__idle for session in self.__idle[key]]
+            self.__idle = {}
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        for session in sessions:
+            session.close()
+
+session_pool = PsqlSessionPool()
@@ -0,0 +1,55 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from os import environ
+
+class PsqlConnectionProfile(object):
+    __slots__ = ('argv', 'variables', 'env', 'key')
+
+    def __init__(self, argv, variables):
+        self.argv = tuple(argv)
+        self.variables = tuple(sorted(variables.items()))
+        self.env = environ.copy()
+        self.env.update(variables)
+        self.key = (self.argv, self.variables)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError('PsqlConnectionProfile is immutable.')
+        object.__setattr__(self, name, value)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, PsqlConnectionProfile) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, variable, default=None):
+        return dict(self.variables).get(variable, default)
+
+    def describe(self):
+        variables = dict(self.variables)
+        target = variables.get('PGSERVICE') or (variables.get('PGHOST') or variables.get('PGHOSTADDR') or 'local') + ':' + variables.get('PGPORT', '5432')
+        return variables.get('PGUSER', '') + '@' + target + '/' + variables.get('PGDATABASE', '')
@@ -0,0 +1,144 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from heapq import heappush, heappushpop
+from re import compile as re_compile
+from time import time
+
+class PsqlScriptProgress(object):
+    # Follows the output of a script as it arrives: every command tag, "(n rows)"
+    # footer or error ends a statement, and a "Time: n ms" line of \timing gives
+    # the duration of the statement before it. Without \timing a statement took
+    # the time since the previous one ended.
+    progress_interval = 0.5
+    __tag = re_compile(r'^(?:INSERT \d+ (\d+)|(?:UPDATE|DELETE|COPY|SELECT|MERGE|MOVE|FETCH) (\d+)|'
+        r'(?:CREATE|ALTER|DROP|BEGIN|COMMIT|ROLLBACK|START|SAVEPOINT|RELEASE|PREPARE|EXECUTE|DEALLOCATE|DISCARD|'
+        r'SET|RESET|TRUNCATE|GRANT|REVOKE|VACUUM|ANALYZE|CLUSTER|REINDEX|REFRESH|COMMENT|LOCK|DO|CALL|'
+        r'DECLARE|CLOSE|CHECKPOINT|LISTEN|NOTIFY|UNLISTEN|IMPORT|SECURITY|LOAD)(?: [A-Z]+)*)$')
+    __footer = re_compile(r'^\((\d+) rows?\)$')
+    __error = re_compile(r'^(?:psql:[^\n]*?: )?(?:ERROR|FATAL):')
+    __timing = re_compile(r'^Time: (\d+(?:\.\d+)?) ms')
+
+    def __init__(self, statements=None, slowest=5, on_progress=None):
+        self.statements = statements
+        self.slowest_count = slowest
+        self.on_progress = on_progress
+        self.completed = 0
+        self.failed = 0
+        self.rows = 0
+        self.last = None
+        self.start_time = time()
+        self.end_time = None
+        self.__ended = self.start_time
+        self.__line = ''
+        self.__pending = None
+        self.__slowest = []
+        self.__reported = 0
+
+    def start(self):
+        self.start_time = self.__ended = time()
+
+    @property
+    def elapsed(self):
+        return (self.end_time or time()) - self.start_time
+
+    @property
+    def rate(self):
+        return self.rows / max(self.elapsed, 0.001)
+
+    def feed(self, text):
+        lines = (self.__line + text).split('\n')
+        self.__line = lines.pop()
+        for line in lines:
+            self.__parse(line.rstrip('\r'))
+        now = time()
+        if self.on_progress is not None and self.completed and now - self.__reported >= self.progress_interval:
+            self.__reported = now
+            self.on_progress(self)
+
+    def close(self):
+        if self.__line:
+            self.__parse(self.__line)
+            self.__line = ''
+        self.__finish_pending()
+        self.end_time = time()
+
+    def __parse(self, line):
+        match = self.__tag.match(line)
+        if match:
+            self.__statement_done(line, int(match.group(1) or match.group(2) or 0))
+            return
+        match = self.__footer.match(line)
+        if match:
+            self.__statement_done(line, int(match.group(1)))
+            return
+        if self.__error.match(line):
+            self.failed += 1
+            self.__statement_done(line[:80], 0)
+            return
+        match = self.__timing.match(line)
+        if match and self.__pending is not None:
+            self.__pending[0] = float(match.group(1)) / 1000
+            self.last = self.__pending
+
+    def __statement_done(self, tag, rows):
+        now = time()
+        self.__finish_pending()
+        self.__pending = [now - self.__ended, self.completed, tag]
+        self.last = self.__pending
+        self.__ended = now
+        self.completed += 1
+        self.rows += rows
+
+    def __finish_pending(self):
+        # Only the slowest statements are kept, however long the script.
+        if self.__pending is None or self.slowest_count <= 0:
+            return
+        entry = tuple(self.__pending)
+        if len(self.__slowest) < self.slowest_count:
+            heappush(self.__slowest, entry)
+        else:
+            heappushpop(self.__slowest, entry)
+        self.__pending = None
+
+    def statement(self, index):
+        if self.statements is not None and index < len(self.statements):
+            return ' '.join(self.statements[index].split())[:80]
+        return ''
+
+    def slowest(self):
+        return sorted(self.__slowest, reverse=True)
+
+    def status(self):
+        minutes, seconds = divmod(int(self.elapsed), 60)
+        status = (str(self.completed) + (' statement' if self.completed == 1 else ' statements') +
+            (' (' + str(self.failed) + ' failed)' if self.failed else '') + ', ' + str(self.rows) + ' rows (' + str(int(self.rate)) + '/s), ' +
+            '%d:%02d' % (minutes, seconds) + ' elapsed')
+        if self.last is not None:
+            status += ', last ' + self.last[2] + ' in ' + str(int(self.last[0] * 1000)) + ' ms'
+        return status
+
+    def report(self):
+        lines = ['-- ' + str(self.completed) + ' statements' + (' (' + str(self.failed) + ' failed)' if self.failed else '') + ', ' + str(self.rows) +
+            ' rows in ' + '%.1f' % self.elapsed + ' s (' + str(int(self.rate)) + ' rows/s), slowest: --']
+        for duration, index, tag in self.slowest():
+            lines.append('%10.3f ms  #%-6d %-20s %s' % (duration * 1000, index + 1, tag, self.statement(index)))
+        return '\n'.join(line.rstrip() for line in lines) + '\n'
@@ -0,0 +1,163 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from threading import Thread, Lock, Event
+from collections import deque
+from time import time
+
+class PsqlJob(object):
+    def __init__(self, key, target, connection_limit=0):
+        self.key = key
+        self.target = target
+        self.connection_limit = connection_limit
+        self.callback = None
+        self.result = None
+        self.start_time = None
+        self.end_time = None
+        self.finished = Event()
+
+    def run(self):
+        self.start_time = time()
+        try:
+            self.result = self.target()
+        finally:
+            self.end_time = time()
+            self.finished.set()
+            if self.callback is not None:
+                self.callback(self)
+
+class PsqlScheduler(object):
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.__queue = deque()
+        self.__running = {}
+        self.__workers = 0
+        self.__busy = 0
+        self.__lock = Lock()
+
+    def submit(self, job):
+        with self.__lock:
+            self.__queue.append(job)
+            while self.__workers < max(1, self.max_workers) and self.__workers - self.__busy < len(self.__queue):
+                self.__workers += 1
+                worker = Thread(target=self.__work)
+                worker.daemon = True
+                worker.start()
+        return job
+
+    def __next_job(self):
+        for index, job in enumerate(self.__queue):
+            if job.connection_limit <= 0 or self.__running.get(job.key, 0) < job.connection_limit:
+                del self.__queue[index]
+                self.__busy += 1
+                self.__running[job.key] = self.__running.get(job.key, 0) + 1
+                return job
+        return None
+
+    def __work(self):
+        while True:
+            with self.__lock:
+                job = self.__next_job()
+                if job is None:
+                    self.__workers -= 1
+                    return
+            try:
+                job.run()
+            finally:
+                with self.__lock:
+                    self.__busy -= 1
+                    self.__running[job.key] -= 1
+                    if not self.__running[job.key]:
+                        del self.__running[job.key]
+
+class PsqlBatch(object):
+    orders = ('parallel', 'sequential', 'ordered-output')
+
+    def __init__(self, scheduler, order='parallel', on_complete=None):
+        if order not in self.orders:
+            raise ValueError('Execution order ' + order + ' not recognized.')
+        self.scheduler = scheduler
+        self.order = order
+        self.on_complete = on_complete
+        self.completed = 0
+        self.jobs = []
+        self.__callbacks = {}
+        self.__immediate = set()
+        self.__next_submit = 0
+        self.__next_deliver = 0
+        self.__lock = Lock()
+
+    def add(self, key, target, callback, connection_limit=0, immediate=False):
+        # Immediate jobs are cheap (e.g. cached results) and run in the thread calling start.
+        job = PsqlJob(key, target, connection_limit)
+        job.callback = self.__job_done
+        self.__callbacks[job] = callback
+        self.jobs.append(job)
+        if immediate:
+            self.__immediate.add(job)
+        return job
+
+    def start(self):
+        for job in self.jobs:
+            if job in self.__immediate:
+                job.run()
+        if self.order == 'sequential':
+            self.__submit_next()
+        else:
+            for job in self.jobs:
+                if job not in self.__immediate:
+                    self.scheduler.submit(job)
+
+    def __submit_next(self):
+        with self.__lock:
+            while self.__next_submit < len(self.jobs) and self.jobs[self.__next_submit] in self.__immediate:
+                self.__next_submit += 1
+            if self.__next_submit >= len(self.jobs):
+                return
+            job = self.jobs[self.__next_submit]
+            self.__next_submit += 1
+        self.scheduler.submit(job)
+
+    def __job_done(self, job):
+        with self.__lock:
+            self.completed += 1
+            completed = self.completed
+        if self.on_complete is not None:
+            self.on_complete(job, completed, len(self.jobs))
+
+        if self.order == 'ordered-output':
+            deliver = []
+            with self.__lock:
+                while self.__next_deliver < len(self.jobs) and self.jobs[self.__next_deliver].finished.is_set():
+                    deliver.append(self.jobs[self.__next_deliver])
+                    self.__next_deliver += 1
+        else:
+            deliver = [job]
+
+        for done in deliver:
+            if self.__callbacks[done] is not None:
+                self.__callbacks[done](done)
+
+        if self.order == 'sequential' and job not in self.__immediate:
+            self.__submit_next()
+
+scheduler = PsqlScheduler()
@@ -0,0 +1,275 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bisect import bisect_left
+from threading import Thread, Lock
+from time import time
+from hashlib import sha1
+from os import makedirs, replace
+from os.path import join, exists
+from re import compile as re_compile
+import gzip
+import json
+from .pool import execute_once
+from .pgwire import PgConnection
+from .cache import normalize
+from .statements import iter_statements
+
+catalog_query = '''
+select 's', n.nspname, n.nspname, '', '' from pg_catalog.pg_namespace n
+ where n.nspname !~ '^pg_(toast|temp)'{filter}
+union all
+select c.relkind::text, n.nspname, c.relname, '', '' from pg_catalog.pg_class c
+  join pg_catalog.pg_namespace n on n.oid = c.relnamespace
+ where c.relkind in ('r', 'v', 'm', 'f', 'p') and n.nspname !~ '^pg_(toast|temp)'{filter}
+union all
+select 'c', n.nspname, a.attname, c.relname, pg_catalog.format_type(a.atttypid, a.atttypmod) from pg_catalog.pg_attribute a
+  join pg_catalog.pg_class c on c.oid = a.attrelid
+  join pg_catalog.pg_namespace n on n.oid = c.relnamespace
+ where a.attnum > 0 and not a.attisdropped and c.relkind in ('r', 'v', 'm', 'f', 'p') and n.nspname !~ '^pg_(toast|temp)'{filter}
+union all
+select 'F', n.nspname, p.proname, '', pg_catalog.pg_get_function_identity_arguments(p.oid) from pg_catalog.pg_proc p
+  join pg_catalog.pg_namespace n on n.oid = p.pronamespace
+ where n.nspname !~ '^pg_(toast|temp)'{filter}
+union all
+select 't', n.nspname, t.typname, '', '' from pg_catalog.pg_type t
+  join pg_catalog.pg_namespace n on n.oid = t.typnamespace
+ where t.typtype in ('b', 'd', 'e', 'r', 'm') and t.typname !~ '^_' and n.nspname !~ '^pg_(toast|temp)'{filter};
+'''
+
+def quote_literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def catalog_sql(schemas=None):
+    condition = ''
+    if schemas:
+        condition = ' and n.nspname in (' + ', '.join(quote_literal(schema) for schema in sorted(schemas)) + ')'
+    return catalog_query.format(filter=condition)
+
+def load_catalog(profile, backend='psql', schemas=None):
+    variables = dict(profile.variables)
+    variables['PGCLIENTENCODING'] = 'UTF8'
+    sql = catalog_sql(schemas)
+    if backend == 'native':
+        connection = PgConnection.from_variables(variables).connect()
+        try:
+            return [tuple(row) for row in connection.simple_query(sql).results[0].rows]
+        finally:
+            connection.close()
+
+    env = dict(profile.env)
+    env['PGCLIENTENCODING'] = 'UTF8'
+    output = []
+    retcode = execute_once(list(profile.argv) + ['-X', '-q', '-A', '-t', '-F', '\x1f', '-R', '\x1e', '-v', 'ON_ERROR_STOP=1'],
+        env, output.append, query=sql.encode('utf-8'))
+    text = b''.join(output).decode('utf-8', 'replace')
+    if retcode != 0:
+        raise RuntimeError(text.strip() or 'psql exited with code ' + str(retcode))
+    return [tuple(record.split('\x1f')) for record in text.strip('\n').split('\x1e') if record.count('\x1f') == 4]
+
+class PsqlSchemaIndex(object):
+    kinds = {'s': 'schema', 'r': 'table', 'p': 'table', 'f': 'foreign table', 'v': 'view', 'm': 'view',
+        'c': 'column', 'F': 'function', 't': 'type'}
+
+    def __init__(self, rows):
+        self.rows = rows
+        top = {}
+        children = {}
+        for kind, schema, name, parent, detail in rows:
+            entry = (name, self.kinds.get(kind, kind), detail)
+            if kind == 'c':
+                children.setdefault(parent.lower(), {}).setdefault((name, kind), entry)
+                continue
+            top.setdefault((name, kind), entry)
+            if kind != 's':
+                children.setdefault(schema.lower(), {}).setdefault((name, kind), entry)
+        self.__top = self.__build(top.values())
+        self.__children = dict((qualifier, self.__build(entries.values())) for qualifier, entries in children.items())
+
+    @staticmethod
+    def __build(entries):
+        entries = sorted(entries, key=lambda entry: (entry[0].lower(), entry[1]))
+        return [entry[0].lower() for entry in entries], entries
+
+    def __len__(self):
+        return len(self.rows)
+
+    def complete(self, prefix, qualifier=None, limit=200):
+        index = self.__top if qualifier is None else self.__children.get(qualifier.lower())
+        if index is None:
+            return []
+        keys, entries = index
+        prefix = prefix.lower()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and end - start < limit and keys[end].startswith(prefix):
+            end += 1
+        return entries[start:end]
+
+__ddl_object = re_compile(r'^(?:create|alter|drop|comment on)\s+(?:or replace\s+)?(?:(?:global|local|temp|temporary|unlogged|'
+    r'materialized|foreign|recursive)\s+)*(table|view|function|procedure|type|domain|schema|extension|sequence|aggregate)\s+'
+    r'(?:if (?:not )?exists\s+)?("[^"]+"|[\w$]+)(\.)?')
+__ddl = re_compile(r'^(?:create|alter|drop|comment on|import foreign schema)\b')
+
+def ddl_schemas(chunks):
+    # None when nothing in the text read in chunks changes what completes, an empty set
+    # when the changed objects cannot be pinned to a schema, otherwise the schemas to reload.
+    schemas = None
+    for statement in iter_statements(chunks):
+        statement = normalize(statement)
+        if not __ddl.match(statement):
+            continue
+        match = __ddl_object.match(statement)
+        if match is None:
+            if statement.startswith(('create index', 'create unique index', 'drop index', 'alter index', 'create trigger', 'drop trigger')):
+                continue
+            return set()
+        name = match.group(2).strip('"')
+        if match.group(1) == 'schema':
+            name = name.lower() if not match.group(2).startswith('"') else name
+        elif match.group(1) == 'extension' or not match.group(3):
+            return set()
+        else:
+            name = name.lower() if not match.group(2).startswith('"') else name
+        schemas = (schemas or set()) | set([name])
+    return schemas
+
+class PsqlSchemaCache(object):
+    directory = None
+    # Seconds before a load that failed is tried again.
+    retry_interval = 60
+    __caches = {}
+    __lock = Lock()
+
+    @classmethod
+    def for_profile(cls, profile):
+        with cls.__lock:
+            cache = cls.__caches.get(profile.key)
+            if cache is None:
+                cache = cls.__caches[profile.key] = cls(profile)
+            return cache
+
+    @classmethod
+    def get(cls, profile):
+        return cls.__caches.get(profile.key)
+
+    @classmethod
+    def loaded(cls, profile):
+        cache = cls.__caches.get(profile.key)
+        return cache is not None and cache.index is not None
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.index = None
+        self.loaded_at = None
+        self.error = None
+        self.failed_at = None
+        self.loading = False
+        self.__pending = None
+        self.__lock = Lock()
+
+    @property
+    def path(self):
+        if self.directory is None:
+            return None
+        identity = self.profile.describe() + '|' + self.profile.argv[0]
+        return join(self.directory, sha1(identity.encode('utf-8')).hexdigest() + '.json.gz')
+
+    def ensure_loaded(self, backend='psql', max_age=3600, on_loaded=None):
+        # Starts warm from disk when possible and reloads in the background when that copy is old.
+        with self.__lock:
+            if self.index is not None or self.loading:
+                return
+            if self.error is not None and time() - self.failed_at < self.retry_interval:
+                return
+            self.loading = True
+        worker = Thread(target=self.__load, args=(backend, max_age, on_loaded))
+        worker.daemon = True
+        worker.start()
+
+    def refresh(self, backend='psql', schemas=None, on_loaded=None):
+        with self.__lock:
+            if self.loading:
+                # Merge into the reload that follows the running one.
+                if self.__pending is not None:
+                    previous = self.__pending[1]
+                    schemas = None if not schemas or not previous else previous | schemas
+                self.__pending = (backend, schemas, on_loaded)
+                return
+            self.loading = True
+            self.error = None
+        worker = Thread(target=self.__fetch, args=(backend, schemas, on_loaded))
+        worker.daemon = True
+        worker.start()
+
+    def __load(self, backend, max_age, on_loaded):
+        path = self.path
+        if path is not None and exists(path):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as cachefile:
+                    data = json.load(cachefile)
+                self.index = PsqlSchemaIndex([tuple(row) for row in data['rows']])
+                self.loaded_at = data['loaded']
+                if on_loaded is not None:
+                    on_loaded(self)
+                if time() - self.loaded_at < max_age:
+                    self.__finish()
+                    return
+            except (OSError, IOError, ValueError, KeyError, TypeError):
+                pass
+        self.__fetch(backend, None, on_loaded)
+
+    def __fetch(self, backend, schemas, on_loaded):
+        try:
+            rows = load_catalog(self.profile, backend, schemas)
+            if schemas and self.index is not None:
+                rows = [row for row in self.index.rows if row[1] not in schemas] + rows
+            self.index = PsqlSchemaIndex(rows)
+            self.loaded_at = time()
+            self.error = None
+            self.__save(rows)
+        except Exception as e:
+            self.error = str(e)
+            self.failed_at = time()
+        if on_loaded is not None:
+            on_loaded(self)
+        self.__finish()
+
+    def __finish(self):
+        with self.__lock:
+            pending, self.__pending = self.__pending, None
+            self.loading = pending is not None
+        if pending is not None:
+            self.__fetch(*pending)
+
+    def __save(self, rows):
+        path = self.path
+        if path is None:
+            return
+        try:
+            if not exists(self.directory):
+                makedirs(self.directory)
+            with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as cachefile:
+                json.dump({'loaded': self.loaded_at, 'rows': rows}, cachefile, separators=(',', ':'))
+            replace(path + '.tmp', path)
+        except (OSError, IOError):
+            pass
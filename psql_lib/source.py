@@ -0,0 +1,89 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from abc import ABCMeta, abstractmethod
+from codecs import getincrementaldecoder
+from os.path import basename, getsize
+from time import time
+
+class PsqlInputSource(metaclass=ABCMeta):
+    # Query input that is read a chunk at a time instead of as one string, with
+    # the position reached reported as it is sent.
+    chunk_size = 1048576
+    progress_interval = 0.5
+
+    def __init__(self, name, size, on_progress=None):
+        self.name = name
+        self.size = size
+        self.on_progress = on_progress
+        self.position = 0
+        self.line = 1
+        self.__reported = 0
+
+    @property
+    def percent(self):
+        return int(self.position * 100 / self.size) if self.size else 100
+
+    def blocks(self, encoding='UTF-8'):
+        for text in self.texts(encoding):
+            yield text.encode(encoding)
+
+    @abstractmethod
+    def texts(self, encoding='UTF-8'):
+        pass
+
+    def _advance(self, size, lines):
+        self.position += size
+        self.line += lines
+        now = time()
+        if self.on_progress is not None and (now - self.__reported >= self.progress_interval or self.position >= self.size):
+            self.__reported = now
+            self.on_progress(self)
+
+class PsqlFileSource(PsqlInputSource):
+    # The saved file, read from disk; position is in bytes.
+    def __init__(self, path, on_progress=None):
+        super().__init__(basename(path), getsize(path), on_progress)
+        self.path = path
+
+    def blocks(self, encoding='UTF-8'):
+        with open(self.path, 'rb') as inputfile:
+            for block in iter(lambda: inputfile.read(self.chunk_size), b''):
+                self._advance(len(block), block.count(b'\n'))
+                yield block
+
+    def texts(self, encoding='UTF-8'):
+        decoder = getincrementaldecoder(encoding)(errors='replace')
+        for block in self.blocks(encoding):
+            yield decoder.decode(block)
+        yield decoder.decode(b'', True)
+
+class PsqlBufferSource(PsqlInputSource):
+    # Regions of the editor buffer, read through read(begin, end); position is in characters.
+    def __init__(self, name, size, read, on_progress=None):
+        super().__init__(name, size, on_progress)
+        self.read = read
+
+    def texts(self, encoding='UTF-8'):
+        for begin in range(0, self.size, self.chunk_size):
+            text = self.read(begin, min(begin + self.chunk_size, self.size))
+            self._advance(len(text), text.count('\n'))
+            yield text
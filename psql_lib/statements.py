@@ -0,0 +1,330 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bisect import bisect_left, bisect_right
+from re import compile as re_compile, I, S
+
+TOP, QUOTE, ESCAPE_QUOTE, IDENTIFIER, DOLLAR, LINE_COMMENT, BLOCK_COMMENT, META = range(8)
+
+class PsqlStatementScanner(object):
+    lookahead = 128
+    first_chunk_size = 1024
+    chunk_size = 65536
+
+    __top = re_compile(r"""(?P<escape>(?<![\w$])[eE]')|(?P<quote>')|(?P<identifier>")|"""
+        r"""(?P<dollar>(?<![\w$])\$(?:[^\W\d]\w*)?\$)|(?P<line>--)|(?P<block>/\*)|"""
+        r"""(?P<semicolon>;)|(?P<open>\()|(?P<close>\))|(?P<meta>\\)""")
+    __escape_quote = re_compile(r"\\.|''|'")
+    __block_comment = re_compile(r'/\*|\*/')
+
+    def __init__(self):
+        self.mode = TOP
+        self.tag = None
+        self.depth = 0
+        self.parens = 0
+        self.meta_commands = 0
+
+    def is_top(self):
+        return self.mode == TOP and self.parens == 0
+
+    def scan(self, text, base=0, final=True, pos=0):
+        # Scans text from pos (text[:pos] only serves as context) and returns the
+        # statement boundaries found, as base plus their offset in text, and how far
+        # it got. Unless final, the last lookahead characters are left for the next
+        # call so that tokens such as '' or $tag$ are never split.
+        limit = len(text) if final else max(pos, len(text) - self.lookahead)
+        boundaries = []
+        while pos < limit:
+            if self.mode == TOP:
+                match = self.__top.search(text, pos)
+                if match is None or match.start() >= limit:
+                    pos = limit
+                    break
+                kind = match.lastgroup
+                pos = match.end()
+                if kind == 'semicolon':
+                    if self.parens == 0:
+                        boundaries.append(base + pos)
+                elif kind == 'open':
+                    self.parens += 1
+                elif kind == 'close':
+                    self.parens = max(0, self.parens - 1)
+                elif kind == 'quote':
+                    self.mode = QUOTE
+                elif kind == 'escape':
+                    self.mode = ESCAPE_QUOTE
+                elif kind == 'identifier':
+                    self.mode = IDENTIFIER
+                elif kind == 'dollar':
+                    self.mode = DOLLAR
+                    self.tag = match.group()
+                elif kind == 'line':
+                    self.mode = LINE_COMMENT
+                elif kind == 'block':
+                    self.mode = BLOCK_COMMENT
+                    self.depth = 1
+                else:
+                    self.mode = META
+                    self.meta_commands += 1
+
+            elif self.mode in (QUOTE, IDENTIFIER):
+                quote = "'" if self.mode == QUOTE else '"'
+                index = text.find(quote, pos)
+                if index < 0 or index >= limit:
+                    pos = limit
+                    break
+                if text.startswith(quote, index + 1):
+                    pos = index + 2
+                else:
+                    pos = index + 1
+                    self.mode = TOP
+
+            elif self.mode == ESCAPE_QUOTE:
+                match = self.__escape_quote.search(text, pos)
+                if match is None or match.start() >= limit:
+                    pos = limit
+                    break
+                pos = match.end()
+                if match.group() == "'":
+                    self.mode = TOP
+
+            elif self.mode == DOLLAR:
+                index = text.find(self.tag, pos)
+                if index < 0 or index >= limit:
+                    pos = limit
+                    break
+                pos = index + len(self.tag)
+                self.mode = TOP
+                self.tag = None
+
+            elif self.mode in (LINE_COMMENT, META):
+                index = text.find('\n', pos)
+                if index < 0 or index >= limit:
+                    pos = limit
+                    break
+                pos = index + 1
+                if self.mode == META:
+                    # A meta-command ends the statement at the end of its line.
+                    self.parens = 0
+                    boundaries.append(base + pos)
+                self.mode = TOP
+
+            else:
+                match = self.__block_comment.search(text, pos)
+                if match is None or match.start() >= limit:
+                    pos = limit
+                    break
+                pos = match.end()
+                self.depth += 1 if match.group() == '/*' else -1
+                if self.depth == 0:
+                    self.mode = TOP
+        return boundaries, pos
+
+    def scan_chunks(self, read, start, end, stop=None):
+        # Scans read(begin, end) in chunks; stop(boundary) may end the scan early.
+        boundaries = []
+        # The carried text keeps one character before the scan position for the lookbehinds.
+        carry = read(start - 1, start) if start > 0 else ''
+        base = start - len(carry)
+        resume = len(carry)
+        position = start
+        # Start small: an incremental rescan usually stops a statement or two after the edit.
+        chunk_size = self.first_chunk_size
+        while True:
+            chunk_end = min(end, position + chunk_size)
+            chunk_size = min(self.chunk_size, chunk_size * 2)
+            text = carry + read(position, chunk_end)
+            final = chunk_end >= end
+            found, consumed = self.scan(text, base, final, resume)
+            for boundary in found:
+                boundaries.append(boundary)
+                if stop is not None and stop(boundary):
+                    return boundaries, True
+            if final:
+                break
+            keep = max(0, consumed - 1)
+            carry = text[keep:]
+            base += keep
+            resume = consumed - keep
+            position = chunk_end
+        return boundaries, False
+
+def split_statements(text):
+    boundaries, stopped = PsqlStatementScanner().scan_chunks(lambda begin, end: text[begin:end], 0, len(text))
+    starts = [0] + boundaries
+    ends = boundaries + [len(text)]
+    return [text[begin:end] for begin, end in zip(starts, ends) if text[begin:end].strip()]
+
+def is_terminated(chunks):
+    # True when the text does not end inside a string, quoted identifier, dollar quote or block comment.
+    scanner = PsqlStatementScanner()
+    carry = ''
+    scanned = 0
+    for chunk in chunks:
+        text = carry + chunk
+        found, consumed = scanner.scan(text, 0, False, scanned)
+        keep = max(0, consumed - 1)
+        carry = text[keep:]
+        scanned = consumed - keep
+    scanner.scan(carry, 0, True, scanned)
+    return scanner.mode in (TOP, LINE_COMMENT, META)
+
+def iter_statements(chunks, scanner=None):
+    # Splits text arriving in chunks into statements, keeping no more than the
+    # statement being read in memory.
+    scanner = scanner or PsqlStatementScanner()
+    carry = ''
+    scanned = 0
+    for chunk in chunks:
+        text = carry + chunk
+        found, consumed = scanner.scan(text, 0, False, scanned)
+        start = 0
+        for boundary in found:
+            if text[start:boundary].strip():
+                yield text[start:boundary]
+            start = boundary
+        carry = text[start:]
+        scanned = consumed - start
+    found, consumed = scanner.scan(carry, 0, True, scanned)
+    start = 0
+    for boundary in found + [len(carry)]:
+        if carry[start:boundary].strip():
+            yield carry[start:boundary]
+        start = boundary
+
+# Statements that leave a session in a transaction or wait for input of their own.
+session_bound = re_compile(r'^(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*'
+    r'(?:begin|start\s+transaction|commit|end|rollback|abort|savepoint|release|prepare\s+transaction)\b|'
+    r'\bcopy\b.*\bfrom\s+stdin\b', I | S)
+
+def is_poolable(chunks):
+    # True when the text can run in a shared psql session: it does not end inside a string,
+    # quoted identifier, dollar quote or block comment, and has no meta-command (\c, \set,
+    # \if...), transaction control or COPY FROM STDIN that would change or stall the session.
+    scanner = PsqlStatementScanner()
+    for statement in iter_statements(chunks, scanner):
+        if scanner.meta_commands or session_bound.search(statement):
+            return False
+    return scanner.meta_commands == 0 and scanner.mode in (TOP, LINE_COMMENT)
+
+class PsqlStatementIndex(object):
+    def __init__(self, read, size):
+        self.read = read
+        self.size = size
+        self.boundaries = []
+        # [dirty_start, dirty_end) is the edited text whose statement boundaries are unknown;
+        # boundaries after it are old ones shifted to the current positions.
+        self.dirty_start = 0
+        self.dirty_end = None
+        self.last_size = 0
+        self.last_selection = None
+
+    def is_dirty(self):
+        return self.dirty_start is not None
+
+    def replaced(self, position, removed, inserted):
+        delta = inserted - removed
+        # A boundary right at a deletion no longer tells where the following text resynchronizes.
+        start = (bisect_left if removed else bisect_right)(self.boundaries, position)
+        kept = bisect_right(self.boundaries, position + removed)
+        self.boundaries[start:] = [boundary + delta for boundary in self.boundaries[kept:]]
+        if self.dirty_start is None:
+            self.dirty_start, self.dirty_end = position, position + inserted
+        else:
+            dirty_end = self.dirty_end
+            if dirty_end is not None and dirty_end > position:
+                dirty_end = max(position, dirty_end + delta)
+            self.dirty_start = min(self.dirty_start, position)
+            self.dirty_end = None if dirty_end is None else max(dirty_end, position + inserted)
+
+    def invalidate(self, position):
+        del self.boundaries[bisect_right(self.boundaries, position):]
+        self.dirty_start = position if self.dirty_start is None else min(self.dirty_start, position)
+        self.dirty_end = None
+
+    def __refresh(self):
+        if self.dirty_start is None:
+            return
+        first = bisect_right(self.boundaries, self.dirty_start)
+        start = self.boundaries[first - 1] if first > 0 else 0
+        old = self.boundaries[first:]
+        dirty_end = self.dirty_end
+
+        def resynchronized(boundary):
+            # Past the edit, reaching an old boundary means the old scan from here on is still right.
+            if dirty_end is None or boundary < dirty_end:
+                return False
+            index = bisect_left(old, boundary)
+            return index < len(old) and old[index] == boundary
+
+        found, stopped = PsqlStatementScanner().scan_chunks(self.read, start, self.size(), resynchronized)
+        if stopped:
+            resync = found[-1]
+            found.extend(old[bisect_right(old, resync):])
+        self.boundaries[first:] = found
+        self.dirty_start = None
+        self.dirty_end = None
+
+    def statement_at(self, position):
+        self.__refresh()
+        size = self.size()
+        index = bisect_right(self.boundaries, position)
+        # A cursor just after a semicolon belongs to the statement it ends.
+        if index > 0 and (self.boundaries[index - 1] == position or not self.__has_content(index)):
+            index -= 1
+        begin = self.boundaries[index - 1] if index > 0 else 0
+        end = self.boundaries[index] if index < len(self.boundaries) else size
+        return begin, end
+
+    def __has_content(self, index):
+        begin = self.boundaries[index - 1] if index > 0 else 0
+        end = self.boundaries[index] if index < len(self.boundaries) else self.size()
+        return bool(self.read(begin, end).strip())
+
+    def statements(self):
+        self.__refresh()
+        starts = [0] + self.boundaries
+        ends = self.boundaries + [self.size()]
+        return list(zip(starts, ends))
+
+class PsqlStatementIndexes(object):
+    __indexes = {}
+
+    @classmethod
+    def get(cls, key):
+        return cls.__indexes.get(key)
+
+    @classmethod
+    def get_or_create(cls, key, read, size):
+        index = cls.__indexes.get(key)
+        if index is None:
+            index = cls.__indexes[key] = PsqlStatementIndex(read, size)
+            index.last_size = size()
+        return index
+
+    @classmethod
+    def discard(cls, key):
+        cls.__indexes.pop(key, None)
+
+    @classmethod
+    def count(cls):
+        return len(cls.__indexes)
@@ -0,0 +1,103 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from codecs import getincrementaldecoder
+from tempfile import NamedTemporaryFile
+from time import time
+from .metrics import PsqlQueryMetrics
+
+class PsqlOutputStream(object):
+    def __init__(self, encoding, emit, limit=0, metrics=None):
+        self.__decoder = getincrementaldecoder(encoding)(errors='replace')
+        self.__emit = emit
+        self.metrics = metrics if metrics is not None else PsqlQueryMetrics()
+        self.on_rendered = None
+        self.captured = None
+        self.capture_limit = 0
+        self.preview = None
+        self.preview_limit = 0
+        self.on_text = None
+        self.__spill = None
+        self.limit = limit
+        self.length = 0
+        self.spilled = 0
+        self.spill_path = None
+        self.closed = False
+
+    def write(self, data):
+        self.metrics.received(len(data))
+        start = time()
+        text = self.__decoder.decode(data)
+        self.metrics.decode += time() - start
+        self.write_text(text)
+
+    def capture(self, limit):
+        # Keeps a copy of the whole output up to limit characters, for the result cache.
+        self.captured = []
+        self.capture_limit = limit
+
+    def keep_preview(self, limit):
+        # Keeps the first limit characters of the output, for the query history.
+        self.preview = []
+        self.preview_limit = limit
+
+    def write_text(self, text):
+        if not text:
+            return
+        if self.preview is not None and self.metrics.characters < self.preview_limit:
+            self.preview.append(text[:self.preview_limit - self.metrics.characters])
+        self.metrics.text(text)
+        if self.on_text is not None:
+            self.on_text(text)
+        if self.captured is not None:
+            if self.metrics.characters > self.capture_limit:
+                self.captured = None
+            else:
+                self.captured.append(text)
+        if self.__spill is None and self.limit and self.length + len(text) > self.limit:
+            # Keep whole lines in the view where possible and spill the rest.
+            room = self.limit - self.length
+            newline = text.rfind('\n', 0, room)
+            if newline >= 0:
+                room = newline + 1
+            self.__emit(self, text[:room])
+            self.length += room
+            text = text[room:]
+            self.__spill = NamedTemporaryFile('w', encoding='utf-8', prefix='psql-output-', suffix='.txt', delete=False)
+            self.spill_path = self.__spill.name
+        if self.__spill is not None:
+            self.__spill.write(text)
+            self.spilled += len(text)
+        else:
+            self.__emit(self, text)
+            self.length += len(text)
+
+    def close(self):
+        self.write_text(self.__decoder.decode(b'', True))
+        if self.__spill is not None:
+            self.__spill.close()
+        self.closed = True
+        self.__emit(self, None)
+
+    def rendered(self):
+        if self.on_rendered is not None:
+            self.on_rendered(self)
@@ -0,0 +1,90 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from sublime import set_timeout, windows
+from threading import Lock
+
+class PsqlWindowRegistry(object):
+    # Settings, running queries, output and grids are kept by window id, since
+    # Sublime Text hands out a new Window object on every call. What a window owns
+    # is released when it closes, or at the latest when a sweep no longer finds it
+    # among the open windows.
+    sweep_interval = 60000
+
+    def __init__(self):
+        self.released = 0
+        self.on_error = None
+        self.__owners = []
+        self.__running = False
+        self.__lock = Lock()
+
+    def register(self, name, owner):
+        # owner has window_ids(), window_closed(window_id) and counters(), a list of (label, value).
+        # A reloaded plugin registers its owners again, replacing the old ones.
+        self.__owners = [(known, registered) for known, registered in self.__owners if known != name]
+        self.__owners.append((name, owner))
+
+    def window_ids(self):
+        ids = set()
+        for name, owner in self.__owners:
+            ids.update(owner.window_ids())
+        return ids
+
+    def start(self):
+        with self.__lock:
+            if self.__running:
+                return
+            self.__running = True
+        set_timeout(self.__sweep, self.sweep_interval)
+
+    def stop(self):
+        with self.__lock:
+            self.__running = False
+
+    def __sweep(self):
+        with self.__lock:
+            if not self.__running:
+                return
+        self.sweep()
+        set_timeout(self.__sweep, self.sweep_interval)
+
+    def sweep(self):
+        open_windows = set(window.id() for window in windows())
+        for window_id in self.window_ids() - open_windows:
+            self.release(window_id)
+
+    def release(self, window_id):
+        if window_id in self.window_ids():
+            self.released += 1
+        for name, owner in self.__owners:
+            try:
+                owner.window_closed(window_id)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error('PostgreSQL ' + name + ' of closed window not released: ' + str(e))
+
+    def counters(self):
+        values = [('windows', len(self.window_ids())), ('windows released', self.released)]
+        for name, owner in self.__owners:
+            values.extend(owner.counters())
+        return values
+
+window_registry = PsqlWindowRegistry()
@@ -0,0 +1,54 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from unittest import TestCase, main
+
+from psql_lib.cache import is_read_only
+
+class PsqlReadOnlyTest(TestCase):
+    def test_read_only(self):
+        for sql in ('select 1', 'SELECT * FROM t WHERE a = 1;', 'values (1), (2)', 'table t', 'show work_mem',
+                'explain select 1', 'with x as (select 1) select * from x', 'select 1; select 2;',
+                "select 'insert into t' from t", 'select "update" from t', 'select 1 -- delete\n',
+                '/* drop table t; */ select 1', 'select $$ create table t $$', 'select now()'):
+            self.assertTrue(is_read_only(sql), sql)
+
+    def test_writing(self):
+        for sql in ('insert into t values (1)', 'update t set a = 1', 'delete from t', 'create table t ()',
+                'with x as (delete from t returning *) select * from x', 'select * into t2 from t',
+                'select * from t for update', 'explain analyze delete from t', 'select 1; drop table t;',
+                'select * from t for share', 'copy t to stdout', 'set work_mem = 1', 'begin'):
+            self.assertFalse(is_read_only(sql), sql)
+
+    def test_volatile_functions(self):
+        for sql in ("select nextval('s')", 'select random()', 'select pg_sleep(1)', 'select pg_advisory_lock(1)',
+                'select clock_timestamp()', 'select gen_random_uuid()'):
+            self.assertFalse(is_read_only(sql), sql)
+
+    def test_meta_commands_and_empty_text(self):
+        self.assertFalse(is_read_only('\\d t'))
+        self.assertFalse(is_read_only('select 1;\n\\gset'))
+        self.assertFalse(is_read_only(''))
+        self.assertFalse(is_read_only('-- just a comment\n'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from unittest import TestCase, main
+
+from psql_lib.export import single_statement, copy_statement
+
+class PsqlSingleStatementTest(TestCase):
+    def test_single_statement(self):
+        self.assertEqual(single_statement('select 1'), 'select 1')
+        self.assertEqual(single_statement('select 1; -- all of them\n'), 'select 1;')
+        self.assertEqual(single_statement('select 1;\n/* done */\n\n'), 'select 1;')
+        self.assertEqual(single_statement('-- header\nselect 1;'), '-- header\nselect 1;')
+
+    def test_not_a_single_statement(self):
+        self.assertIsNone(single_statement('select 1; select 2;'))
+        self.assertIsNone(single_statement('-- nothing;\n'))
+        self.assertIsNone(single_statement(''))
+
+    def test_copy_statement(self):
+        self.assertEqual(copy_statement(single_statement('select 1; -- note'), 'csv'), 'COPY (select 1\n) TO STDOUT WITH (FORMAT csv, HEADER)')
+        self.assertRaises(ValueError, copy_statement, 'select 1', 'xml')
+
+if __name__ == '__main__':
+    main()
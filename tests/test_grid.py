@@ -0,0 +1,69 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from unittest import TestCase, main
+
+from psql_lib.grid import PsqlUnalignedParser, RESULT_MARKER, NULL
+
+def table_values(table):
+    return table.columns, [[table.cell(row, column) for column in range(len(table.columns))] for row in range(table.row_count)]
+
+class PsqlUnalignedParserTest(TestCase):
+    output = (RESULT_MARKER + '\n' + 'id\x1fname\x1e1\x1fone\x1e2\x1f' + NULL + '\n' +
+        RESULT_MARKER + '\n' + 'CREATE TABLE\n' +
+        RESULT_MARKER + '\n' + 'n\x1e3\n')
+
+    def parse(self, chunks):
+        tables = []
+        parser = PsqlUnalignedParser(tables.append)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+        return [table_values(table) for table in tables]
+
+    def test_whole_output(self):
+        self.assertEqual(self.parse([self.output]), [
+            (['id', 'name'], [['1', 'one'], ['2', None]]),
+            (['CREATE TABLE'], []),
+            (['n'], [['3']])])
+
+    def test_markers_split_across_chunks(self):
+        expected = self.parse([self.output])
+        for size in range(1, len(RESULT_MARKER) + 3):
+            chunks = [self.output[index:index + size] for index in range(0, len(self.output), size)]
+            self.assertEqual(self.parse(chunks), expected, size)
+
+    def test_tables_are_reported_as_their_marker_arrives(self):
+        tables = []
+        parser = PsqlUnalignedParser(tables.append)
+        first, second = self.output.split('CREATE')
+        parser.feed(first[:-3])
+        self.assertEqual(tables, [])
+        parser.feed(first[-3:])
+        self.assertEqual([table_values(table) for table in tables], [(['id', 'name'], [['1', 'one'], ['2', None]])])
+        parser.feed('CREATE' + second)
+        self.assertEqual(len(tables), 2)
+        parser.close()
+        self.assertEqual(len(tables), 3)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from os import remove
+from tempfile import NamedTemporaryFile
+from unittest import TestCase, main
+
+from psql_lib.importer import PsqlImport, split_ranges, import_table, quote_table
+
+class PsqlDataFileTestCase(TestCase):
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            remove(path)
+
+    def write(self, data):
+        with NamedTemporaryFile(suffix='.csv', delete=False) as datafile:
+            datafile.write(data)
+        self.paths.append(datafile.name)
+        return datafile.name
+
+class PsqlSplitRangesTest(PsqlDataFileTestCase):
+    def assertRanges(self, data, ranges):
+        # Ranges cover the file without gaps and every one ends at a row boundary.
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (start, end), (next_start, next_end) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+        for start, end in ranges:
+            self.assertTrue(start < end)
+            self.assertEqual(data[start:end].count(b'"') % 2, 0, data[start:end])
+            self.assertTrue(data[start:end].endswith(b'\n') or end == len(data))
+
+    def test_plain_rows(self):
+        data = b''.join(b'%d,row %d\n' % (number, number) for number in range(1000))
+        ranges = split_ranges(self.write(data), 4)
+        self.assertEqual(len(ranges), 4)
+        self.assertRanges(data, ranges)
+
+    def test_quoted_newlines(self):
+        data = b''.join(b'%d,"line one\nline two\n""quoted""\nline four"\n' % number for number in range(500))
+        for block_size in (7, 64, 1048576):
+            ranges = split_ranges(self.write(data), 8, block_size)
+            self.assertRanges(data, ranges)
+            for start, end in ranges:
+                self.assertTrue(data[start:].startswith(b'%d,"' % (data[:start].count(b'\n') // 4)))
+
+    def test_more_parts_than_rows(self):
+        data = b'1,"a\nb"\n2,c\n'
+        ranges = split_ranges(self.write(data), 10)
+        self.assertRanges(data, ranges)
+        self.assertEqual([data[start:end] for start, end in ranges], [b'1,"a\nb"\n', b'2,c\n'])
+
+    def test_one_part(self):
+        data = b'1,a\n2,b'
+        self.assertEqual(split_ranges(self.write(data), 1), [(0, len(data))])
+
+class PsqlImportTableTest(TestCase):
+    def test_import_table(self):
+        self.assertEqual(import_table('/data/orders.csv'), 'orders')
+        self.assertEqual(import_table('/data/orders.csv.gz'), 'orders')
+        self.assertEqual(import_table('/data/my-data.tsv'), '"my-data"')
+        self.assertEqual(import_table('/data/sales.2024.csv'), '"sales.2024"')
+        self.assertEqual(quote_table(import_table('/data/sales.2024.csv')), '"sales.2024"')
+
+    def test_quote_table(self):
+        self.assertEqual(quote_table('sales.orders'), 'sales.orders')
+        self.assertEqual(quote_table('sales.my-data'), 'sales."my-data"')
+        self.assertEqual(quote_table('"odd.schema".t'), '"odd.schema".t')
+
+class PsqlImportReportTest(PsqlDataFileTestCase):
+    def test_partly_committed(self):
+        data = b''.join(b'%d,row\n' % number for number in range(100))
+        job = PsqlImport(self.write(data), 'rows', 'csv', False, 3)
+        first, second, third = job.chunks
+        first.finish(0, 'COPY 34\n')
+        second.finish(1, 'ERROR:  invalid input syntax\n')
+        report = job.report()
+        self.assertIn('committed: bytes ' + first.byte_range() + '; not committed: bytes ' + second.byte_range() + ', ' + third.byte_range(), report)
+        self.assertIn(second.describe() + ' failed after', report)
+        self.assertIn(third.describe() + ': not run', report)
+
+if __name__ == '__main__':
+    main()
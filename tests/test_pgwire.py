@@ -0,0 +1,354 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from base64 import b64encode, b64decode
+from hashlib import md5, sha256, pbkdf2_hmac
+from struct import pack, unpack
+from threading import Thread
+from unittest import TestCase, main
+import hmac
+import socket
+
+from psql_lib.pgwire import PgConnection, PgConnectionError, PgError, PgScramClient
+from psql_lib.backend import PsqlTextFormatter
+
+def message(kind, payload=b''):
+    return kind + pack('!i', len(payload) + 4) + payload
+
+def ready(status=b'I'):
+    return message(b'Z', status)
+
+def authentication(code, data=b''):
+    return message(b'R', pack('!i', code) + data)
+
+def error(code, text):
+    return message(b'E', b'SERROR\x00C' + code + b'\x00M' + text + b'\x00\x00')
+
+def startup_done():
+    return (authentication(0) + message(b'S', b'server_version\x0016.0\x00') +
+        message(b'K', pack('!ii', 4242, 99)) + ready())
+
+def row_description(*columns):
+    payload = pack('!h', len(columns))
+    for name, type_oid in columns:
+        payload += name + b'\x00' + pack('!ihihih', 0, 0, type_oid, 4, -1, 0)
+    return message(b'T', payload)
+
+def data_row(*values):
+    payload = pack('!h', len(values))
+    for value in values:
+        payload += pack('!i', -1) if value is None else pack('!i', len(value)) + value
+    return message(b'D', payload)
+
+class PgFakeServer(object):
+    # Accepts one connection and runs script(server) against it on a thread, sending
+    # in chunks of send_size bytes so that messages arrive split.
+    def __init__(self, script, send_size=None):
+        self.script = script
+        self.send_size = send_size
+        self.error = None
+        self.startup = None
+        self.ssl_requested = False
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.thread = Thread(target=self.__serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __serve(self):
+        try:
+            self.sock, address = self.listener.accept()
+            with self.sock:
+                length = unpack('!i', self.recv(4))[0]
+                payload = self.recv(length - 4)
+                if payload == pack('!i', 80877103):
+                    # SSLRequest; the fake server only speaks plain text.
+                    self.ssl_requested = True
+                    self.sock.sendall(b'N')
+                    first = self.sock.recv(4)
+                    if not first:
+                        return
+                    length = unpack('!i', first + self.recv(4 - len(first)))[0]
+                    payload = self.recv(length - 4)
+                items = payload[4:].split(b'\x00')
+                self.startup = dict(zip(items[0::2], items[1::2]))
+                self.script(self)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.listener.close()
+
+    def recv(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError('client closed the connection')
+            data += chunk
+        return data
+
+    def receive(self):
+        kind = self.recv(1)
+        length = unpack('!i', self.recv(4))[0]
+        return kind, self.recv(length - 4)
+
+    def send(self, data):
+        size = self.send_size or len(data)
+        for index in range(0, len(data), size):
+            self.sock.sendall(data[index:index + size])
+
+    def join(self):
+        self.thread.join(5)
+        if self.error is not None:
+            raise self.error
+
+class PgWireTestCase(TestCase):
+    def connect(self, script, password='secret', send_size=None, sslmode='disable'):
+        server = PgFakeServer(script, send_size)
+        connection = PgConnection(host='127.0.0.1', port=server.port, user='alice', database='db', password=password,
+            sslmode=sslmode, passfile='/nonexistent')
+        return server, connection
+
+class PgAuthenticationTest(PgWireTestCase):
+    def test_trust(self):
+        def script(server):
+            server.send(startup_done())
+            self.assertEqual(server.receive()[0], b'X')
+        server, connection = self.connect(script)
+        connection.connect()
+        connection.close()
+        server.join()
+        self.assertEqual(server.startup[b'user'], b'alice')
+        self.assertEqual(server.startup[b'database'], b'db')
+        self.assertEqual(connection.parameters, {'server_version': '16.0'})
+        self.assertEqual((connection.backend_pid, connection.backend_secret), (4242, 99))
+        self.assertEqual(connection.transaction_status, 'I')
+
+    def test_negotiate_protocol_version(self):
+        def script(server):
+            server.send(message(b'v', pack('!ii', 0, 1) + b'_pq_.unknown\x00') + startup_done())
+        server, connection = self.connect(script)
+        connection.connect()
+        connection.close()
+        server.join()
+        self.assertEqual(connection.transaction_status, 'I')
+
+    def test_ssl_prefer_falls_back_to_plain_text(self):
+        server, connection = self.connect(lambda server: server.send(startup_done()), sslmode='prefer')
+        connection.connect()
+        connection.close()
+        server.join()
+        self.assertTrue(server.ssl_requested)
+
+    def test_ssl_require(self):
+        for sslmode in ('require', 'verify-ca', 'verify-full'):
+            server, connection = self.connect(lambda server: None, sslmode=sslmode)
+            self.assertRaises(PgConnectionError, connection.connect)
+            server.join()
+
+    def test_md5(self):
+        salt = b'\x01\x02\x03\x04'
+        def script(server):
+            server.send(authentication(5, salt))
+            kind, payload = server.receive()
+            inner = md5(b'secretalice').hexdigest().encode('ascii')
+            self.assertEqual((kind, payload), (b'p', b'md5' + md5(inner + salt).hexdigest().encode('ascii') + b'\x00'))
+            server.send(startup_done())
+        server, connection = self.connect(script)
+        connection.connect()
+        connection.close()
+        server.join()
+
+    def test_cleartext(self):
+        def script(server):
+            server.send(authentication(3))
+            self.assertEqual(server.receive(), (b'p', b'secret\x00'))
+            server.send(startup_done())
+        server, connection = self.connect(script)
+        connection.connect()
+        connection.close()
+        server.join()
+
+    def test_missing_password(self):
+        def script(server):
+            server.send(authentication(5, b'salt'))
+        server, connection = self.connect(script, password=None)
+        self.assertRaises(PgConnectionError, connection.connect)
+        server.join()
+
+    def test_rejected_password(self):
+        def script(server):
+            server.send(authentication(3))
+            server.receive()
+            server.send(error(b'28P01', b'password authentication failed for user "alice"'))
+        server, connection = self.connect(script, password='wrong')
+        with self.assertRaises(PgError) as raised:
+            connection.connect()
+        self.assertEqual(raised.exception.sqlstate, '28P01')
+        server.join()
+
+    def scram_script(self, password, tamper=False):
+        salt = b'pepper and salt'
+        iterations = 64
+        salted = pbkdf2_hmac('sha256', password, salt, iterations)
+
+        def script(server):
+            server.send(authentication(10, b'SCRAM-SHA-256\x00\x00'))
+            kind, payload = server.receive()
+            self.assertEqual(kind, b'p')
+            mechanism, rest = payload.split(b'\x00', 1)
+            self.assertEqual(mechanism, b'SCRAM-SHA-256')
+            length = unpack('!i', rest[:4])[0]
+            client_first = rest[4:4 + length]
+            self.assertTrue(client_first.startswith(b'n,,'))
+            client_first_bare = client_first[3:]
+            client_nonce = dict(item.split(b'=', 1) for item in client_first_bare.split(b','))[b'r']
+            server_first = b'r=' + client_nonce + b'server,s=' + b64encode(salt) + b',i=' + str(iterations).encode('ascii')
+            server.send(authentication(11, server_first))
+
+            kind, client_final = server.receive()
+            without_proof, proof = client_final.rsplit(b',p=', 1)
+            self.assertEqual(without_proof, b'c=biws,r=' + client_nonce + b'server')
+            auth_message = client_first_bare + b',' + server_first + b',' + without_proof
+            stored_key = sha256(hmac.new(salted, b'Client Key', sha256).digest()).digest()
+            signature = hmac.new(stored_key, auth_message, sha256).digest()
+            client_key = bytes(a ^ b for a, b in zip(b64decode(proof), signature))
+            if sha256(client_key).digest() != stored_key:
+                server.send(error(b'28P01', b'password authentication failed for user "alice"'))
+                return
+            server_key = hmac.new(salted, b'Server Key', sha256).digest()
+            server_signature = hmac.new(server_key, auth_message, sha256).digest()
+            if tamper:
+                server_signature = bytes(reversed(server_signature))
+            server.send(authentication(12, b'v=' + b64encode(server_signature)))
+            server.send(startup_done())
+        return script
+
+    def test_scram(self):
+        server, connection = self.connect(self.scram_script(b'secret'))
+        connection.connect()
+        connection.close()
+        server.join()
+
+    def test_scram_wrong_password(self):
+        server, connection = self.connect(self.scram_script(b'secret'), password='wrong')
+        self.assertRaises(PgError, connection.connect)
+        server.join()
+
+    def test_scram_server_signature(self):
+        server, connection = self.connect(self.scram_script(b'secret', tamper=True))
+        self.assertRaises(PgConnectionError, connection.connect)
+        server.join()
+
+    def test_scram_client_without_native_pbkdf2(self):
+        # The pure Python fallback has to agree with hashlib.
+        from psql_lib import pgwire
+        native = pgwire.pbkdf2_hmac
+        pgwire.pbkdf2_hmac = None
+        try:
+            self.assertEqual(pgwire.pbkdf2(b'secret', b'salt', 100), pbkdf2_hmac('sha256', b'secret', b'salt', 100))
+        finally:
+            pgwire.pbkdf2_hmac = native
+
+    def test_scram_nonce_mismatch(self):
+        client = PgScramClient(b'secret')
+        client.client_first()
+        self.assertRaises(PgConnectionError, client.client_final, b'r=other,s=' + b64encode(b'salt') + b',i=1')
+
+class PgQueryTest(PgWireTestCase):
+    def query(self, responses, send_size=None, handler=None):
+        queries = []
+
+        def script(server):
+            server.send(startup_done())
+            for response in responses:
+                queries.append(server.receive())
+                server.send(response)
+            server.receive()
+        server, connection = self.connect(script, send_size=send_size)
+        connection.connect()
+        try:
+            result = connection.simple_query('select', handler)
+        finally:
+            connection.close()
+            server.join()
+        return result, queries, connection
+
+    rows = (row_description((b'id', 23), (b'name', 25), (b'ok', 16), (b'price', 1700)) +
+        data_row(b'1', b'one', b't', b'1.50') + data_row(b'2', None, b'f', b'-0.1') + message(b'C', b'SELECT 2\x00'))
+
+    def test_rows(self):
+        collector, queries, connection = self.query([self.rows + ready()])
+        self.assertEqual(queries, [(b'Q', b'select\x00')])
+        result, = collector.results
+        self.assertEqual(result.columns, ['id', 'name', 'ok', 'price'])
+        self.assertEqual(result.type_oids, [23, 25, 16, 1700])
+        self.assertEqual([tuple(str(value) for value in row) for row in result.rows], [('1', 'one', 'True', '1.50'), ('2', 'None', 'False', '-0.1')])
+        self.assertEqual(result.row_count, 2)
+        self.assertEqual(result.command_tag, 'SELECT 2')
+
+    def test_messages_split_across_reads(self):
+        expected = self.query([self.rows + ready()])[0].results[0].rows
+        for send_size in (1, 3, 7):
+            self.assertEqual(self.query([self.rows + ready()], send_size)[0].results[0].rows, expected)
+
+    def test_several_results_and_notices(self):
+        notice = message(b'N', b'SNOTICE\x00C00000\x00Mhello\x00\x00')
+        collector, queries, connection = self.query([message(b'C', b'CREATE TABLE\x00') + notice + self.rows +
+            message(b'I') + ready(b'T')])
+        self.assertEqual([result.command_tag for result in collector.results], ['CREATE TABLE', 'SELECT 2'])
+        self.assertIsNone(collector.results[0].row_count)
+        self.assertEqual([notice.format() for notice in collector.notices], ['NOTICE:  hello\n'])
+        self.assertEqual(connection.transaction_status, 'T')
+
+    def test_error_is_raised_after_ready(self):
+        with self.assertRaises(PgError) as raised:
+            self.query([error(b'42P01', b'relation "t" does not exist') + ready(b'E')])
+        self.assertEqual(raised.exception.sqlstate, '42P01')
+        self.assertEqual(raised.exception.format(), 'ERROR:  relation "t" does not exist\n')
+
+    def test_text_formatter(self):
+        written = []
+        self.query([self.rows + ready()], handler=PsqlTextFormatter(written.append))
+        self.assertEqual(''.join(written),
+            ' id | name | ok | price \n'
+            '----+------+----+-------\n'
+            '  1 | one  | t  |  1.50\n'
+            '  2 |      | f  |  -0.1\n'
+            '(2 rows)\n\n')
+
+    def test_closed_connection(self):
+        def script(server):
+            server.send(startup_done())
+            server.receive()
+            server.send(self.rows)
+        server, connection = self.connect(script)
+        connection.connect()
+        self.assertRaises(PgConnectionError, connection.simple_query, 'select')
+        self.assertFalse(connection.is_alive())
+        connection.close()
+        server.join()
+
+if __name__ == '__main__':
+    main()
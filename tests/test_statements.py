@@ -0,0 +1,159 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2016 Chris Webb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from unittest import TestCase, main
+
+from psql_lib.statements import PsqlStatementScanner, PsqlStatementIndex, split_statements, iter_statements, is_terminated
+
+class PsqlSplitStatementsTest(TestCase):
+    def test_semicolons(self):
+        self.assertEqual(split_statements('select 1; select 2;\n'), ['select 1;', ' select 2;'])
+
+    def test_trailing_statement_without_semicolon(self):
+        self.assertEqual(split_statements('select 1;\nselect 2'), ['select 1;', '\nselect 2'])
+
+    def test_blank_pieces_are_dropped(self):
+        self.assertEqual(split_statements(' ;\n\n'), [' ;'])
+        self.assertEqual(split_statements('select 1;\n  \n'), ['select 1;'])
+
+    def test_quotes(self):
+        self.assertEqual(split_statements("select ';', 'it''s;'; select \";\";"), ["select ';', 'it''s;';", ' select ";";'])
+
+    def test_escape_string(self):
+        self.assertEqual(split_statements("select E'\\';'; select 2;"), ["select E'\\';';", ' select 2;'])
+
+    def test_dollar_quotes(self):
+        body = 'create function f() returns int as $body$ select 1; $x$ ; $x$ $body$ language sql;'
+        self.assertEqual(split_statements(body + ' select 2;'), [body, ' select 2;'])
+
+    def test_dollar_sign_in_identifier(self):
+        self.assertEqual(split_statements('select a$b$c; select 2;'), ['select a$b$c;', ' select 2;'])
+
+    def test_comments(self):
+        text = 'select 1 -- not here;\n; /* nor /* here; */ ; */ select 2;'
+        self.assertEqual(split_statements(text), ['select 1 -- not here;\n;', ' /* nor /* here; */ ; */ select 2;'])
+
+    def test_parentheses(self):
+        self.assertEqual(split_statements('create rule r as on insert to t do (select 1; select 2); select 3;'),
+            ['create rule r as on insert to t do (select 1; select 2);', ' select 3;'])
+
+    def test_meta_command_ends_at_line_end(self):
+        self.assertEqual(split_statements('\\set x 1\nselect :x;'), ['\\set x 1\n', 'select :x;'])
+
+    def test_tokens_split_across_chunks(self):
+        # Every split point of the text must give the same statements.
+        text = "select $tag$ ; $tag$, ''';'''; /* ; */ select 'x';"
+        for size in range(1, len(text) + 1):
+            chunks = [text[index:index + size] for index in range(0, len(text), size)]
+            self.assertEqual(list(iter_statements(chunks)), split_statements(text), size)
+
+    def test_scan_chunks_matches_scan(self):
+        text = ''.join("select $%d$ ; $%d$, 'a;b' -- c;\n;" % (index, index) for index in range(500))
+        scanner = PsqlStatementScanner()
+        scanner.first_chunk_size = 7
+        scanner.chunk_size = 64
+        found, stopped = scanner.scan_chunks(lambda begin, end: text[begin:end], 0, len(text))
+        expected, consumed = PsqlStatementScanner().scan(text)
+        self.assertEqual(found, expected)
+        self.assertFalse(stopped)
+
+    def test_is_terminated(self):
+        self.assertTrue(is_terminated(['select 1', '; -- done']))
+        self.assertFalse(is_terminated(["select '", 'open']))
+        self.assertFalse(is_terminated(['select $a', '$ open']))
+        self.assertFalse(is_terminated(['/* open']))
+
+class PsqlStatementIndexTest(TestCase):
+    def setUp(self):
+        self.text = ''
+
+    def index(self, text):
+        self.text = text
+        return PsqlStatementIndex(lambda begin, end: self.text[max(0, begin):end], lambda: len(self.text))
+
+    def edit(self, index, position, removed, inserted):
+        self.text = self.text[:position] + inserted + self.text[position + removed:]
+        index.replaced(position, removed, len(inserted))
+
+    def expected(self):
+        return self.index(self.text).statements()
+
+    def test_statements(self):
+        index = self.index('select 1;\nselect 2;\nselect 3')
+        self.assertEqual(index.statements(), [(0, 9), (9, 19), (19, 28)])
+
+    def test_statement_at(self):
+        index = self.index('select 1;\nselect 2;\n')
+        self.assertEqual(index.statement_at(3), (0, 9))
+        # A cursor right after a semicolon belongs to the statement it ends.
+        self.assertEqual(index.statement_at(9), (0, 9))
+        self.assertEqual(index.statement_at(12), (9, 19))
+        # Trailing blank text belongs to the last statement.
+        self.assertEqual(index.statement_at(20), (9, 19))
+
+    def test_insert_semicolon(self):
+        index = self.index('select 1 select 2;\nselect 3;\n')
+        index.statements()
+        self.edit(index, 8, 0, ';')
+        self.assertEqual(index.statements(), self.expected())
+        self.assertEqual(index.statement_at(12), (9, 19))
+
+    def test_delete_semicolon(self):
+        index = self.index('select 1; select 2;\nselect 3;\n')
+        index.statements()
+        self.edit(index, 8, 1, '')
+        self.assertEqual(index.statements(), self.expected())
+
+    def test_open_quote_changes_later_boundaries(self):
+        index = self.index('select 1;\nselect 2;\nselect 3;\n')
+        index.statements()
+        self.edit(index, 7, 0, "'")
+        self.assertEqual(index.statements(), self.expected())
+        self.edit(index, 7, 1, '')
+        self.assertEqual(index.statements(), self.expected())
+
+    def test_dollar_quote_edits(self):
+        index = self.index('select 1;\nselect $$ a; b $$;\nselect 3;\n')
+        index.statements()
+        self.edit(index, 17, 2, '')
+        self.assertEqual(index.statements(), self.expected())
+        self.edit(index, 17, 0, '$$')
+        self.assertEqual(index.statements(), self.expected())
+
+    def test_multiple_edits_before_refresh(self):
+        index = self.index(''.join('select %d;\n' % number for number in range(100)))
+        index.statements()
+        self.edit(index, 500, 0, '/* ')
+        self.edit(index, 100, 3, '')
+        self.edit(index, 400, 0, ' */')
+        self.edit(index, 10, 0, "select 'a;b';")
+        self.assertEqual(index.statements(), self.expected())
+
+    def test_invalidate(self):
+        index = self.index('select 1;\nselect 2;\n')
+        index.statements()
+        self.text = 'select 1;\nselect 2; select 3;\n'
+        index.invalidate(10)
+        self.assertEqual(index.statements(), self.expected())
+
+if __name__ == '__main__':
+    main()